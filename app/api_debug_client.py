@@ -0,0 +1,87 @@
+"""
+接口调试HTTP客户端
+定时接口调试和页面手动调试共用的异步HTTP连接池
+"""
+import os
+import asyncio
+import aiohttp
+from typing import Dict, Optional
+
+
+# 接口调试HTTP连接池配置
+API_DEBUG_POOL_LIMIT = int(os.getenv("API_DEBUG_POOL_LIMIT", "200"))  # 总连接数上限
+API_DEBUG_POOL_LIMIT_PER_HOST = int(os.getenv("API_DEBUG_POOL_LIMIT_PER_HOST", "10"))  # 每个主机的连接数上限
+API_DEBUG_KEEPALIVE_TIMEOUT = float(os.getenv("API_DEBUG_KEEPALIVE_TIMEOUT", "60"))  # 空闲连接保持时间（秒）
+API_DEBUG_DNS_CACHE_TTL = int(os.getenv("API_DEBUG_DNS_CACHE_TTL", "300"))  # DNS缓存时间（秒）
+API_DEBUG_TIMEOUT = float(os.getenv("API_DEBUG_TIMEOUT", "30"))  # 单次请求总超时（秒）
+
+
+class ApiDebugResponse:
+    """接口调试响应（响应体已完整读取，连接已归还连接池）"""
+
+    def __init__(self, status_code: int, headers: Dict[str, str], text: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+
+class ApiDebugHttpClient:
+    """接口调试HTTP客户端
+
+    所有接口调试请求共用一个 aiohttp 会话，按主机限制连接数并复用keep-alive连接，
+    请求在事件循环上异步等待，慢接口不会阻塞任务输出推送和其他定时任务。
+    """
+
+    def __init__(self):
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        """创建HTTP连接池"""
+        await self.get_session()
+        print("接口调试HTTP连接池已启动")
+
+    async def close(self):
+        """释放HTTP连接池"""
+        if self.session is not None and not self.session.closed:
+            if self._session_loop is asyncio.get_running_loop():
+                await self.session.close()
+        self.session = None
+        self._session_loop = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话，在其他事件循环中调用时重新创建"""
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=API_DEBUG_POOL_LIMIT,
+                limit_per_host=API_DEBUG_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=API_DEBUG_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=API_DEBUG_DNS_CACHE_TTL
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=API_DEBUG_TIMEOUT),
+                # 与原先的 requests 一致，遵循 HTTP(S)_PROXY / NO_PROXY 环境变量
+                trust_env=True
+            )
+            self._session_loop = loop
+        return self.session
+
+    async def request(self, method: str, url: str, headers: Dict[str, str],
+                      payload: Optional[str] = None) -> ApiDebugResponse:
+        """发送请求并读取完整响应，网络错误和超时以异常抛出"""
+        session = await self.get_session()
+        data = payload.encode('utf-8') if payload else None
+        async with session.request(method.upper(), url, headers=headers, data=data) as response:
+            body = await response.read()
+            encoding = response.charset or 'utf-8'
+            try:
+                text = body.decode(encoding, errors='replace')
+            except LookupError:
+                text = body.decode('utf-8', errors='replace')
+            return ApiDebugResponse(response.status, dict(response.headers), text)
+
+
+# 全局接口调试HTTP客户端实例
+api_debug_client = ApiDebugHttpClient()
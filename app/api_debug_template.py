@@ -0,0 +1,204 @@
+"""
+接口调试变量模板
+URL、请求头和请求体中的 [timestmp]、[random.a-b]、[getenv.X] 变量在配置变更前只解析一次，
+执行时按预先拆分好的片段单次拼接，环境变量使用内存快照，不再每次查询数据库
+"""
+import re
+import time
+import random
+import threading
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import ApiDebugConfig, EnvironmentVariable
+
+# 一次匹配所有变量，替代原先逐个变量的多次 re.sub
+_VARIABLE_PATTERN = re.compile(r'\[(?:timestmp(?:\.(10|13))?|random\.([^]]+)|getenv\.([^]]+))\]')
+
+# 片段类型
+_LITERAL = 0
+_TIMESTAMP_10 = 1
+_TIMESTAMP_13 = 2
+_RANDOM = 3
+_GETENV = 4
+
+# 需要自动计算 Content-Length 的请求方法
+_BODY_METHODS = ('POST', 'PUT', 'PATCH')
+
+
+class VariableTemplate:
+    """单个文本的预编译模板"""
+
+    def __init__(self, text: Optional[str]):
+        self.text = text
+        self.segments: List[Tuple] = []
+        if not text:
+            return
+
+        position = 0
+        for match in _VARIABLE_PATTERN.finditer(text):
+            if match.start() > position:
+                self.segments.append((_LITERAL, text[position:match.start()]))
+            timestamp_digits, range_str, var_name = match.groups()
+            if var_name is not None:
+                self.segments.append((_GETENV, var_name, match.group(0)))
+            elif range_str is not None:
+                self.segments.append(self._compile_random(range_str, match.group(0)))
+            elif timestamp_digits == '10':
+                self.segments.append((_TIMESTAMP_10,))
+            else:
+                # 默认13位
+                self.segments.append((_TIMESTAMP_13,))
+            position = match.end()
+        if position < len(text):
+            self.segments.append((_LITERAL, text[position:]))
+
+        # 不含变量的文本直接返回原文
+        self.is_static = all(segment[0] == _LITERAL for segment in self.segments)
+
+    @staticmethod
+    def _compile_random(range_str: str, original: str) -> Tuple:
+        """解析随机数范围，支持格式：100-500；格式不正确时保持原样"""
+        try:
+            if '-' in range_str:
+                min_val, max_val = range_str.split('-', 1)
+                min_val = int(min_val.strip())
+                max_val = int(max_val.strip())
+                if min_val <= max_val:
+                    return (_RANDOM, min_val, max_val)
+        except (ValueError, TypeError):
+            pass
+        return (_LITERAL, original)
+
+    def render(self, env_vars: Dict[str, str], timestamp: float) -> Optional[str]:
+        """按片段拼接出替换变量后的文本，同一次请求内使用统一的时间戳"""
+        if not self.text or self.is_static:
+            return self.text
+
+        parts = []
+        for segment in self.segments:
+            kind = segment[0]
+            if kind == _LITERAL:
+                parts.append(segment[1])
+            elif kind == _GETENV:
+                # 找不到变量时保持原样
+                parts.append(env_vars.get(segment[1], segment[2]))
+            elif kind == _RANDOM:
+                parts.append(str(random.randint(segment[1], segment[2])))
+            elif kind == _TIMESTAMP_10:
+                parts.append(str(int(timestamp)))
+            else:
+                parts.append(str(int(timestamp * 1000)))
+        return ''.join(parts)
+
+
+class ApiDebugRequestTemplate:
+    """接口调试请求模板（URL、请求头、请求体）"""
+
+    def __init__(self, method: str, url: str, headers: Optional[Dict[str, str]], payload: Optional[str]):
+        self.source = (method, url, tuple((headers or {}).items()), payload)
+        self.method = method.upper()
+        self.url = VariableTemplate(url)
+        self.payload = VariableTemplate(payload) if payload else None
+        self.headers: List[Tuple[VariableTemplate, VariableTemplate]] = []
+        for key, value in (headers or {}).items():
+            # 标记为“自动计算”的Content-Length在渲染时按实际请求体计算
+            if key.lower() == 'content-length' and value == '自动计算':
+                continue
+            self.headers.append((VariableTemplate(key), VariableTemplate(value)))
+
+    def render(self, env_vars: Dict[str, str]) -> Tuple[str, Dict[str, str], Optional[str]]:
+        """渲染出 (url, headers, payload)"""
+        timestamp = time.time()
+        url = self.url.render(env_vars, timestamp)
+
+        # 先替换payload中的变量，因为Content-Length需要基于替换后的payload计算
+        payload = self.payload.render(env_vars, timestamp) if self.payload else None
+
+        headers = {
+            key.render(env_vars, timestamp): value.render(env_vars, timestamp)
+            for key, value in self.headers
+        }
+
+        # 自动设置Host头
+        try:
+            parsed_url = urlparse(url)
+            if parsed_url.netloc:
+                headers['Host'] = parsed_url.netloc
+        except ValueError:
+            pass
+
+        # 自动设置Content-Length（基于替换变量后的payload）
+        if payload and self.method in _BODY_METHODS:
+            headers['Content-Length'] = str(len(payload.encode('utf-8')))
+
+        return url, headers, payload
+
+
+class ApiDebugTemplateCache:
+    """接口调试配置的模板缓存
+
+    按配置ID缓存预编译模板，配置的方法、URL、请求头或请求体变化后自动重新编译。
+    """
+
+    def __init__(self):
+        self._templates: Dict[int, ApiDebugRequestTemplate] = {}
+        self._lock = threading.Lock()
+
+    def get(self, config: ApiDebugConfig) -> ApiDebugRequestTemplate:
+        """获取配置对应的模板"""
+        source = (config.method, config.url, tuple((config.headers or {}).items()), config.payload)
+        template = self._templates.get(config.id)
+        if template is None or template.source != source:
+            template = ApiDebugRequestTemplate(config.method, config.url, config.headers, config.payload)
+            with self._lock:
+                self._templates[config.id] = template
+        return template
+
+    def discard(self, config_id: int):
+        """配置删除后移除模板"""
+        with self._lock:
+            self._templates.pop(config_id, None)
+
+
+class EnvironmentSnapshot:
+    """环境变量快照
+
+    接口调试渲染 [getenv.X] 时使用，环境变量新增、修改、删除或数据库恢复后调用 invalidate。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._env_vars: Optional[Dict[str, str]] = None
+
+    def get(self, db: Optional[Session] = None) -> Dict[str, str]:
+        """获取环境变量字典（调用方不应修改返回值），未传入会话时自行创建"""
+        env_vars = self._env_vars
+        if env_vars is not None:
+            return env_vars
+
+        owns_session = db is None
+        if owns_session:
+            db = SessionLocal()
+        try:
+            env_vars = {record.key: record.value for record in db.query(EnvironmentVariable).all()}
+        finally:
+            if owns_session:
+                db.close()
+        with self._lock:
+            self._env_vars = env_vars
+        return env_vars
+
+    def invalidate(self):
+        """使快照失效，下次使用时重新从数据库读取"""
+        with self._lock:
+            self._env_vars = None
+
+
+# 全局接口调试模板缓存实例
+api_debug_templates = ApiDebugTemplateCache()
+
+# 全局环境变量快照实例
+env_snapshot = EnvironmentSnapshot()
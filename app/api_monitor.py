@@ -0,0 +1,364 @@
+"""
+接口监控模块
+接口调试配置开启监控模式后按秒级间隔持续探测，响应时间直方图和状态码计数保存在内存中，
+每个汇总周期写入一行 api_monitor_rollups；响应体只在失败或内容变化时保存，按内容哈希去重
+"""
+import os
+import math
+import time
+import random
+import asyncio
+import hashlib
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List
+from app.database import SessionLocal
+from app.models import ApiDebugConfig, ApiMonitorConfig, ApiMonitorRollup, ApiMonitorSample
+from app.api_debug_client import api_debug_client
+from app.api_debug_template import ApiDebugRequestTemplate, env_snapshot
+
+
+# 接口监控配置
+API_MONITOR_MIN_INTERVAL = int(os.getenv("API_MONITOR_MIN_INTERVAL", "5"))  # 最小探测间隔（秒）
+API_MONITOR_ROLLUP_INTERVAL = int(os.getenv("API_MONITOR_ROLLUP_INTERVAL", "60"))  # 汇总写入间隔（秒）
+API_MONITOR_RETENTION_DAYS = int(os.getenv("API_MONITOR_RETENTION_DAYS", "30"))  # 汇总和响应样本保留天数
+API_MONITOR_MAX_BODY_SIZE = int(os.getenv("API_MONITOR_MAX_BODY_SIZE", "65536"))  # 响应样本最多保存的字符数
+
+
+def _build_latency_bounds() -> List[int]:
+    """直方图桶上界（毫秒）：10ms以内逐毫秒，之后按10%递增到2分钟，相对误差不超过10%"""
+    bounds = list(range(1, 11))
+    bound = 10.0
+    while bound < 120000:
+        bound *= 1.1
+        if int(bound) > bounds[-1]:
+            bounds.append(int(bound))
+    return bounds
+
+
+_LATENCY_BOUNDS = _build_latency_bounds()
+
+
+class LatencyHistogram:
+    """固定桶的响应时间直方图，内存占用与探测次数无关"""
+
+    def __init__(self):
+        self.counts = [0] * (len(_LATENCY_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+
+    def record(self, latency_ms: int):
+        self.counts[bisect_left(_LATENCY_BOUNDS, latency_ms)] += 1
+        self.count += 1
+        self.total += latency_ms
+        self.min = latency_ms if self.min is None else min(self.min, latency_ms)
+        self.max = latency_ms if self.max is None else max(self.max, latency_ms)
+
+    def percentile(self, q: float) -> Optional[int]:
+        """返回q分位所在桶的上界（不超过实际最大值）"""
+        if not self.count:
+            return None
+        target = max(1, math.ceil(q * self.count))
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                bound = _LATENCY_BOUNDS[index] if index < len(_LATENCY_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+
+class MonitorWindow:
+    """一个汇总周期内的统计"""
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.histogram = LatencyHistogram()
+        self.status_counts: Dict[str, int] = {}
+        self.error_count = 0
+
+    def record(self, latency_ms: int, status_key: str, failed: bool):
+        self.histogram.record(latency_ms)
+        self.status_counts[status_key] = self.status_counts.get(status_key, 0) + 1
+        if failed:
+            self.error_count += 1
+
+    def summary(self) -> Dict[str, Any]:
+        histogram = self.histogram
+        return {
+            "bucket_start": self.started_at.isoformat(),
+            "probe_count": histogram.count,
+            "error_count": self.error_count,
+            "latency_min": histogram.min,
+            "latency_avg": int(histogram.total / histogram.count) if histogram.count else None,
+            "latency_p50": histogram.percentile(0.50),
+            "latency_p95": histogram.percentile(0.95),
+            "latency_p99": histogram.percentile(0.99),
+            "latency_max": histogram.max,
+            "status_counts": dict(self.status_counts)
+        }
+
+
+class ApiMonitor:
+    """接口监控器"""
+
+    def __init__(self):
+        self.probe_tasks: Dict[int, asyncio.Task] = {}
+        self.windows: Dict[int, MonitorWindow] = {}
+        # 配置ID -> 最近一次成功响应的内容哈希
+        self.last_hashes: Dict[int, str] = {}
+        self.rollup_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._last_purge = 0.0
+
+    async def start(self):
+        """启动所有已启用的监控"""
+        if self.rollup_task is not None:
+            return
+
+        self._stopping = False
+        self.reload_all()
+        self.rollup_task = asyncio.create_task(self._rollup_loop())
+        print(f"接口监控已启动，监控配置数: {len(self.probe_tasks)}")
+
+    async def stop(self):
+        """停止所有监控，并写入当前周期的统计"""
+        self._stopping = True
+        tasks = list(self.probe_tasks.values()) + ([self.rollup_task] if self.rollup_task else [])
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self.probe_tasks = {}
+        self.rollup_task = None
+        self._write_rollups()
+        print("接口监控已停止")
+
+    def reload_all(self):
+        """按数据库中的监控配置重新启动全部监控（数据库恢复后调用）"""
+        for config_id in list(self.probe_tasks):
+            self.remove(config_id)
+
+        db = SessionLocal()
+        try:
+            config_ids = [
+                monitor.config_id
+                for monitor in db.query(ApiMonitorConfig).filter(ApiMonitorConfig.is_active == True).all()
+            ]
+        finally:
+            db.close()
+
+        for config_id in config_ids:
+            self.reload(config_id)
+
+    def reload(self, config_id: int):
+        """接口调试配置或监控配置变更后调用，重新编译请求模板并重启探测"""
+        task = self.probe_tasks.pop(config_id, None)
+        if task is not None:
+            task.cancel()
+        if self._stopping:
+            return
+
+        db = SessionLocal()
+        try:
+            monitor = db.query(ApiMonitorConfig).filter(ApiMonitorConfig.config_id == config_id).first()
+            if not monitor or not monitor.is_active:
+                return
+            config = db.query(ApiDebugConfig).filter(ApiDebugConfig.id == config_id).first()
+            if not config:
+                return
+            template = ApiDebugRequestTemplate(config.method, config.url, config.headers, config.payload)
+            interval = max(API_MONITOR_MIN_INTERVAL, monitor.interval_seconds or API_MONITOR_MIN_INTERVAL)
+
+            if config_id not in self.last_hashes:
+                latest = db.query(ApiMonitorSample).filter(
+                    ApiMonitorSample.config_id == config_id,
+                    ApiMonitorSample.reason == "changed"
+                ).order_by(ApiMonitorSample.last_seen.desc(), ApiMonitorSample.id.desc()).first()
+                if latest:
+                    self.last_hashes[config_id] = latest.body_hash
+        finally:
+            db.close()
+
+        self.probe_tasks[config_id] = asyncio.create_task(self._probe_loop(config_id, template, interval))
+
+    def remove(self, config_id: int):
+        """停止监控并丢弃内存中的统计"""
+        task = self.probe_tasks.pop(config_id, None)
+        if task is not None:
+            task.cancel()
+        self.windows.pop(config_id, None)
+        self.last_hashes.pop(config_id, None)
+
+    def is_running(self, config_id: int) -> bool:
+        return config_id in self.probe_tasks
+
+    def get_live_summary(self, config_id: int) -> Optional[Dict[str, Any]]:
+        """当前汇总周期（尚未写入数据库）的统计"""
+        window = self.windows.get(config_id)
+        return window.summary() if window else None
+
+    async def _probe_loop(self, config_id: int, template: ApiDebugRequestTemplate, interval: int):
+        """按固定频率探测，探测耗时超过间隔时跳过错过的轮次"""
+        loop = asyncio.get_running_loop()
+        # 随机错开首次探测，避免大量监控同时发起请求
+        await asyncio.sleep(random.uniform(0, interval))
+        next_run = loop.time()
+        while not self._stopping:
+            try:
+                await self._probe(config_id, template)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"接口监控 {config_id} 探测出错: {e}")
+
+            next_run += interval
+            delay = next_run - loop.time()
+            if delay < 0:
+                next_run = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    async def _probe(self, config_id: int, template: ApiDebugRequestTemplate):
+        """执行一次探测并记录统计"""
+        url, headers, payload = template.render(env_snapshot.get())
+        started = time.monotonic()
+        try:
+            response = await api_debug_client.request(template.method, url, headers, payload)
+        except Exception as e:
+            latency_ms = int((time.monotonic() - started) * 1000)
+            self._get_window(config_id).record(latency_ms, "error", True)
+            error_message = str(e) or type(e).__name__
+            self._save_sample(config_id, "failure", None, None, None, error_message)
+            return
+
+        latency_ms = int((time.monotonic() - started) * 1000)
+        failed = response.status_code >= 400
+        self._get_window(config_id).record(latency_ms, str(response.status_code), failed)
+
+        if failed:
+            self._save_sample(config_id, "failure", response.status_code, response.headers, response.text, None)
+            return
+
+        body_hash = self._hash_response(response.status_code, response.text, None)
+        if self.last_hashes.get(config_id) != body_hash:
+            self.last_hashes[config_id] = body_hash
+            self._save_sample(config_id, "changed", response.status_code, response.headers, response.text, None, body_hash)
+
+    def _get_window(self, config_id: int) -> MonitorWindow:
+        window = self.windows.get(config_id)
+        if window is None:
+            window = self.windows[config_id] = MonitorWindow()
+        return window
+
+    @staticmethod
+    def _hash_response(status_code: Optional[int], body: Optional[str], error_message: Optional[str]) -> str:
+        content = f"{status_code}\n{body if body is not None else ''}\n{error_message or ''}"
+        return hashlib.sha256(content.encode('utf-8', errors='replace')).hexdigest()
+
+    def _save_sample(self, config_id: int, reason: str, status_code: Optional[int],
+                     response_headers: Optional[Dict[str, str]], body: Optional[str],
+                     error_message: Optional[str], body_hash: Optional[str] = None):
+        """保存响应样本，相同内容只累加出现次数"""
+        if body_hash is None:
+            body_hash = self._hash_response(status_code, body, error_message)
+        if body is not None and len(body) > API_MONITOR_MAX_BODY_SIZE:
+            body = body[:API_MONITOR_MAX_BODY_SIZE] + "...(内容过长已截断)"
+
+        db = SessionLocal()
+        try:
+            sample = db.query(ApiMonitorSample).filter(
+                ApiMonitorSample.config_id == config_id,
+                ApiMonitorSample.body_hash == body_hash
+            ).first()
+            if sample:
+                sample.occurrences = (sample.occurrences or 0) + 1
+                sample.last_seen = datetime.now()
+            else:
+                db.add(ApiMonitorSample(
+                    config_id=config_id,
+                    body_hash=body_hash,
+                    reason=reason,
+                    response_status=status_code,
+                    response_headers=response_headers,
+                    response_body=body,
+                    error_message=error_message,
+                    occurrences=1,
+                    first_seen=datetime.now(),
+                    last_seen=datetime.now()
+                ))
+            db.commit()
+        except Exception as e:
+            print(f"保存接口监控样本失败: {e}")
+        finally:
+            db.close()
+
+    async def _rollup_loop(self):
+        """定期把内存中的统计写入汇总表"""
+        while not self._stopping:
+            await asyncio.sleep(API_MONITOR_ROLLUP_INTERVAL)
+            try:
+                self._write_rollups()
+                self._purge_old_rows()
+            except Exception as e:
+                print(f"写入接口监控汇总失败: {e}")
+
+    def _write_rollups(self):
+        """结束当前汇总周期，每个有探测记录的配置写入一行"""
+        windows = self.windows
+        self.windows = {}
+        now = datetime.now()
+        rows = []
+        for config_id, window in windows.items():
+            if not window.histogram.count:
+                continue
+            summary = window.summary()
+            rows.append(ApiMonitorRollup(
+                config_id=config_id,
+                bucket_start=window.started_at,
+                bucket_seconds=max(1, int((now - window.started_at).total_seconds())),
+                probe_count=summary["probe_count"],
+                error_count=summary["error_count"],
+                latency_min=summary["latency_min"],
+                latency_avg=summary["latency_avg"],
+                latency_p50=summary["latency_p50"],
+                latency_p95=summary["latency_p95"],
+                latency_p99=summary["latency_p99"],
+                latency_max=summary["latency_max"],
+                status_counts=summary["status_counts"]
+            ))
+        if not rows:
+            return
+
+        db = SessionLocal()
+        try:
+            db.add_all(rows)
+            db.commit()
+        finally:
+            db.close()
+
+    def _purge_old_rows(self):
+        """每小时清理一次超过保留期的汇总和响应样本"""
+        now = time.monotonic()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+
+        db = SessionLocal()
+        try:
+            cutoff = datetime.now() - timedelta(days=API_MONITOR_RETENTION_DAYS)
+            db.query(ApiMonitorRollup).filter(
+                ApiMonitorRollup.bucket_start < cutoff
+            ).delete(synchronize_session=False)
+            db.query(ApiMonitorSample).filter(
+                ApiMonitorSample.last_seen < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+# 全局接口监控实例
+api_monitor = ApiMonitor()
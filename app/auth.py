@@ -2,13 +2,16 @@
 认证相关功能
 """
 import os
+import time
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Dict, Any
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends, Cookie
 from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
 from dotenv import load_dotenv
 from app.database import get_db
 from app.models import User
@@ -26,6 +29,108 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 10080
 
 security = HTTPBearer()
 
+# 已验证令牌缓存的最大条目数
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "256"))
+
+class AuthCache:
+    """认证主体缓存
+
+    系统只有一个用户和一个系统UUID，且两者极少变化。这里在内存中保存系统UUID、
+    用户记录快照以及已验证的令牌声明，使已登录请求的认证不再访问数据库。
+    修改密码、修改用户名、修改配色方案以及恢复备份时需要显式使缓存失效。
+    """
+
+    def __init__(self, token_cache_size: int = TOKEN_CACHE_MAX_SIZE):
+        self._lock = threading.Lock()
+        self._system_uuid: Optional[str] = None
+        # 用户记录快照 {username: 游离状态的User对象}
+        self._users: Dict[str, User] = {}
+        # 已验证的令牌声明 {token: {"sub": ..., "exp": ..., "system_uuid": ...}}
+        self._tokens: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._token_cache_size = token_cache_size
+
+    def get_system_uuid(self, db: Session) -> str:
+        """获取系统UUID（缓存）"""
+        system_uuid = self._system_uuid
+        if system_uuid is None:
+            from app.routers.settings import get_or_create_system_uuid
+            system_uuid = get_or_create_system_uuid(db)
+            with self._lock:
+                self._system_uuid = system_uuid
+        return system_uuid
+
+    def get_token_claims(self, token: str) -> Optional[Dict[str, Any]]:
+        """获取令牌声明，签名只在首次出现时验证"""
+        with self._lock:
+            claims = self._tokens.get(token)
+            if claims is not None:
+                if claims["exp"] is not None and claims["exp"] <= time.time():
+                    # 令牌已过期
+                    del self._tokens[token]
+                    return None
+                self._tokens.move_to_end(token)
+                return claims
+
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+
+        claims = {
+            "sub": payload.get("sub"),
+            "exp": payload.get("exp"),
+            "system_uuid": payload.get("system_uuid")
+        }
+        with self._lock:
+            self._tokens[token] = claims
+            while len(self._tokens) > self._token_cache_size:
+                self._tokens.popitem(last=False)
+        return claims
+
+    def get_user(self, db: Session, username: str) -> Optional[User]:
+        """获取用户，返回绑定到当前会话的对象，命中缓存时不查询数据库"""
+        snapshot = self._users.get(username)
+        if snapshot is not None:
+            # load=False 不会访问数据库，返回的对象仍可在当前会话中修改并提交
+            return db.merge(snapshot, load=False)
+
+        user = db.query(User).filter(User.username == username).first()
+        if user is not None:
+            snapshot = User(
+                id=user.id,
+                username=user.username,
+                password_hash=user.password_hash,
+                color_scheme=user.color_scheme,
+                created_at=user.created_at,
+                updated_at=user.updated_at
+            )
+            make_transient_to_detached(snapshot)
+            with self._lock:
+                self._users[username] = snapshot
+        return user
+
+    def invalidate_user(self):
+        """使用户缓存失效（修改密码、用户名、配色方案后调用）"""
+        with self._lock:
+            self._users.clear()
+            self._tokens.clear()
+
+    def invalidate_system_uuid(self):
+        """使系统UUID缓存失效（系统UUID重置后调用）"""
+        with self._lock:
+            self._system_uuid = None
+            self._tokens.clear()
+
+    def invalidate_all(self):
+        """使全部认证缓存失效"""
+        with self._lock:
+            self._system_uuid = None
+            self._users.clear()
+            self._tokens.clear()
+
+# 全局认证缓存实例
+auth_cache = AuthCache()
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -52,22 +157,22 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, s
 
 def verify_token(token: str, system_uuid: Optional[str] = None) -> Optional[str]:
     """验证令牌"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            return None
-
-        # 增强安全性：验证系统UUID（如果提供）
-        if system_uuid:
-            token_system_uuid = payload.get("system_uuid")
-            if token_system_uuid and token_system_uuid != system_uuid:
-                return None
+    claims = auth_cache.get_token_claims(token)
+    if claims is None:
+        return None
 
-        return username
-    except JWTError:
+    username = claims["sub"]
+    if username is None:
         return None
 
+    # 增强安全性：验证系统UUID（如果提供）
+    if system_uuid:
+        token_system_uuid = claims["system_uuid"]
+        if token_system_uuid and token_system_uuid != system_uuid:
+            return None
+
+    return username
+
 def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
     """验证用户"""
     user = db.query(User).filter(User.username == username).first()
@@ -87,9 +192,8 @@ def get_current_user(token: Optional[str] = Cookie(None, alias="access_token"),
         )
 
     # 获取系统UUID用于验证
-    from app.routers.settings import get_or_create_system_uuid
     try:
-        system_uuid = get_or_create_system_uuid(db)
+        system_uuid = auth_cache.get_system_uuid(db)
     except Exception:
         system_uuid = None
 
@@ -101,7 +205,7 @@ def get_current_user(token: Optional[str] = Cookie(None, alias="access_token"),
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = db.query(User).filter(User.username == username).first()
+    user = auth_cache.get_user(db, username)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
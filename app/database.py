@@ -39,9 +39,32 @@ async def get_async_db():
     async with AsyncSessionLocal() as session:
         yield session
 
+# 新版本为已有数据表追加的字段（create_all 不会修改已存在的表）
+# 摘要通知配置（notification_configs.config）、接口监控配置（api_monitor_configs）和
+# 订阅同步状态（subscription_sync_states）保持独立存放：它们按需存在、读写频率与主表不同，不并入主表
+ADDED_COLUMNS = {
+    "subscription_files": [("mtime_ns", "BIGINT"), ("inode", "BIGINT")],
+    "script_subscriptions": [("last_check_time", "DATETIME"), ("unchanged_count", "INTEGER DEFAULT 0"),
+                             ("task_cron_template", "VARCHAR(100)")],
+    "notification_outbox": [("payload", "JSON")],
+}
+
 def create_tables():
     """创建所有数据表"""
     Base.metadata.create_all(bind=engine)
+    upgrade_tables()
+
+def upgrade_tables():
+    """为旧版本数据库的已有表补充新增字段"""
+    with engine.begin() as conn:
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+            if not existing:
+                continue
+            for column, column_type in columns:
+                if column not in existing:
+                    conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                    print(f"✓ {table}表{column}字段添加成功")
 
 def ensure_directories():
     """确保必要的目录存在"""
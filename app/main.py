@@ -3,6 +3,7 @@ Pinchy - Python、Node.js脚本调度执行系统
 主应用入口
 """
 import os
+import json
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
 from fastapi.staticfiles import StaticFiles
@@ -13,6 +14,11 @@ from app.database import create_tables, ensure_directories, get_db
 from app.auth import init_admin_user, get_current_user
 from app.scheduler import task_scheduler
 from app.websocket_manager import websocket_manager
+from app.notification_service import notification_service
+from app.notification_outbox import notification_outbox
+from app.api_debug_client import api_debug_client
+from app.api_monitor import api_monitor
+from app.package_inventory import start_package_inventory
 from app.models import User
 from app.version import get_current_version
 
@@ -59,6 +65,21 @@ async def lifespan(app: FastAPI):
     # 从数据库加载任务
     task_scheduler.load_tasks_from_db()
     
+    # 启动通知服务HTTP连接池
+    await notification_service.start()
+    
+    # 启动通知发件箱投递协程
+    await notification_outbox.start()
+
+    # 启动接口调试HTTP连接池
+    await api_debug_client.start()
+
+    # 启动接口监控
+    await api_monitor.start()
+
+    # 后台构建已安装包清单
+    start_package_inventory()
+    
     print("Pinchy 系统启动完成!")
     
     yield
@@ -66,6 +87,11 @@ async def lifespan(app: FastAPI):
     # 关闭时执行
     print("正在关闭 Pinchy 系统...")
     task_scheduler.shutdown()
+    await notification_outbox.stop()
+    await notification_service.close()
+    await api_monitor.stop()
+    await api_debug_client.close()
+    subscriptions.subscription_sync_executor.shutdown()
     print("Pinchy 系统已关闭")
 
 # 创建FastAPI应用
@@ -100,9 +126,38 @@ async def read_root():
     else:
         return {"message": "欢迎使用 Pinchy - Python、Node.js脚本调度执行系统"}
 
+def build_debug_replay(debug_id: str) -> list:
+    """构建调试会话已产生输出的补发消息，避免订阅前的输出丢失"""
+    debug_info = task_scheduler.get_debug_cache(debug_id)
+    if not debug_info:
+        return []
+
+    messages = []
+    for formatted_line in list(debug_info.get("output", [])):
+        # 缓存中的格式为 "[stream] content"
+        stream, _, content = formatted_line.partition("] ")
+        messages.append({
+            "type": "output",
+            "content": content,
+            "stream": stream.lstrip("["),
+            "timestamp": None
+        })
+
+    status = debug_info.get("status")
+    if status in ("completed", "failed"):
+        messages.append({"type": "completed", "return_code": debug_info.get("return_code")})
+    elif status == "error":
+        messages.append({"type": "error", "content": debug_info.get("error", "")})
+
+    return [{"type": "debug_output", "debug_id": debug_id, "data": message} for message in messages]
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket端点，用于实时日志推送"""
+    """WebSocket端点，用于实时日志推送
+
+    客户端可以发送 {"action": "subscribe"/"unsubscribe", "topics": [...]} 声明关注的主题，
+    未发送订阅请求的连接接收全部消息。
+    """
     await websocket_manager.connect(websocket, "global")
     try:
         while True:
@@ -111,6 +166,30 @@ async def websocket_endpoint(websocket: WebSocket):
             # 可以在这里处理客户端发送的消息
             if data == "ping":
                 await websocket_manager.send_personal_message({"type": "pong"}, websocket)
+                continue
+
+            try:
+                request = json.loads(data)
+            except ValueError:
+                continue
+            if not isinstance(request, dict):
+                continue
+
+            action = request.get("action")
+            topics = [str(topic) for topic in request.get("topics") or []]
+            if action == "subscribe":
+                subscribed = websocket_manager.subscribe(websocket, topics)
+                # 订阅后立即生成补发内容（中间没有await，不会与实时输出重复或乱序）
+                replay = []
+                for topic in topics:
+                    if topic.startswith("debug:") and topic != "debug:*":
+                        replay.extend(build_debug_replay(topic.split(":", 1)[1]))
+                await websocket_manager.send_personal_message({"type": "subscribed", "topics": subscribed}, websocket)
+                for message in replay:
+                    await websocket_manager.send_personal_message(message, websocket)
+            elif action == "unsubscribe":
+                subscribed = websocket_manager.unsubscribe(websocket, topics)
+                await websocket_manager.send_personal_message({"type": "subscribed", "topics": subscribed}, websocket)
     except WebSocketDisconnect:
         websocket_manager.disconnect(websocket, "global")
 
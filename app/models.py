@@ -1,7 +1,7 @@
 """
 数据库模型定义
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Boolean, JSON
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -178,8 +178,11 @@ class ScriptSubscription(Base):
     notification_enabled = Column(Boolean, default=False)  # 是否启用通知
     notification_type = Column(String(50))  # 通知类型
     auto_create_tasks = Column(Boolean, default=False)  # 是否自动创建任务
+    task_cron_template = Column(String(100))  # 自动创建任务的定时表达式模板，H 或 H(a-b) 表示按任务名分散的随机值
     is_active = Column(Boolean, default=True)  # 是否启用
     last_sync_time = Column(DateTime(timezone=True))  # 最后同步时间
+    last_check_time = Column(DateTime(timezone=True))  # 最后检查远程更新的时间
+    unchanged_count = Column(Integer, default=0)  # 自上次同步以来远程无变化、跳过同步的次数
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -223,12 +226,24 @@ class SubscriptionFile(Base):
     id = Column(Integer, primary_key=True, index=True)
     subscription_id = Column(Integer, nullable=False)  # 订阅ID
     file_path = Column(String(1000), nullable=False)  # 文件相对路径
-    file_md5 = Column(String(32), nullable=False)  # 文件MD5值
+    file_md5 = Column(String(32), nullable=False)  # 文件内容哈希（旧版本为MD5，mtime_ns为空的记录仍是MD5）
     file_size = Column(Integer, default=0)  # 文件大小
+    mtime_ns = Column(BigInteger)  # 文件修改时间（纳秒），与大小、inode一致时跳过重新计算哈希
+    inode = Column(BigInteger)  # 文件inode
     is_new = Column(Boolean, default=False)  # 是否为新文件
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+class SubscriptionSyncState(Base):
+    """订阅同步状态表（记录上次扫描对应的Git提交，用于增量检测文件变化）"""
+    __tablename__ = "subscription_sync_states"
+
+    id = Column(Integer, primary_key=True, index=True)
+    subscription_id = Column(Integer, nullable=False, unique=True, index=True)  # 订阅ID
+    scanned_commit = Column(String(64))  # 上次扫描时的HEAD提交
+    filter_fingerprint = Column(String(64))  # 扫描时的文件过滤条件指纹，变化后需要全量扫描
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class SubscriptionLog(Base):
     """订阅执行日志表"""
     __tablename__ = "subscription_logs"
@@ -243,3 +258,67 @@ class SubscriptionLog(Base):
     start_time = Column(DateTime(timezone=True), server_default=func.now())
     end_time = Column(DateTime(timezone=True))
     end_time = Column(DateTime(timezone=True))
+
+class NotificationOutbox(Base):
+    """通知发件箱表（待投递、重试中及死信通知）"""
+    __tablename__ = "notification_outbox"
+    __table_args__ = {"sqlite_autoincrement": True}  # 删除后不复用ID，避免与投递中的记录混淆
+
+    id = Column(Integer, primary_key=True, index=True)
+    notification_type = Column(String(50), nullable=False, index=True)  # 通知渠道：email, pushplus, wxpusher...
+    title = Column(String(500), nullable=False)  # 通知标题
+    content = Column(Text, nullable=False)  # 通知内容
+    source = Column(String(100))  # 通知来源，如 task:1、api_debug:2
+    status = Column(String(20), nullable=False, default="pending", index=True)  # 状态：buffered, pending, sending, sent, dead
+    payload = Column(JSON)  # 汇总模式下缓存的单条任务事件：task_name, status, duration
+    attempts = Column(Integer, default=0)  # 已尝试次数
+    next_attempt_at = Column(DateTime(timezone=True), index=True)  # 下次投递时间（汇总模式下为汇总发送时间）
+    last_error = Column(Text)  # 最后一次失败原因
+    sent_at = Column(DateTime(timezone=True))  # 投递成功时间
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class ApiMonitorConfig(Base):
+    """接口监控配置表（接口调试配置的高频监控模式）"""
+    __tablename__ = "api_monitor_configs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    config_id = Column(Integer, nullable=False, unique=True, index=True)  # 接口调试配置ID
+    is_active = Column(Boolean, default=False)  # 是否启用监控
+    interval_seconds = Column(Integer, nullable=False, default=30)  # 探测间隔（秒）
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class ApiMonitorRollup(Base):
+    """接口监控汇总表（每个汇总周期一行）"""
+    __tablename__ = "api_monitor_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    config_id = Column(Integer, nullable=False, index=True)  # 接口调试配置ID
+    bucket_start = Column(DateTime(timezone=True), nullable=False, index=True)  # 汇总周期开始时间
+    bucket_seconds = Column(Integer, nullable=False)  # 汇总周期长度（秒）
+    probe_count = Column(Integer, default=0)  # 探测次数
+    error_count = Column(Integer, default=0)  # 失败次数（请求异常或状态码>=400）
+    latency_min = Column(Integer)  # 最小响应时间(毫秒)
+    latency_avg = Column(Integer)  # 平均响应时间(毫秒)
+    latency_p50 = Column(Integer)  # 响应时间P50(毫秒)
+    latency_p95 = Column(Integer)  # 响应时间P95(毫秒)
+    latency_p99 = Column(Integer)  # 响应时间P99(毫秒)
+    latency_max = Column(Integer)  # 最大响应时间(毫秒)
+    status_counts = Column(JSON)  # 状态码计数，如 {"200": 10, "error": 1}
+
+class ApiMonitorSample(Base):
+    """接口监控响应样本表（仅保存失败或内容变化的响应，按内容哈希去重）"""
+    __tablename__ = "api_monitor_samples"
+
+    id = Column(Integer, primary_key=True, index=True)
+    config_id = Column(Integer, nullable=False, index=True)  # 接口调试配置ID
+    body_hash = Column(String(64), nullable=False, index=True)  # 响应内容哈希
+    reason = Column(String(20), nullable=False)  # 保存原因：failure, changed
+    response_status = Column(Integer)  # 响应状态码
+    response_headers = Column(JSON)  # 响应头
+    response_body = Column(Text)  # 响应体
+    error_message = Column(Text)  # 错误信息
+    occurrences = Column(Integer, default=1)  # 出现次数
+    first_seen = Column(DateTime(timezone=True), server_default=func.now())
+    last_seen = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,412 @@
+"""
+通知渠道模块
+每个通知渠道在这里集中声明配置项、限速、是否支持汇总推送以及发送实现，
+通知服务、测试接口和发件箱都通过渠道注册表查找渠道，不再各自维护 if/elif 分支
+"""
+import time
+import hmac
+import base64
+import hashlib
+import urllib.parse
+from datetime import datetime
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from typing import Dict, Any, Optional, List, Tuple
+
+
+class NotificationSendError(Exception):
+    """渠道接口返回失败（错误信息包含接口返回内容）"""
+
+
+def _mask(value: str) -> str:
+    """遮盖密钥，测试消息中只展示首尾部分"""
+    return f"{value[:8]}...{value[-8:] if len(value) > 16 else value}"
+
+
+class NotificationChannel:
+    """通知渠道基类"""
+
+    name = ""  # 渠道标识，对应 NotificationConfig.name
+    display_name = ""  # 显示名称
+    test_label = ""  # 测试消息中的渠道名称
+    test_icon = "📱"
+    required_fields: List[str] = []  # 必填配置项
+    rate_limit: Optional[int] = None  # 每分钟最多发送条数，None表示使用发件箱默认值
+    supports_digest = True  # 是否支持汇总推送
+
+    def validate_config(self, config: Dict[str, Any]) -> Optional[str]:
+        """校验配置，返回缺失配置的提示，配置完整时返回None"""
+        missing = [field for field in self.required_fields if not config.get(field)]
+        if missing:
+            return f"{self.display_name}配置不完整，缺少: {', '.join(missing)}"
+        return None
+
+    def describe_config(self, config: Dict[str, Any]) -> List[str]:
+        """测试消息中展示的配置信息"""
+        return []
+
+    def build_test_message(self, config: Dict[str, Any]) -> Dict[str, str]:
+        """构建测试消息"""
+        label = self.test_label or self.display_name
+        config_lines = "\n".join(f"• {line}" for line in self.describe_config(config))
+        content = f"""{self.test_icon} Pinchy系统{label}通知测试
+
+✅ 如果您收到这条消息，说明{label}通知配置成功！
+
+📋 配置信息：
+{config_lines}
+
+⏰ 测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+🎉 您现在可以正常接收任务执行通知了！"""
+        return {
+            "title": f"Pinchy系统 - {label}通知测试",
+            "content": content
+        }
+
+    async def send(self, service, config: Dict[str, Any], message: Dict[str, str]) -> bool:
+        """发送通知，service 为 NotificationService，提供共享的HTTP会话和SMTP连接池
+
+        发送成功返回True；渠道接口返回失败时抛出 NotificationSendError，错误信息会记录到发件箱。
+        """
+        raise NotImplementedError
+
+    async def _post_json(self, service, url: str, data: Dict[str, Any], ok) -> Tuple[bool, Any]:
+        """通过共享HTTP会话发送JSON请求，ok 用于判断响应是否成功"""
+        session = await service.get_http_session()
+        async with session.post(url, json=data) as response:
+            result = await response.json()
+        return bool(ok(result)), result
+
+
+# 渠道注册表：渠道标识 -> 渠道实例
+notification_channels: Dict[str, NotificationChannel] = {}
+
+
+def register_channel(channel_class):
+    """注册通知渠道（类装饰器）"""
+    channel = channel_class()
+    notification_channels[channel.name] = channel
+    return channel_class
+
+
+def get_notification_channel(name: str) -> Optional[NotificationChannel]:
+    """根据渠道标识获取通知渠道"""
+    return notification_channels.get(name)
+
+
+def _text_or_markdown(config: Dict[str, Any], message: Dict[str, str]) -> Dict[str, Any]:
+    """企业微信消息体：按用户配置的消息类型（默认text）构建"""
+    if config.get("msg_type", "text") == "markdown":
+        return {
+            "msgtype": "markdown",
+            "markdown": {
+                "content": f"## {message['title']}\n\n{message['content']}"
+            }
+        }
+    return {
+        "msgtype": "text",
+        "text": {
+            "content": f"{message['title']}\n\n{message['content']}"
+        }
+    }
+
+
+@register_channel
+class EmailChannel(NotificationChannel):
+    name = "email"
+    display_name = "邮箱通知"
+    test_label = "邮件"
+    test_icon = "📧"
+    required_fields = ["smtp_server", "username", "password", "to_email"]
+
+    def describe_config(self, config):
+        return [
+            f"SMTP服务器: {config.get('smtp_server')}",
+            f"SMTP端口: {config.get('smtp_port', 587)}",
+            f"发送邮箱: {config.get('username')}",
+            f"接收邮箱: {config.get('to_email')}"
+        ]
+
+    async def send(self, service, config, message):
+        msg = MIMEMultipart()
+        msg['From'] = config.get("username")
+        msg['To'] = config.get("to_email")
+        msg['Subject'] = message["title"]
+        msg.attach(MIMEText(message["content"], 'plain', 'utf-8'))
+
+        # 在SMTP发送线程中执行，复用已认证的连接
+        await service.smtp_pool.send_message(config, msg)
+        return True
+
+
+@register_channel
+class PushPlusChannel(NotificationChannel):
+    name = "pushplus"
+    display_name = "PushPlus"
+    required_fields = ["token"]
+
+    def describe_config(self, config):
+        return [f"Token: {_mask(config.get('token'))}"]
+
+    async def send(self, service, config, message):
+        data = {
+            "token": config.get("token"),
+            "title": message["title"],
+            "content": message["content"],
+            # 获取用户配置的模板类型，默认为txt
+            "template": config.get("template", "txt")
+        }
+        success, result = await self._post_json(service, "http://www.pushplus.plus/send", data,
+                                                lambda r: r.get("code") == 200)
+        if not success:
+            raise NotificationSendError(f"PushPlus发送失败: {result}")
+        return True
+
+
+@register_channel
+class WxPusherChannel(NotificationChannel):
+    name = "wxpusher"
+    display_name = "WxPusher"
+    required_fields = ["app_token", "uids"]
+
+    def validate_config(self, config):
+        error = super().validate_config(config)
+        if not error and not isinstance(config.get("uids"), list):
+            error = "WxPusher uids格式错误"
+        return error
+
+    def describe_config(self, config):
+        return [
+            f"AppToken: {_mask(config.get('app_token'))}",
+            f"接收用户: {len(config.get('uids', []))}个"
+        ]
+
+    async def send(self, service, config, message):
+        data = {
+            "appToken": config.get("app_token"),
+            "content": message["content"],
+            "summary": message["title"],
+            # 获取用户配置的内容类型，默认为1（文本类型）
+            "contentType": config.get("content_type", 1),
+            "uids": config.get("uids", [])
+        }
+        success, result = await self._post_json(service, "http://wxpusher.zjiecode.com/api/send/message", data,
+                                                lambda r: r.get("success"))
+        if not success:
+            raise NotificationSendError(f"WxPusher发送失败: {result}")
+        return True
+
+
+@register_channel
+class TelegramChannel(NotificationChannel):
+    name = "telegram"
+    display_name = "Telegram机器人"
+    test_label = "Telegram"
+    test_icon = "🤖"
+    required_fields = ["bot_token", "chat_id"]
+    rate_limit = 20  # 同一群组每分钟最多20条
+
+    def describe_config(self, config):
+        return [
+            f"Bot Token: {_mask(config.get('bot_token'))}",
+            f"Chat ID: {config.get('chat_id')}"
+        ]
+
+    async def send(self, service, config, message):
+        url = f"https://api.telegram.org/bot{config.get('bot_token')}/sendMessage"
+        data = {
+            "chat_id": config.get("chat_id"),
+            "text": f"{message['title']}\n\n{message['content']}"
+        }
+        # 获取用户配置的解析模式，默认为空（纯文本）
+        parse_mode = config.get("parse_mode", "")
+        if parse_mode:
+            data["parse_mode"] = parse_mode
+
+        success, result = await self._post_json(service, url, data, lambda r: r.get("ok"))
+        if not success:
+            raise NotificationSendError(f"Telegram发送失败: {result}")
+        return True
+
+
+@register_channel
+class WeComChannel(NotificationChannel):
+    name = "wecom"
+    display_name = "企微WebHook"
+    test_label = "企业微信"
+    required_fields = ["webhook_url"]
+    rate_limit = 20  # 企业微信群机器人每分钟最多20条
+
+    def describe_config(self, config):
+        return [f"Webhook URL: {config.get('webhook_url')[:30]}..."]
+
+    async def send(self, service, config, message):
+        success, result = await self._post_json(service, config.get("webhook_url"), _text_or_markdown(config, message),
+                                                lambda r: r.get("errcode") == 0)
+        if not success:
+            raise NotificationSendError(f"企业微信发送失败: {result}")
+        return True
+
+
+@register_channel
+class WeComAppChannel(NotificationChannel):
+    name = "wecom_app"
+    display_name = "企微应用通知"
+    test_label = "企业微信应用"
+    required_fields = ["corp_id", "corp_secret", "agent_id"]
+
+    def __init__(self):
+        # (corp_id, corp_secret) -> (access_token, 过期时间)
+        self._tokens: Dict[Tuple[str, str], Tuple[str, float]] = {}
+
+    def describe_config(self, config):
+        return [
+            f"企业ID: {config.get('corp_id')}",
+            f"应用ID: {config.get('agent_id')}",
+            f"接收用户: {config.get('to_user', '@all')}"
+        ]
+
+    async def _get_access_token(self, service, corp_id: str, corp_secret: str) -> str:
+        """获取access_token，有效期内复用，获取失败时抛出 NotificationSendError"""
+        key = (corp_id, corp_secret)
+        cached = self._tokens.get(key)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        token_url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={corp_id}&corpsecret={corp_secret}"
+        session = await service.get_http_session()
+        async with session.get(token_url) as response:
+            token_result = await response.json()
+
+        if token_result.get("errcode") != 0:
+            raise NotificationSendError(f"获取企业微信access_token失败: {token_result}")
+        access_token = token_result.get("access_token")
+        if not access_token:
+            raise NotificationSendError("企业微信access_token为空")
+
+        # 提前5分钟过期，避免使用临界过期的token
+        expires_in = int(token_result.get("expires_in", 7200))
+        self._tokens[key] = (access_token, time.monotonic() + max(expires_in - 300, 60))
+        return access_token
+
+    async def send(self, service, config, message):
+        corp_id = config.get("corp_id")
+        corp_secret = config.get("corp_secret")
+        access_token = await self._get_access_token(service, corp_id, corp_secret)
+
+        message_data = _text_or_markdown(config, message)
+        message_data["touser"] = config.get("to_user", "@all")
+        message_data["agentid"] = config.get("agent_id")
+
+        send_url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={access_token}"
+        success, result = await self._post_json(service, send_url, message_data, lambda r: r.get("errcode") == 0)
+        if not success:
+            # token失效时下次重新获取
+            if result.get("errcode") in (40014, 42001):
+                self._tokens.pop((corp_id, corp_secret), None)
+            raise NotificationSendError(f"企业微信应用发送失败: {result}")
+        return True
+
+
+@register_channel
+class ServerChanChannel(NotificationChannel):
+    name = "serverchan"
+    display_name = "Server酱"
+    required_fields = ["send_key"]
+
+    def describe_config(self, config):
+        return [f"Send Key: {_mask(config.get('send_key'))}"]
+
+    async def send(self, service, config, message):
+        url = f"https://sctapi.ftqq.com/{config.get('send_key')}.send"
+        data = {
+            "title": message["title"],
+            "desp": message["content"]
+        }
+        session = await service.get_http_session()
+        async with session.post(url, data=data) as response:
+            result = await response.json()
+        if result.get("code") != 0:
+            raise NotificationSendError(f"Server酱发送失败: {result}")
+        return True
+
+
+@register_channel
+class DingTalkChannel(NotificationChannel):
+    name = "dingtalk"
+    display_name = "钉钉机器人"
+    test_label = "钉钉"
+    required_fields = ["webhook_url"]
+    rate_limit = 20  # 钉钉机器人每分钟最多20条
+
+    def describe_config(self, config):
+        return [
+            f"Webhook URL: {config.get('webhook_url')[:30]}...",
+            f"签名验证: {'已启用' if config.get('secret') else '未启用'}"
+        ]
+
+    async def send(self, service, config, message):
+        webhook_url = config.get("webhook_url")
+        secret = config.get("secret")
+
+        # 如果配置了签名密钥，需要计算签名
+        if secret:
+            timestamp = str(round(time.time() * 1000))
+            string_to_sign = '{}\n{}'.format(timestamp, secret)
+            hmac_code = hmac.new(secret.encode('utf-8'), string_to_sign.encode('utf-8'), digestmod=hashlib.sha256).digest()
+            sign = urllib.parse.quote_plus(base64.b64encode(hmac_code))
+            webhook_url = f"{webhook_url}&timestamp={timestamp}&sign={sign}"
+
+        # 获取用户配置的消息类型，默认为text
+        if config.get("msg_type", "text") == "markdown":
+            data = {
+                "msgtype": "markdown",
+                "markdown": {
+                    "title": message["title"],
+                    "text": f"## {message['title']}\n\n{message['content']}"
+                }
+            }
+        else:
+            data = {
+                "msgtype": "text",
+                "text": {
+                    "content": f"{message['title']}\n\n{message['content']}"
+                }
+            }
+
+        success, result = await self._post_json(service, webhook_url, data, lambda r: r.get("errcode") == 0)
+        if not success:
+            raise NotificationSendError(f"钉钉发送失败: {result}")
+        return True
+
+
+@register_channel
+class BarkChannel(NotificationChannel):
+    name = "bark"
+    display_name = "Bark"
+    required_fields = ["device_key"]
+
+    def describe_config(self, config):
+        return [
+            f"Device Key: {_mask(config.get('device_key'))}",
+            f"Server URL: {config.get('server_url', 'https://api.day.app')}"
+        ]
+
+    async def send(self, service, config, message):
+        server_url = config.get("server_url") or "https://api.day.app"
+        url = f"{server_url.rstrip('/')}/{config.get('device_key')}"
+        data = {
+            "title": message["title"],
+            "body": message["content"]
+        }
+        # 获取用户配置的参数
+        if config.get("sound"):
+            data["sound"] = config.get("sound")
+        if config.get("group"):
+            data["group"] = config.get("group")
+
+        success, result = await self._post_json(service, url, data, lambda r: r.get("code") == 200)
+        if not success:
+            raise NotificationSendError(f"Bark发送失败: {result}")
+        return True
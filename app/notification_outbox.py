@@ -0,0 +1,423 @@
+"""
+通知发件箱模块
+通知先持久化到 notification_outbox 表，再由后台投递协程池异步发送，
+支持按渠道限速、失败指数退避重试和死信，进程重启后未投递的通知会继续发送。
+渠道配置开启汇总模式（digest_enabled）后，任务通知先缓存为 buffered 记录，
+在汇总窗口（digest_window 秒）结束或条数达到 digest_max_count 时合并为一条汇总通知
+"""
+import os
+import time
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Tuple
+from app.database import SessionLocal
+from app.models import NotificationOutbox, TaskLog
+from app.notification_service import notification_service, notification_route_cache, KeywordMatcher
+from app.notification_channels import get_notification_channel
+
+
+# 发件箱配置
+OUTBOX_WORKERS = int(os.getenv("NOTIFY_OUTBOX_WORKERS", "4"))  # 投递协程数量
+OUTBOX_POLL_INTERVAL = float(os.getenv("NOTIFY_OUTBOX_POLL_INTERVAL", "5"))  # 扫描到期通知的间隔（秒）
+OUTBOX_BATCH_SIZE = int(os.getenv("NOTIFY_OUTBOX_BATCH_SIZE", "50"))  # 每次扫描领取的最大通知数
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("NOTIFY_OUTBOX_MAX_ATTEMPTS", "5"))  # 最大尝试次数，超过后转入死信
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv("NOTIFY_OUTBOX_RETRY_BASE_DELAY", "30"))  # 首次重试延迟（秒），之后按2倍递增
+OUTBOX_RETRY_MAX_DELAY = float(os.getenv("NOTIFY_OUTBOX_RETRY_MAX_DELAY", "3600"))  # 重试延迟上限（秒）
+OUTBOX_CHANNEL_RATE_LIMIT = int(os.getenv("NOTIFY_OUTBOX_CHANNEL_RATE_LIMIT", "30"))  # 渠道未声明限速时每分钟最多发送条数
+OUTBOX_RETENTION_DAYS = int(os.getenv("NOTIFY_OUTBOX_RETENTION_DAYS", "7"))  # 已发送记录保留天数
+DIGEST_DEFAULT_WINDOW = int(os.getenv("NOTIFY_DIGEST_DEFAULT_WINDOW", "300"))  # 默认汇总窗口（秒）
+DIGEST_DEFAULT_MAX_COUNT = int(os.getenv("NOTIFY_DIGEST_DEFAULT_MAX_COUNT", "50"))  # 默认汇总条数上限
+
+
+class NotificationOutboxDispatcher:
+    """通知发件箱投递器"""
+
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.dispatcher_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        # 渠道 -> 下一次允许发送的时间（monotonic）
+        self._channel_next_slot: Dict[str, float] = {}
+        self._last_purge = 0.0
+
+    async def start(self):
+        """启动投递器：恢复中断的投递并启动投递协程池"""
+        if self.dispatcher_task is not None:
+            return
+
+        self._stopping = False
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.queue = asyncio.Queue(maxsize=OUTBOX_WORKERS * 2)
+
+        # 上次退出时正在投递的通知重新置为待投递
+        db = SessionLocal()
+        try:
+            recovered = db.query(NotificationOutbox).filter(
+                NotificationOutbox.status == "sending"
+            ).update({"status": "pending"})
+            db.commit()
+            if recovered:
+                print(f"通知发件箱恢复了 {recovered} 条中断的通知")
+        finally:
+            db.close()
+
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(OUTBOX_WORKERS)]
+        self.dispatcher_task = asyncio.create_task(self._dispatch_loop())
+        print(f"通知发件箱已启动，投递协程数: {OUTBOX_WORKERS}")
+
+    async def stop(self):
+        """停止投递器，未完成的通知保留在发件箱中，下次启动时继续投递"""
+        # wait_for 在事件恰好被设置时可能吞掉取消，因此先置停止标志
+        self._stopping = True
+        tasks = ([self.dispatcher_task] if self.dispatcher_task else []) + self.workers
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self.dispatcher_task = None
+        self.workers = []
+        self.queue = None
+        self._loop = None
+        print("通知发件箱已停止")
+
+    def enqueue(self, notification_type: str, title: str, content: str, source: Optional[str] = None) -> Optional[int]:
+        """将通知写入发件箱，立即返回，由后台协程投递"""
+        db = SessionLocal()
+        try:
+            item = NotificationOutbox(
+                notification_type=notification_type,
+                title=title,
+                content=content,
+                source=source,
+                status="pending",
+                attempts=0,
+                next_attempt_at=datetime.now()
+            )
+            db.add(item)
+            db.commit()
+            item_id = item.id
+        except Exception as e:
+            print(f"写入通知发件箱失败: {e}")
+            return None
+        finally:
+            db.close()
+
+        self._notify_dispatcher()
+        return item_id
+
+    def enqueue_task_notification(self, task_id: int, task_log: TaskLog,
+                                  keyword_matcher: Optional[KeywordMatcher] = None) -> Optional[int]:
+        """按缓存的任务通知路由过滤后，将任务通知写入发件箱
+
+        渠道开启汇总模式时缓存为汇总记录；仅推送错误（error_only）的任务需要及时告警，始终单独发送。
+        """
+        result = notification_service.build_task_notification(task_id, task_log, keyword_matcher)
+        if not result:
+            return None
+        route, message = result
+        notification_type = route.notification_type
+
+        digest = None if route.error_only else self._get_digest_settings(notification_type)
+        if not digest:
+            return self.enqueue(notification_type, message["title"], message["content"], source=f"task:{task_id}")
+
+        window, max_count = digest
+        db = SessionLocal()
+        try:
+            item = NotificationOutbox(
+                notification_type=notification_type,
+                title=message["title"],
+                content=message["content"],
+                source=f"task:{task_id}",
+                status="buffered",
+                payload={
+                    "task_name": task_log.task_name,
+                    "status": task_log.status,
+                    "duration": notification_service.format_task_duration(task_log)
+                },
+                attempts=0,
+                next_attempt_at=self._get_digest_deadline(db, notification_type, window)
+            )
+            db.add(item)
+            db.commit()
+            item_id = item.id
+
+            buffered = db.query(NotificationOutbox).filter(
+                NotificationOutbox.notification_type == notification_type,
+                NotificationOutbox.status == "buffered"
+            ).count()
+            if buffered >= max_count:
+                self._flush_digest(db, notification_type)
+                self._notify_dispatcher()
+            return item_id
+        finally:
+            db.close()
+
+    def retry(self, item_id: int) -> bool:
+        """将死信或失败的通知重新放回待投递状态"""
+        db = SessionLocal()
+        try:
+            updated = db.query(NotificationOutbox).filter(
+                NotificationOutbox.id == item_id,
+                NotificationOutbox.status.in_(["dead", "pending"])
+            ).update({
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": datetime.now()
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+        if updated:
+            self._notify_dispatcher()
+        return bool(updated)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取发件箱各状态的通知数量"""
+        from sqlalchemy import func
+        db = SessionLocal()
+        try:
+            rows = db.query(NotificationOutbox.status, func.count(NotificationOutbox.id)).group_by(
+                NotificationOutbox.status
+            ).all()
+        finally:
+            db.close()
+
+        stats = {"buffered": 0, "pending": 0, "sending": 0, "sent": 0, "dead": 0}
+        stats.update({status: count for status, count in rows})
+        stats["workers"] = len(self.workers)
+        stats["queued"] = self.queue.qsize() if self.queue else 0
+        return stats
+
+    def _notify_dispatcher(self):
+        """唤醒调度协程（可在其他线程或事件循环中调用）"""
+        if self._loop is None or self._wakeup is None:
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            self._wakeup.set()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _dispatch_loop(self):
+        """定期领取到期的通知并交给投递协程"""
+        while not self._stopping:
+            try:
+                self._flush_due_digests()
+                for item_id in self._claim_due_items():
+                    await self.queue.put(item_id)
+                self._purge_sent_items()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"通知发件箱调度出错: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _claim_due_items(self) -> List[int]:
+        """领取到期的待投递通知，标记为投递中"""
+        db = SessionLocal()
+        try:
+            items = db.query(NotificationOutbox).filter(
+                NotificationOutbox.status == "pending",
+                NotificationOutbox.next_attempt_at <= datetime.now()
+            ).order_by(NotificationOutbox.id).limit(OUTBOX_BATCH_SIZE).all()
+
+            item_ids = [item.id for item in items]
+            if item_ids:
+                db.query(NotificationOutbox).filter(
+                    NotificationOutbox.id.in_(item_ids)
+                ).update({"status": "sending"}, synchronize_session=False)
+                db.commit()
+            return item_ids
+        finally:
+            db.close()
+
+    def _get_digest_settings(self, notification_type: str) -> Optional[Tuple[int, int]]:
+        """读取渠道的汇总配置，未开启汇总时返回None，否则返回 (汇总窗口秒数, 汇总条数上限)"""
+        channel = get_notification_channel(notification_type)
+        if not channel or not channel.supports_digest:
+            return None
+
+        notification_config = notification_route_cache.get_channel_config(notification_type)
+        if not notification_config:
+            return None
+
+        config = notification_config.config or {}
+        if not config.get("digest_enabled"):
+            return None
+        try:
+            window = int(config.get("digest_window") or DIGEST_DEFAULT_WINDOW)
+            max_count = int(config.get("digest_max_count") or DIGEST_DEFAULT_MAX_COUNT)
+        except (TypeError, ValueError):
+            window, max_count = DIGEST_DEFAULT_WINDOW, DIGEST_DEFAULT_MAX_COUNT
+        return max(window, 1), max(max_count, 1)
+
+    def _get_digest_deadline(self, db, notification_type: str, window: int) -> datetime:
+        """汇总窗口从该渠道第一条缓存记录开始计算"""
+        first = db.query(NotificationOutbox).filter(
+            NotificationOutbox.notification_type == notification_type,
+            NotificationOutbox.status == "buffered"
+        ).order_by(NotificationOutbox.id).first()
+        if first and first.next_attempt_at:
+            return first.next_attempt_at
+        return datetime.now() + timedelta(seconds=window)
+
+    def _flush_due_digests(self):
+        """将汇总窗口已结束的渠道合并发送"""
+        db = SessionLocal()
+        try:
+            rows = db.query(NotificationOutbox.notification_type).filter(
+                NotificationOutbox.status == "buffered",
+                NotificationOutbox.next_attempt_at <= datetime.now()
+            ).distinct().all()
+            for (notification_type,) in rows:
+                self._flush_digest(db, notification_type)
+        finally:
+            db.close()
+
+    def _flush_digest(self, db, notification_type: str):
+        """将渠道的全部缓存记录合并为一条待投递的汇总通知"""
+        items = db.query(NotificationOutbox).filter(
+            NotificationOutbox.notification_type == notification_type,
+            NotificationOutbox.status == "buffered"
+        ).order_by(NotificationOutbox.id).all()
+        if not items:
+            return
+
+        # 缺少payload的旧缓存记录只能还原出标题
+        message = notification_service.build_digest_message([
+            item.payload or {"task_name": item.title, "status": "", "duration": ""}
+            for item in items
+        ])
+        for item in items:
+            db.delete(item)
+        db.add(NotificationOutbox(
+            notification_type=notification_type,
+            title=message["title"],
+            content=message["content"],
+            source="digest",
+            status="pending",
+            attempts=0,
+            next_attempt_at=datetime.now()
+        ))
+        db.commit()
+        print(f"渠道 {notification_type} 汇总了 {len(items)} 条任务通知")
+
+    def _purge_sent_items(self):
+        """每小时清理一次超过保留期的已发送记录"""
+        now = time.monotonic()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+
+        db = SessionLocal()
+        try:
+            cutoff = datetime.now() - timedelta(days=OUTBOX_RETENTION_DAYS)
+            db.query(NotificationOutbox).filter(
+                NotificationOutbox.status == "sent",
+                NotificationOutbox.sent_at < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _wait_channel_slot(self, channel: str):
+        """按渠道限速，等待该渠道的下一个发送时间片"""
+        channel_info = get_notification_channel(channel)
+        rate_limit = OUTBOX_CHANNEL_RATE_LIMIT
+        if channel_info and channel_info.rate_limit is not None:
+            rate_limit = min(channel_info.rate_limit, rate_limit) if rate_limit > 0 else channel_info.rate_limit
+        if rate_limit <= 0:
+            return
+        interval = 60.0 / rate_limit
+        now = time.monotonic()
+        slot = max(now, self._channel_next_slot.get(channel, 0.0))
+        self._channel_next_slot[channel] = slot + interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _worker(self):
+        """投递协程"""
+        while True:
+            item_id = await self.queue.get()
+            try:
+                await self._deliver(item_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"投递通知 {item_id} 时出错: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, item_id: int):
+        """投递单条通知并记录结果"""
+        db = SessionLocal()
+        try:
+            item = db.query(NotificationOutbox).filter(NotificationOutbox.id == item_id).first()
+            if not item or item.status != "sending":
+                return
+
+            notification_config = notification_route_cache.get_channel_config(item.notification_type)
+
+            item.attempts = (item.attempts or 0) + 1
+            if not notification_config:
+                # 配置不存在或未激活时重试没有意义，直接转入死信
+                item.status = "dead"
+                item.last_error = f"通知配置 {item.notification_type} 不存在或未激活"
+                db.commit()
+                print(f"通知 {item_id} 转入死信: {item.last_error}")
+                return
+
+            # 渠道不支持或配置不完整时重试同样不会成功，直接转入死信
+            channel = get_notification_channel(item.notification_type)
+            config = notification_config.config or {}
+            error = channel.validate_config(config) if channel else f"不支持的通知类型: {item.notification_type}"
+            if error:
+                item.status = "dead"
+                item.last_error = error
+                db.commit()
+                print(f"通知 {item_id} 转入死信: {error}")
+                return
+
+            await self._wait_channel_slot(item.notification_type)
+
+            success, error = await notification_service.send_message(
+                item.notification_type, config, {"title": item.title, "content": item.content}
+            )
+
+            if success:
+                item.status = "sent"
+                item.sent_at = datetime.now()
+                item.last_error = None
+                print(f"通知 {item_id} ({item.source or item.notification_type}) 发送成功")
+            elif item.attempts >= OUTBOX_MAX_ATTEMPTS:
+                item.status = "dead"
+                item.last_error = error
+                print(f"通知 {item_id} 已重试 {item.attempts} 次仍失败，转入死信")
+            else:
+                delay = min(OUTBOX_RETRY_BASE_DELAY * (2 ** (item.attempts - 1)), OUTBOX_RETRY_MAX_DELAY)
+                item.status = "pending"
+                item.last_error = error
+                item.next_attempt_at = datetime.now() + timedelta(seconds=delay)
+                print(f"通知 {item_id} 发送失败，{int(delay)} 秒后第 {item.attempts + 1} 次重试")
+            db.commit()
+        finally:
+            db.close()
+
+
+# 全局通知发件箱实例
+notification_outbox = NotificationOutboxDispatcher()
@@ -2,125 +2,415 @@
 通知服务模块
 处理各种类型的通知发送
 """
+import os
+import re
+import time
 import asyncio
 import aiohttp
+import secrets
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from typing import Dict, Any, Optional
-from sqlalchemy.orm import Session
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple, List
 from app.models import NotificationConfig, TaskNotificationConfig, TaskLog
 from app.database import SessionLocal
+from app.notification_channels import get_notification_channel
+
+
+# 通知HTTP连接池配置
+HTTP_POOL_LIMIT = int(os.getenv("NOTIFY_HTTP_POOL_LIMIT", "20"))  # 总连接数上限
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("NOTIFY_HTTP_POOL_LIMIT_PER_HOST", "4"))  # 每个主机的连接数上限
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("NOTIFY_HTTP_KEEPALIVE_TIMEOUT", "60"))  # 空闲连接保持时间（秒）
+HTTP_DNS_CACHE_TTL = int(os.getenv("NOTIFY_HTTP_DNS_CACHE_TTL", "300"))  # DNS缓存时间（秒）
+HTTP_TIMEOUT = float(os.getenv("NOTIFY_HTTP_TIMEOUT", "30"))  # 单次请求总超时（秒）
+HTTP_CONNECT_TIMEOUT = float(os.getenv("NOTIFY_HTTP_CONNECT_TIMEOUT", "10"))  # 建立连接超时（秒）
+
+# SMTP连接复用配置
+SMTP_IDLE_TIMEOUT = float(os.getenv("NOTIFY_SMTP_IDLE_TIMEOUT", "60"))  # 空闲SMTP连接保持时间（秒）
+SMTP_TIMEOUT = float(os.getenv("NOTIFY_SMTP_TIMEOUT", "30"))  # SMTP网络操作超时（秒）
+
+# 汇总通知中每个分组最多列出的任务数
+DIGEST_MAX_LINES = int(os.getenv("NOTIFY_DIGEST_MAX_LINES", "30"))
+
+# SendNotify本地推送入口（脚本通过回环地址把消息交给运行中的服务）
+SENDNOTIFY_SERVER_URL = os.getenv("SENDNOTIFY_SERVER_URL", "http://127.0.0.1:8000")  # 服务的本机访问地址
+SENDNOTIFY_PATH = "/api/notifications/sendnotify"
+SENDNOTIFY_DEDUP_SECONDS = float(os.getenv("SENDNOTIFY_DEDUP_SECONDS", "3"))  # 相同通知的去重窗口（秒）
+
+
+class SMTPConnectionPool:
+    """SMTP连接池
+
+    smtplib是阻塞库，所有SMTP操作都在单独的发送线程中串行执行，不阻塞事件循环。
+    按 (服务器, 端口, 账号) 复用已认证的连接，排队的邮件在同一会话中依次发送，
+    空闲超过 SMTP_IDLE_TIMEOUT 的连接会被关闭。
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp-sender")
+        # (smtp_server, smtp_port, username, password) -> [smtplib.SMTP, 最后使用时间]
+        self.connections: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    async def send_message(self, config: Dict[str, Any], msg) -> None:
+        """在发送线程中发送邮件，失败时抛出异常"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._send_sync, config, msg)
+        # 空闲超时后在发送线程中关闭不再使用的连接
+        loop.call_later(SMTP_IDLE_TIMEOUT + 1, self._schedule_close_idle)
+
+    async def close(self):
+        """关闭所有SMTP连接"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._close_all)
+
+    def _schedule_close_idle(self):
+        try:
+            self.executor.submit(self._close_idle)
+        except RuntimeError:
+            # 执行器已关闭
+            pass
+
+    def _connect(self, smtp_server: str, smtp_port: int, username: str, password: str) -> smtplib.SMTP:
+        server = smtplib.SMTP(smtp_server, smtp_port, timeout=SMTP_TIMEOUT)
+        try:
+            server.starttls()
+            server.login(username, password)
+        except Exception:
+            self._quit(server)
+            raise
+        return server
+
+    def _send_sync(self, config: Dict[str, Any], msg) -> None:
+        key = (config.get("smtp_server"), config.get("smtp_port", 587), config.get("username"), config.get("password"))
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self.connections.pop(key, None)
+
+        # 复用未超时的连接，服务器已断开时重新建立连接再发送一次
+        if entry and now - entry[1] < SMTP_IDLE_TIMEOUT:
+            server = entry[0]
+            try:
+                server.send_message(msg)
+                with self._lock:
+                    self.connections[key] = [server, time.monotonic()]
+                return
+            except smtplib.SMTPServerDisconnected:
+                pass
+            except Exception:
+                self._quit(server)
+                raise
+            self._quit(server)
+        elif entry:
+            self._quit(entry[0])
+
+        server = self._connect(*key)
+        try:
+            server.send_message(msg)
+        except Exception:
+            self._quit(server)
+            raise
+        with self._lock:
+            self.connections[key] = [server, time.monotonic()]
+
+    def _close_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            idle_keys = [key for key, (_, last_used) in self.connections.items()
+                         if now - last_used >= SMTP_IDLE_TIMEOUT]
+            idle = [self.connections.pop(key)[0] for key in idle_keys]
+        for server in idle:
+            self._quit(server)
+
+    def _close_all(self):
+        with self._lock:
+            servers = [server for server, _ in self.connections.values()]
+            self.connections.clear()
+        for server in servers:
+            self._quit(server)
+
+    @staticmethod
+    def _quit(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+
+class KeywordMatcher:
+    """单次任务运行的关键词匹配状态，由输出读取线程逐行调用 feed"""
+
+    __slots__ = ("pattern", "matched")
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.matched = False
+
+    def feed(self, line: str):
+        if not self.matched and self.pattern.search(line):
+            self.matched = True
+
+
+class TaskNotificationRoute:
+    """预编译的任务通知路由"""
+
+    __slots__ = ("task_id", "notification_type", "error_only", "keyword_pattern")
+
+    def __init__(self, task_id: int, notification_type: str, error_only: bool, keywords: Optional[str]):
+        self.task_id = task_id
+        self.notification_type = notification_type
+        self.error_only = bool(error_only)
+        self.keyword_pattern = self._compile_keywords(keywords)
+
+    @staticmethod
+    def _compile_keywords(keywords: Optional[str]):
+        """将逗号分隔的关键词编译为一个正则（长关键词优先），一次扫描匹配全部关键词"""
+        if not keywords:
+            return None
+        words = sorted({kw.strip() for kw in keywords.split(',') if kw.strip()}, key=len, reverse=True)
+        if not words:
+            return None
+        return re.compile("|".join(re.escape(word) for word in words))
+
+    def new_matcher(self) -> Optional[KeywordMatcher]:
+        """为一次任务运行创建关键词匹配器，未配置关键词时返回None"""
+        if self.keyword_pattern is None:
+            return None
+        return KeywordMatcher(self.keyword_pattern)
+
+    def match_text(self, *texts: Optional[str]) -> bool:
+        """扫描完整输出是否包含任一关键词"""
+        if self.keyword_pattern is None:
+            return True
+        return any(text and self.keyword_pattern.search(text) for text in texts)
+
+
+class NotificationRouteCache:
+    """任务通知路由缓存
+
+    由 task_notification_configs 和 notification_configs 两张表构建的内存路由表，
+    任务完成时判断是否通知不再访问数据库；任一配置变更后调用 invalidate 重建。
+    """
+
+    def __init__(self):
+        self._routes: Optional[Dict[int, TaskNotificationRoute]] = None
+        self._channel_configs: Dict[str, NotificationConfig] = {}
+        self._lock = threading.Lock()
+
+    def get_route(self, task_id: int) -> Optional[TaskNotificationRoute]:
+        """获取任务的通知路由，任务未配置通知时返回None"""
+        return self._load().get(task_id)
+
+    def get_channel_config(self, notification_type: str) -> Optional[NotificationConfig]:
+        """获取已激活渠道配置的快照（未绑定会话），渠道不存在或未激活时返回None"""
+        self._load()
+        return self._channel_configs.get(notification_type)
+
+    def invalidate(self):
+        """通知配置或任务通知配置变更后调用"""
+        with self._lock:
+            self._routes = None
+            self._channel_configs = {}
+
+    def _load(self) -> Dict[int, TaskNotificationRoute]:
+        routes = self._routes
+        if routes is not None:
+            return routes
+
+        with self._lock:
+            if self._routes is not None:
+                return self._routes
+
+            db = SessionLocal()
+            try:
+                routes = {
+                    config.task_id: TaskNotificationRoute(config.task_id, config.notification_type, config.error_only, config.keywords)
+                    for config in db.query(TaskNotificationConfig).all()
+                    if config.notification_type
+                }
+                channel_configs = {
+                    config.name: NotificationConfig(id=config.id, name=config.name, config=config.config, is_active=True)
+                    for config in db.query(NotificationConfig).filter(NotificationConfig.is_active == True).all()
+                }
+            finally:
+                db.close()
+
+            self._channel_configs = channel_configs
+            self._routes = routes
+            return routes
 
 
 class NotificationService:
     """通知服务类"""
     
     def __init__(self):
+        # 共享的HTTP会话（连接池），所有通知渠道复用
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        # 共享的SMTP连接池，邮件在独立线程中发送
+        self.smtp_pool = SMTPConnectionPool()
+
+    async def start(self):
+        """启动通知服务（创建HTTP连接池）"""
+        await self.get_http_session()
+        print("通知服务HTTP连接池已启动")
+
+    async def close(self):
+        """关闭通知服务（释放HTTP连接池和SMTP连接）"""
+        await self.smtp_pool.close()
+        if self.session is not None and not self.session.closed:
+            if self._session_loop is asyncio.get_running_loop():
+                await self.session.close()
         self.session = None
+        self._session_loop = None
+
+    async def get_http_session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话
+
+        会话绑定创建时的事件循环，在其他事件循环中调用（如脚本进程中的新循环）时会重新创建。
+        """
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT,
+                limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+            )
+            self._session_loop = loop
+        return self.session
     
-    async def send_task_notification(self, task_id: int, task_log: TaskLog):
-        """发送任务通知"""
-        db = SessionLocal()
-        try:
-            # 获取任务通知配置
-            task_config = db.query(TaskNotificationConfig).filter(
-                TaskNotificationConfig.task_id == task_id
-            ).first()
-            
-            if not task_config or not task_config.notification_type:
-                print(f"任务 {task_id} 没有配置通知")
-                return
-            
-            # 检查是否只推送错误
-            if task_config.error_only and task_log.status == "success":
-                print(f"任务 {task_id} 配置为仅推送错误，跳过成功通知")
-                return
-            
-            # 检查关键词过滤
-            if task_config.keywords:
-                keywords = [kw.strip() for kw in task_config.keywords.split(',') if kw.strip()]
-                if keywords:
-                    # 检查输出中是否包含关键词
-                    output_text = (task_log.output or '') + (task_log.error_output or '')
-                    if not any(keyword in output_text for keyword in keywords):
-                        print(f"任务 {task_id} 输出不包含关键词，跳过通知")
-                        return
-            
-            # 获取通知配置
-            notification_config = db.query(NotificationConfig).filter(
-                NotificationConfig.name == task_config.notification_type,
-                NotificationConfig.is_active == True
-            ).first()
-            
-            if not notification_config:
-                print(f"通知配置 {task_config.notification_type} 不存在或未激活")
-                return
-            
-            # 构建通知内容
-            message = self._build_notification_message(task_log)
-            
-            # 根据通知类型发送
-            success = False
-            if notification_config.name == "email":
-                success = await self._send_email_notification(notification_config.config, message)
-            elif notification_config.name == "pushplus":
-                success = await self._send_pushplus_notification(notification_config.config, message)
-            elif notification_config.name == "wxpusher":
-                success = await self._send_wxpusher_notification(notification_config.config, message)
-            elif notification_config.name == "telegram":
-                success = await self._send_telegram_notification(notification_config.config, message)
-            elif notification_config.name == "wecom":
-                success = await self._send_wecom_notification(notification_config.config, message)
-            elif notification_config.name == "serverchan":
-                success = await self._send_serverchan_notification(notification_config.config, message)
-            elif notification_config.name == "dingtalk":
-                success = await self._send_dingtalk_notification(notification_config.config, message)
-            elif notification_config.name == "bark":
-                success = await self._send_bark_notification(notification_config.config, message)
-            
-            if success:
-                print(f"任务 {task_id} 通知发送成功")
+    def build_task_notification(self, task_id: int, task_log: TaskLog,
+                                 keyword_matcher: Optional["KeywordMatcher"] = None) -> Optional[Tuple["TaskNotificationRoute", Dict[str, str]]]:
+        """根据缓存的任务通知路由判断是否需要通知，需要时返回 (通知路由, 通知消息)
+
+        keyword_matcher 为任务运行期间逐行匹配关键词的结果，提供时无需再扫描完整输出。
+        """
+        route = notification_route_cache.get_route(task_id)
+        if not route:
+            print(f"任务 {task_id} 没有配置通知")
+            return None
+        
+        # 检查是否只推送错误
+        if route.error_only and task_log.status == "success":
+            print(f"任务 {task_id} 配置为仅推送错误，跳过成功通知")
+            return None
+        
+        # 检查关键词过滤
+        if route.keyword_pattern is not None:
+            if keyword_matcher is not None and keyword_matcher.pattern is route.keyword_pattern:
+                matched = keyword_matcher.matched
             else:
-                print(f"任务 {task_id} 通知发送失败")
-                
-        except Exception as e:
-            print(f"发送任务通知时出错: {e}")
-        finally:
-            db.close()
+                # 没有运行期匹配结果（或运行期间配置已变更）时扫描完整输出
+                matched = route.match_text(task_log.output, task_log.error_output)
+            if not matched:
+                print(f"任务 {task_id} 输出不包含关键词，跳过通知")
+                return None
+        
+        # 构建通知内容
+        return route, self._build_notification_message(task_log)
 
     async def send_notification(self, notification_config: NotificationConfig, title: str, content: str) -> bool:
         """发送通用通知"""
-        try:
-            message = {
-                "title": title,
-                "content": content
-            }
-
-            # 根据通知类型发送
-            success = False
-            if notification_config.name == "email":
-                success = await self._send_email_notification(notification_config.config, message)
-            elif notification_config.name == "pushplus":
-                success = await self._send_pushplus_notification(notification_config.config, message)
-            elif notification_config.name == "wxpusher":
-                success = await self._send_wxpusher_notification(notification_config.config, message)
-            elif notification_config.name == "telegram":
-                success = await self._send_telegram_notification(notification_config.config, message)
-            elif notification_config.name == "wecom":
-                success = await self._send_wecom_notification(notification_config.config, message)
-            elif notification_config.name == "serverchan":
-                success = await self._send_serverchan_notification(notification_config.config, message)
-            elif notification_config.name == "dingtalk":
-                success = await self._send_dingtalk_notification(notification_config.config, message)
-            elif notification_config.name == "bark":
-                success = await self._send_bark_notification(notification_config.config, message)
-
-            return success
+        message = {
+            "title": title,
+            "content": content
+        }
+        success, _ = await self.send_message(notification_config.name, notification_config.config or {}, message)
+        return success
+
+    async def send_test_notification(self, notification_type: str, config: Dict[str, Any]) -> bool:
+        """发送测试通知"""
+        channel = get_notification_channel(notification_type)
+        if not channel:
+            print(f"不支持的通知类型: {notification_type}")
+            return False
+        success, _ = await self.send_message(notification_type, config, channel.build_test_message(config))
+        if success:
+            print(f"测试通知发送成功: {channel.display_name}")
+        return success
+
+    async def send_message(self, notification_type: str, config: Dict[str, Any],
+                           message: Dict[str, str]) -> Tuple[bool, Optional[str]]:
+        """通过渠道注册表查找渠道并发送消息，返回 (是否成功, 失败原因)"""
+        channel = get_notification_channel(notification_type)
+        if not channel:
+            error = f"不支持的通知类型: {notification_type}"
+            print(error)
+            return False, error
+
+        error = channel.validate_config(config)
+        if error:
+            print(error)
+            return False, error
 
+        try:
+            await channel.send(self, config, message)
+            return True, None
         except Exception as e:
-            print(f"发送通知时出错: {e}")
-            return False
+            error = str(e) or type(e).__name__
+            print(f"发送{channel.display_name}通知失败: {error}")
+            return False, error
+
+    def format_task_duration(self, task_log: TaskLog) -> str:
+        """计算任务执行时长文本"""
+        if not (task_log.start_time and task_log.end_time):
+            return ""
+        delta = task_log.end_time - task_log.start_time
+        total_seconds = int(delta.total_seconds())
+        minutes = total_seconds // 60
+        seconds = total_seconds % 60
+        if minutes > 0:
+            return f"{minutes}分{seconds}秒"
+        return f"{seconds}秒"
+
+    def build_digest_message(self, entries: List[Dict[str, str]]) -> Dict[str, str]:
+        """构建汇总通知消息
+
+        entries 为按完成顺序排列的任务记录，每项包含 task_name、status、duration。
+        """
+        failed = [e for e in entries if e["status"] == "failed"]
+        stopped = [e for e in entries if e["status"] == "stopped"]
+        succeeded = [e for e in entries if e["status"] == "success"]
+        others = [e for e in entries if e["status"] not in ("failed", "stopped", "success")]
+
+        title = f"Pinchy任务汇总通知 - {len(entries)}个任务"
+        if failed:
+            title += f"，{len(failed)}个失败"
+
+        content_lines = [
+            f"📊 共 {len(entries)} 个任务执行完成: 成功 {len(succeeded)}，失败 {len(failed)}，停止 {len(stopped)}"
+        ]
+
+        def append_section(header: str, items: List[Dict[str, str]]):
+            if not items:
+                return
+            content_lines.append(f"\n{header} ({len(items)} 个):")
+            for item in items[:DIGEST_MAX_LINES]:
+                duration = f" ({item['duration']})" if item.get("duration") else ""
+                status = f" [{item['status']}]" if item["status"] not in ("failed", "stopped", "success") else ""
+                content_lines.append(f"  - {item['task_name']}{status}{duration}")
+            if len(items) > DIGEST_MAX_LINES:
+                content_lines.append(f"  ... 还有 {len(items) - DIGEST_MAX_LINES} 个任务")
+
+        # 失败的任务放在最前面
+        append_section("❌ 执行失败", failed)
+        append_section("⏹️ 已停止", stopped)
+        append_section("✅ 执行成功", succeeded)
+        append_section("📋 其他状态", others)
+
+        return {
+            "title": title,
+            "content": "\n".join(content_lines)
+        }
 
     def _build_notification_message(self, task_log: TaskLog) -> Dict[str, str]:
         """构建通知消息"""
@@ -131,16 +421,7 @@ class NotificationService:
         }.get(task_log.status, f"状态: {task_log.status}")
         
         # 计算执行时长
-        duration = ""
-        if task_log.start_time and task_log.end_time:
-            delta = task_log.end_time - task_log.start_time
-            total_seconds = int(delta.total_seconds())
-            minutes = total_seconds // 60
-            seconds = total_seconds % 60
-            if minutes > 0:
-                duration = f"{minutes}分{seconds}秒"
-            else:
-                duration = f"{seconds}秒"
+        duration = self.format_task_duration(task_log)
         
         # 构建消息
         title = f"Pinchy任务通知 - {task_log.task_name}"
@@ -177,329 +458,70 @@ class NotificationService:
             "title": title,
             "content": content
         }
-    
-    async def _send_email_notification(self, config: Dict[str, Any], message: Dict[str, str]) -> bool:
-        """发送邮件通知"""
-        try:
-            # 邮件配置
-            smtp_server = config.get("smtp_server")
-            smtp_port = config.get("smtp_port", 587)
-            username = config.get("username")
-            password = config.get("password")
-            to_email = config.get("to_email")
-            
-            if not all([smtp_server, username, password, to_email]):
-                print("邮件配置不完整")
-                return False
-            
-            # 创建邮件
-            msg = MIMEMultipart()
-            msg['From'] = username
-            msg['To'] = to_email
-            msg['Subject'] = message["title"]
-            
-            # 添加邮件内容
-            msg.attach(MIMEText(message["content"], 'plain', 'utf-8'))
-            
-            # 发送邮件
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls()
-                server.login(username, password)
-                server.send_message(msg)
-            
-            return True
-            
-        except Exception as e:
-            print(f"发送邮件失败: {e}")
-            return False
-    
-    async def _send_pushplus_notification(self, config: Dict[str, Any], message: Dict[str, str]) -> bool:
-        """发送PushPlus通知"""
-        try:
-            token = config.get("token")
-            if not token:
-                print("PushPlus token未配置")
-                return False
-            
-            url = "http://www.pushplus.plus/send"
-            # 获取用户配置的模板类型，默认为txt
-            template = config.get("template", "txt")
-
-            data = {
-                "token": token,
-                "title": message["title"],
-                "content": message["content"],
-                "template": template
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=data) as response:
-                    result = await response.json()
-                    if result.get("code") == 200:
-                        return True
-                    else:
-                        print(f"PushPlus发送失败: {result}")
-                        return False
-                        
-        except Exception as e:
-            print(f"发送PushPlus通知失败: {e}")
-            return False
-    
-    async def _send_wxpusher_notification(self, config: Dict[str, Any], message: Dict[str, str]) -> bool:
-        """发送WxPusher通知"""
-        try:
-            app_token = config.get("app_token")
-            uids = config.get("uids", [])
-            
-            if not app_token or not uids:
-                print("WxPusher配置不完整")
-                return False
-            
-            url = "http://wxpusher.zjiecode.com/api/send/message"
-            # 获取用户配置的内容类型，默认为1（文本类型）
-            content_type = config.get("content_type", 1)
-
-            data = {
-                "appToken": app_token,
-                "content": message["content"],
-                "summary": message["title"],
-                "contentType": content_type,
-                "uids": uids
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=data) as response:
-                    result = await response.json()
-                    if result.get("success"):
-                        return True
-                    else:
-                        print(f"WxPusher发送失败: {result}")
-                        return False
-                        
-        except Exception as e:
-            print(f"发送WxPusher通知失败: {e}")
-            return False
-
-    async def _send_telegram_notification(self, config: Dict[str, Any], message: Dict[str, str]) -> bool:
-        """发送Telegram机器人通知"""
-        try:
-            bot_token = config.get("bot_token")
-            chat_id = config.get("chat_id")
-
-            if not bot_token or not chat_id:
-                print("Telegram配置不完整")
-                return False
-
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
 
-            # 获取用户配置的解析模式，默认为空（纯文本）
-            parse_mode = config.get("parse_mode", "")
 
-            data = {
-                "chat_id": chat_id,
-                "text": f"{message['title']}\n\n{message['content']}"
-            }
-
-            if parse_mode:
-                data["parse_mode"] = parse_mode
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=data) as response:
-                    result = await response.json()
-                    if result.get("ok"):
-                        return True
-                    else:
-                        print(f"Telegram发送失败: {result}")
-                        return False
-
-        except Exception as e:
-            print(f"发送Telegram通知失败: {e}")
-            return False
-
-    async def _send_wecom_notification(self, config: Dict[str, Any], message: Dict[str, str]) -> bool:
-        """发送企业微信机器人通知"""
-        try:
-            webhook_url = config.get("webhook_url")
-
-            if not webhook_url:
-                print("企业微信webhook_url未配置")
-                return False
-
-            # 获取用户配置的消息类型，默认为text
-            msg_type = config.get("msg_type", "text")
-
-            if msg_type == "text":
-                data = {
-                    "msgtype": "text",
-                    "text": {
-                        "content": f"{message['title']}\n\n{message['content']}"
-                    }
-                }
-            elif msg_type == "markdown":
-                data = {
-                    "msgtype": "markdown",
-                    "markdown": {
-                        "content": f"## {message['title']}\n\n{message['content']}"
-                    }
-                }
-            else:
-                # 默认使用text类型
-                data = {
-                    "msgtype": "text",
-                    "text": {
-                        "content": f"{message['title']}\n\n{message['content']}"
-                    }
-                }
+class SendNotifyTokenRegistry:
+    """SendNotify运行令牌
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(webhook_url, json=data) as response:
-                    result = await response.json()
-                    if result.get("errcode") == 0:
-                        return True
-                    else:
-                        print(f"企业微信发送失败: {result}")
-                        return False
+    每次运行脚本时签发一个随机令牌，通过环境变量注入子进程，脚本凭令牌调用本地推送入口；
+    运行结束后立即吊销。令牌只保存在内存中，服务重启后全部失效。
+    """
 
-        except Exception as e:
-            print(f"发送企业微信通知失败: {e}")
-            return False
-
-    async def _send_serverchan_notification(self, config: Dict[str, Any], message: Dict[str, str]) -> bool:
-        """发送Server酱通知"""
-        try:
-            send_key = config.get("send_key")
-
-            if not send_key:
-                print("Server酱send_key未配置")
-                return False
-
-            url = f"https://sctapi.ftqq.com/{send_key}.send"
-
-            data = {
-                "title": message["title"],
-                "desp": message["content"]
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, data=data) as response:
-                    result = await response.json()
-                    if result.get("code") == 0:
-                        return True
-                    else:
-                        print(f"Server酱发送失败: {result}")
-                        return False
-
-        except Exception as e:
-            print(f"发送Server酱通知失败: {e}")
-            return False
-
-    async def _send_dingtalk_notification(self, config: Dict[str, Any], message: Dict[str, str]) -> bool:
-        """发送钉钉机器人通知"""
-        try:
-            webhook_url = config.get("webhook_url")
-            secret = config.get("secret")
-
-            if not webhook_url:
-                print("钉钉webhook_url未配置")
-                return False
-
-            # 如果配置了签名密钥，需要计算签名
-            if secret:
-                import time
-                import hmac
-                import hashlib
-                import base64
-                import urllib.parse
-
-                timestamp = str(round(time.time() * 1000))
-                secret_enc = secret.encode('utf-8')
-                string_to_sign = '{}\n{}'.format(timestamp, secret)
-                string_to_sign_enc = string_to_sign.encode('utf-8')
-                hmac_code = hmac.new(secret_enc, string_to_sign_enc, digestmod=hashlib.sha256).digest()
-                sign = urllib.parse.quote_plus(base64.b64encode(hmac_code))
-
-                webhook_url = f"{webhook_url}&timestamp={timestamp}&sign={sign}"
-
-            # 获取用户配置的消息类型，默认为text
-            msg_type = config.get("msg_type", "text")
-
-            if msg_type == "text":
-                data = {
-                    "msgtype": "text",
-                    "text": {
-                        "content": f"{message['title']}\n\n{message['content']}"
-                    }
-                }
-            elif msg_type == "markdown":
-                data = {
-                    "msgtype": "markdown",
-                    "markdown": {
-                        "title": message["title"],
-                        "text": f"## {message['title']}\n\n{message['content']}"
-                    }
-                }
-            else:
-                # 默认使用text类型
-                data = {
-                    "msgtype": "text",
-                    "text": {
-                        "content": f"{message['title']}\n\n{message['content']}"
-                    }
-                }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(webhook_url, json=data) as response:
-                    result = await response.json()
-                    if result.get("errcode") == 0:
-                        return True
-                    else:
-                        print(f"钉钉发送失败: {result}")
-                        return False
+    def __init__(self):
+        self._tokens: Dict[str, str] = {}
+        self._recent: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def issue(self, source: str) -> str:
+        """为一次脚本运行签发令牌，source 记录在发件箱中用于追溯"""
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._tokens[token] = source
+        return token
+
+    def revoke(self, token: Optional[str]):
+        """脚本运行结束后吊销令牌"""
+        if not token:
+            return
+        with self._lock:
+            self._tokens.pop(token, None)
+
+    def resolve(self, token: Optional[str]) -> Optional[str]:
+        """校验令牌，有效时返回签发时记录的来源"""
+        if not token:
+            return None
+        with self._lock:
+            for known_token, source in self._tokens.items():
+                if secrets.compare_digest(known_token, token):
+                    return source
+        return None
+
+    def get_env(self, token: str) -> Dict[str, str]:
+        """注入脚本子进程的环境变量"""
+        return {
+            "PINCHY_NOTIFY_URL": SENDNOTIFY_SERVER_URL.rstrip("/") + SENDNOTIFY_PATH,
+            "PINCHY_NOTIFY_TOKEN": token,
+        }
 
-        except Exception as e:
-            print(f"发送钉钉通知失败: {e}")
+    def is_duplicate(self, source: str, title: str, content: str) -> bool:
+        """同一来源在去重窗口内发送的相同通知只投递一次"""
+        now = time.monotonic()
+        key = f"{source}|{title}|{content}"
+        with self._lock:
+            expired = [k for k, ts in self._recent.items() if now - ts > SENDNOTIFY_DEDUP_SECONDS]
+            for k in expired:
+                del self._recent[k]
+            if key in self._recent:
+                return True
+            self._recent[key] = now
             return False
 
-    async def _send_bark_notification(self, config: Dict[str, Any], message: Dict[str, str]) -> bool:
-        """发送Bark通知"""
-        try:
-            device_key = config.get("device_key")
-            server_url = config.get("server_url", "https://api.day.app")
-
-            if not device_key:
-                print("Bark device_key未配置")
-                return False
-
-            # 构建URL
-            url = f"{server_url.rstrip('/')}/{device_key}"
-
-            # 获取用户配置的参数
-            sound = config.get("sound", "")
-            group = config.get("group", "")
-
-            data = {
-                "title": message["title"],
-                "body": message["content"]
-            }
-
-            if sound:
-                data["sound"] = sound
-            if group:
-                data["group"] = group
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=data) as response:
-                    result = await response.json()
-                    if result.get("code") == 200:
-                        return True
-                    else:
-                        print(f"Bark发送失败: {result}")
-                        return False
-
-        except Exception as e:
-            print(f"发送Bark通知失败: {e}")
-            return False
 
+# 全局通知路由缓存实例
+notification_route_cache = NotificationRouteCache()
 
 # 全局通知服务实例
 notification_service = NotificationService()
+
+# 全局SendNotify令牌实例
+sendnotify_tokens = SendNotifyTokenRegistry()
@@ -0,0 +1,461 @@
+"""
+已安装包清单
+Python包在进程内通过 importlib.metadata 一次性读取并缓存，订阅的requirements.txt检查和包管理页面共用；
+Node.js全局包在启动时后台异步收集，安装、卸载完成后增量更新，包管理页面直接读取内存清单
+"""
+import os
+import sys
+import json
+import asyncio
+import platform
+import importlib
+import threading
+from importlib import metadata
+from typing import Dict, List, Optional, Tuple
+
+from packaging.requirements import Requirement, InvalidRequirement
+from packaging.utils import canonicalize_name
+from packaging.version import Version, InvalidVersion
+
+# 版本不满足要求时，按操作符判断需要升级还是降级
+_UPGRADE_OPERATORS = ('>', '>=', '~=')
+_DOWNGRADE_OPERATORS = ('<', '<=')
+
+# Node.js包清单配置
+NODE_INVENTORY_TIMEOUT = float(os.getenv("NODE_INVENTORY_TIMEOUT", "30"))  # 单条npm命令超时（秒）
+
+
+class PythonPackageInventory:
+    """已安装Python包清单
+
+    首次使用时遍历一次 sys.path 上的发行包元数据，结果按规范化包名缓存。
+    通过页面安装、卸载后调用 invalidate；脚本自行 pip install 时，
+    site-packages 目录的修改时间会变化，下次读取时同样会重新扫描。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 规范化包名 -> (包名, 版本)
+        self._packages: Optional[Dict[str, Tuple[str, str]]] = None
+        self._signature: Optional[Tuple] = None
+
+    @staticmethod
+    def _path_signature() -> Tuple:
+        """sys.path 各目录的修改时间，安装或卸载发行包时会随之变化"""
+        signature = []
+        for path in sys.path:
+            try:
+                signature.append((path, os.stat(path or '.').st_mtime_ns))
+            except OSError:
+                continue
+        return tuple(signature)
+
+    def _build(self) -> Dict[str, Tuple[str, str]]:
+        """遍历发行包元数据，同名包以 sys.path 中靠前的为准（与 import 行为一致）"""
+        importlib.invalidate_caches()
+        packages: Dict[str, Tuple[str, str]] = {}
+        for dist in metadata.distributions():
+            name = dist.metadata['Name']
+            if not name:
+                continue
+            key = canonicalize_name(name)
+            if key not in packages:
+                packages[key] = (name, dist.version)
+        return packages
+
+    def get_packages(self) -> Dict[str, Tuple[str, str]]:
+        """获取已安装包字典（调用方不应修改返回值）"""
+        signature = self._path_signature()
+        packages = self._packages
+        if packages is not None and signature == self._signature:
+            return packages
+
+        with self._lock:
+            if self._packages is None or signature != self._signature:
+                self._packages = self._build()
+                self._signature = signature
+            return self._packages
+
+    def list_packages(self) -> List[Tuple[str, str]]:
+        """按包名排序的 (包名, 版本) 列表"""
+        return sorted(self.get_packages().values(), key=lambda item: item[0].lower())
+
+    def get_version(self, name: str) -> Optional[str]:
+        """获取已安装版本，未安装时返回 None"""
+        package = self.get_packages().get(canonicalize_name(name))
+        return package[1] if package else None
+
+    def invalidate(self):
+        """使缓存失效，下次使用时重新扫描"""
+        with self._lock:
+            self._packages = None
+            self._signature = None
+
+    def refresh(self) -> int:
+        """立即重新扫描，返回包数量（阻塞调用，事件循环中请放到线程执行）"""
+        self.invalidate()
+        return len(self.get_packages())
+
+    def check_requirements(self, content: str) -> List[dict]:
+        """一次性检查requirements.txt中的全部依赖"""
+        packages = self.get_packages()
+        return [
+            check_requirement_line(line, packages)
+            for line in iter_requirement_lines(content)
+        ]
+
+
+def iter_requirement_lines(content: str):
+    """拆分requirements.txt的有效行：合并续行，去掉注释、pip选项和 --hash 等行内选项"""
+    pending = ''
+    # 末尾追加空行，使文件最后的续行也能被合并输出
+    for raw_line in content.splitlines() + ['']:
+        line = raw_line.strip()
+        if line.endswith('\\'):
+            pending += line[:-1] + ' '
+            continue
+        line = (pending + line).strip()
+        pending = ''
+
+        # 行首 # 或空白后的 # 为注释
+        if line.startswith('#'):
+            continue
+        comment_index = line.find(' #')
+        if comment_index != -1:
+            line = line[:comment_index].strip()
+        # -r、-e、--index-url 等pip选项行不是包要求
+        if not line or line.startswith('-'):
+            continue
+        option_index = line.find(' --')
+        if option_index != -1:
+            line = line[:option_index].strip()
+        yield line
+
+
+def get_version_status(installed_version: str, requirement: Requirement) -> str:
+    """比较已安装版本与版本要求，返回状态文本"""
+    specifier = requirement.specifier
+    if not specifier:
+        return '已安装'
+
+    try:
+        version = Version(installed_version)
+    except InvalidVersion:
+        return '版本无法比较'
+
+    specs = list(specifier)
+    if specifier.contains(version, prereleases=True):
+        if len(specs) == 1 and specs[0].operator in ('==', '===') and not specs[0].version.endswith('.*'):
+            return '版本相同'
+        return '已安装'
+
+    for spec in specs:
+        if spec.contains(version, prereleases=True):
+            continue
+        if spec.operator in _UPGRADE_OPERATORS:
+            return '需要升级'
+        if spec.operator in _DOWNGRADE_OPERATORS:
+            return '需要降级'
+        if spec.operator == '==':
+            try:
+                required = Version(spec.version[:-2] if spec.version.endswith('.*') else spec.version)
+            except InvalidVersion:
+                return '版本冲突'
+            return '需要降级' if version > required else '需要升级'
+        return '版本冲突'
+    return '版本冲突'
+
+
+def check_requirement_line(line: str, packages: Dict[str, Tuple[str, str]]) -> dict:
+    """检查单条依赖要求的安装状态"""
+    try:
+        requirement = Requirement(line)
+    except InvalidRequirement:
+        return {
+            'name': line,
+            'required_version': None,
+            'installed_version': None,
+            'status': 'error',
+            'status_text': '无法解析',
+            'operator': None,
+            'specifier': None
+        }
+
+    specs = list(requirement.specifier)
+    specifier = str(requirement.specifier) or None
+    item = {
+        'name': requirement.name,
+        # 单个条件时保留原有的操作符和版本字段，多个条件（如 >=1.0,<2.0）见 specifier
+        'required_version': specs[0].version if len(specs) == 1 else specifier,
+        'installed_version': None,
+        'status': 'not_installed',
+        'status_text': '未安装',
+        'operator': specs[0].operator if len(specs) == 1 else None,
+        'specifier': specifier
+    }
+
+    # 环境标记不匹配当前解释器时（如 sys_platform == "win32"），pip 也不会安装
+    if requirement.marker is not None and not requirement.marker.evaluate():
+        item['status'] = 'skipped'
+        item['status_text'] = '当前环境无需安装'
+        return item
+
+    package = packages.get(canonicalize_name(requirement.name))
+    if package:
+        item['installed_version'] = package[1]
+        item['status'] = 'installed'
+        item['status_text'] = get_version_status(package[1], requirement)
+    return item
+
+
+def detect_docker_environment() -> bool:
+    """检测是否在Docker环境中运行"""
+    try:
+        return (
+            os.path.exists('/.dockerenv') or
+            os.environ.get('DOCKER_CONTAINER') == 'true' or
+            (os.path.exists('/proc/1/cgroup') and 'docker' in open('/proc/1/cgroup').read())
+        )
+    except Exception:
+        return False
+
+
+async def run_npm_command(args: List[str]) -> Tuple[int, str]:
+    """异步执行npm命令，返回 (返回码, 标准输出)；超时抛出 asyncio.TimeoutError，未安装npm时抛出 FileNotFoundError"""
+    cmd = ["npm"] + args
+    if platform.system().lower() == 'windows':
+        # Windows上npm是批处理脚本，需要通过shell执行
+        process = await asyncio.create_subprocess_shell(
+            ' '.join(cmd),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+    else:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout=NODE_INVENTORY_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    return_code = process.returncode if process.returncode is not None else 1
+    return return_code, stdout.decode('utf-8', errors='ignore')
+
+
+def read_package_version(package_dir: str) -> Optional[str]:
+    """读取包目录中package.json的版本号，目录不存在时返回 None"""
+    package_json_path = os.path.join(package_dir, 'package.json')
+    if not os.path.exists(package_json_path):
+        return None
+    try:
+        with open(package_json_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('version', 'unknown')
+    except Exception:
+        return 'unknown'
+
+
+def scan_node_modules(npm_path: str) -> Dict[str, str]:
+    """直接扫描node_modules目录，读取各包的package.json版本"""
+    packages: Dict[str, str] = {}
+    if not os.path.isdir(npm_path):
+        return packages
+    for item in os.listdir(npm_path):
+        item_path = os.path.join(npm_path, item)
+        # 跳过npm自身和一些系统包
+        if item.startswith('.') or item in ('npm', 'node') or not os.path.isdir(item_path):
+            continue
+        if item.startswith('@'):
+            # 作用域包位于 @scope/name 子目录
+            for sub_item in os.listdir(item_path):
+                sub_path = os.path.join(item_path, sub_item)
+                if os.path.isdir(sub_path):
+                    packages[f"{item}/{sub_item}"] = read_package_version(sub_path) or 'unknown'
+            continue
+        packages[item] = read_package_version(item_path) or 'unknown'
+    return packages
+
+
+def parse_npm_list_text(output: str) -> Dict[str, str]:
+    """解析 npm list -g --depth=0 的文本输出"""
+    packages: Dict[str, str] = {}
+    for line in output.split('\n'):
+        line = line.strip()
+        # 处理格式如: +-- package-name@version 或 `-- package-name@version
+        if not line or '@' not in line:
+            continue
+        if line.startswith(('+--', '`--', '├──', '└──')):
+            line = line[3:].strip()
+        elif line.startswith('│'):
+            continue  # 跳过树形结构的连接线
+
+        # 跳过npm自身和一些系统包（但保留用户安装的包）
+        if any(skip in line.lower() for skip in ['npm@', 'node@']):
+            continue
+
+        parts = line.split('@')
+        if len(parts) >= 2:
+            name = '@'.join(parts[:-1]) if parts[0] == '' else parts[0]
+            version = parts[-1]
+            # 清理包名中的特殊字符
+            name = name.strip(' ├└│─`+')
+            if name and version:
+                packages[name] = version
+    return packages
+
+
+def parse_npm_list_json(output: str) -> Dict[str, str]:
+    """解析 npm list --json 输出中的依赖版本，JSON无效时抛出 json.JSONDecodeError"""
+    dependencies = json.loads(output).get("dependencies", {})
+    return {
+        name: info.get("version", "unknown") if isinstance(info, dict) else str(info)
+        for name, info in dependencies.items()
+    }
+
+
+class NodePackageInventory:
+    """已安装Node.js包清单
+
+    启动时在后台收集一次（npm list -g，失败时回退到文本输出和目录扫描），
+    之后由安装、卸载流程增量更新，也可以通过刷新接口手动重建。
+    同一时间只有一次收集在执行，期间的读取请求等待同一次结果。
+    """
+
+    def __init__(self):
+        # 全局包：包名 -> 版本
+        self._global: Optional[Dict[str, str]] = None
+        # 当前工作目录package.json中的本地包
+        self._local: Dict[str, str] = {}
+        # 全局node_modules目录，增量更新时直接读取其中的package.json
+        self._global_roots: List[str] = []
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """在后台开始收集，不阻塞调用方"""
+        self._get_refresh_task()
+
+    def _get_refresh_task(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._collect())
+        return self._refresh_task
+
+    async def refresh(self) -> int:
+        """重新收集，返回包数量；已有收集在进行时等待其结果"""
+        # shield 避免请求被取消时中断共享的收集任务
+        await asyncio.shield(self._get_refresh_task())
+        return len(self._global or {})
+
+    async def get_packages(self) -> List[Tuple[str, str]]:
+        """获取 (包名, 版本) 列表，清单尚未建立时等待收集完成"""
+        if self._global is None:
+            await self.refresh()
+        return self.list_packages()
+
+    def list_packages(self) -> List[Tuple[str, str]]:
+        """全局包在前，未在全局安装的本地包带“(本地)”后缀"""
+        global_packages = self._global or {}
+        packages = list(global_packages.items())
+        packages.extend(
+            (f"{name} (本地)", version)
+            for name, version in self._local.items()
+            if name not in global_packages
+        )
+        return packages
+
+    async def update_package(self, package_name: str):
+        """安装完成后读取该包的package.json更新版本，找不到时（如yarn、pnpm的全局目录）重新收集"""
+        if self._global is not None:
+            for root in self._global_roots:
+                version = await asyncio.to_thread(read_package_version, os.path.join(root, package_name))
+                if version is not None:
+                    self._global[package_name] = version
+                    return
+        await self.refresh()
+
+    def remove_package(self, package_name: str):
+        """卸载完成后从清单中移除"""
+        if self._global is not None:
+            self._global.pop(package_name, None)
+
+    async def _collect(self):
+        """收集全局包和本地包"""
+        try:
+            global_packages, global_roots = await self._collect_global()
+            local_packages = await self._collect_local()
+        except Exception as e:
+            print(f"收集Node.js包清单失败: {str(e)}")
+            global_packages, global_roots, local_packages = {}, [], {}
+        self._global = global_packages
+        self._global_roots = global_roots
+        self._local = local_packages
+        print(f"Node.js包清单已更新: {len(global_packages)} 个全局包，{len(local_packages)} 个本地包")
+
+    async def _collect_global(self) -> Tuple[Dict[str, str], List[str]]:
+        packages: Dict[str, str] = {}
+        roots: List[str] = []
+        try:
+            return_code, output = await run_npm_command(["root", "-g"])
+            if return_code == 0 and output.strip():
+                roots.append(output.strip())
+        except FileNotFoundError:
+            # 未安装npm
+            return packages, roots
+        except asyncio.TimeoutError:
+            pass
+
+        # 方法1: 使用 npm list -g --json --depth=0
+        # npm list 命令即使成功也可能返回非0状态码（如果有警告）
+        try:
+            _, output = await run_npm_command(["list", "-g", "--json", "--depth=0"])
+            if output.strip():
+                packages = parse_npm_list_json(output)
+        except json.JSONDecodeError as e:
+            print(f"JSON解析失败: {e}")
+        except asyncio.TimeoutError:
+            print("npm list 执行超时")
+
+        # 方法2: 如果JSON方法失败或没有获取到包，尝试使用文本格式
+        if not packages:
+            try:
+                _, output = await run_npm_command(["list", "-g", "--depth=0"])
+                packages = parse_npm_list_text(output)
+            except asyncio.TimeoutError:
+                print("npm list 文本格式执行超时")
+
+        # 方法3: 在Docker环境下，直接扫描node_modules目录
+        if detect_docker_environment():
+            roots.extend(["/usr/local/lib/node_modules", "/usr/lib/node_modules", "/app/node_modules"])
+            if not packages:
+                for root in dict.fromkeys(roots):
+                    scanned = await asyncio.to_thread(scan_node_modules, root)
+                    for name, version in scanned.items():
+                        packages.setdefault(name, version)
+
+        return packages, list(dict.fromkeys(roots))
+
+    async def _collect_local(self) -> Dict[str, str]:
+        """方法4: 当前工作目录存在package.json时获取本地安装的包"""
+        if not os.path.exists("package.json"):
+            return {}
+        try:
+            _, output = await run_npm_command(["list", "--json", "--depth=0"])
+            return parse_npm_list_json(output) if output.strip() else {}
+        except (json.JSONDecodeError, asyncio.TimeoutError):
+            return {}
+
+
+def start_package_inventory():
+    """应用启动时在后台构建Python和Node.js包清单"""
+    asyncio.get_running_loop().run_in_executor(None, python_packages.get_packages)
+    node_packages.start()
+    print("包清单正在后台构建")
+
+
+# 全局Python包清单实例
+python_packages = PythonPackageInventory()
+
+# 全局Node.js包清单实例
+node_packages = NodePackageInventory()
@@ -4,19 +4,20 @@
 import json
 import time
 import re
-import requests
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
 from app.database import get_db
-from app.models import ApiDebugConfig, ApiDebugLog, EnvironmentVariable, NotificationConfig
+from app.models import ApiDebugConfig, ApiDebugLog, NotificationConfig, ApiMonitorConfig, ApiMonitorRollup, ApiMonitorSample
 from app.auth import get_current_user, User
 from app.scheduler import task_scheduler
-# 延迟导入避免循环导入
-# from app.routers.notifications import send_notification
+from app.notification_service import notification_service
+from app.api_debug_client import api_debug_client
+from app.api_debug_template import ApiDebugRequestTemplate, api_debug_templates, env_snapshot
+from app.api_monitor import api_monitor, API_MONITOR_MIN_INTERVAL
 
 router = APIRouter(prefix="/api/debug", tags=["api_debug"])
 
@@ -33,6 +34,8 @@ class ApiDebugConfigCreate(BaseModel):
     notification_condition: str = "always"
     cron_expression: Optional[str] = None
     is_active: bool = False
+    monitor_enabled: bool = False
+    monitor_interval: int = 30
 
 class ApiDebugConfigUpdate(BaseModel):
     name: Optional[str] = None
@@ -46,6 +49,8 @@ class ApiDebugConfigUpdate(BaseModel):
     notification_condition: Optional[str] = None
     cron_expression: Optional[str] = None
     is_active: Optional[bool] = None
+    monitor_enabled: Optional[bool] = None
+    monitor_interval: Optional[int] = None
 
 class ApiDebugExecuteRequest(BaseModel):
     method: str = "GET"
@@ -59,50 +64,6 @@ class ApiDebugExecuteRequest(BaseModel):
 class ImportRequest(BaseModel):
     content: str
 
-# 变量替换函数
-def replace_variables(text: str, env_vars: dict) -> str:
-    """替换文本中的变量"""
-    if not text:
-        return text
-
-    # 生成统一的时间戳
-    timestamp_10 = str(int(time.time()))
-    timestamp_13 = str(int(time.time() * 1000))
-
-    # 替换时间戳变量
-    text = re.sub(r'\[timestmp\.10\]', timestamp_10, text)
-    text = re.sub(r'\[timestmp\.13\]', timestamp_13, text)
-    text = re.sub(r'\[timestmp\]', timestamp_13, text)  # 默认13位
-
-    # 替换随机数变量
-    def replace_random_var(match):
-        range_str = match.group(1)
-        try:
-            # 解析范围，支持格式：100-500
-            if '-' in range_str:
-                min_val, max_val = range_str.split('-', 1)
-                min_val = int(min_val.strip())
-                max_val = int(max_val.strip())
-                if min_val <= max_val:
-                    import random
-                    return str(random.randint(min_val, max_val))
-            # 如果格式不正确，保持原样
-            return f'[random.{range_str}]'
-        except (ValueError, TypeError):
-            # 如果解析失败，保持原样
-            return f'[random.{range_str}]'
-
-    text = re.sub(r'\[random\.([^]]+)\]', replace_random_var, text)
-
-    # 替换环境变量
-    def replace_env_var(match):
-        var_name = match.group(1)
-        return env_vars.get(var_name, f'[getenv.{var_name}]')  # 如果找不到变量，保持原样
-
-    text = re.sub(r'\[getenv\.([^]]+)\]', replace_env_var, text)
-
-    return text
-
 # 解析cURL命令
 def parse_curl(curl_command: str) -> dict:
     """解析cURL命令"""
@@ -280,6 +241,22 @@ def parse_fetch(fetch_command: str) -> dict:
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"fetch解析失败: {str(e)}")
 
+def save_monitor_config(db: Session, config_id: int, enabled: Optional[bool], interval: Optional[int]):
+    """保存接口调试配置的监控设置（未提交）"""
+    if enabled is None and interval is None:
+        return
+    if interval is not None and interval < API_MONITOR_MIN_INTERVAL:
+        raise HTTPException(status_code=400, detail=f"监控间隔不能小于 {API_MONITOR_MIN_INTERVAL} 秒")
+
+    monitor = db.query(ApiMonitorConfig).filter(ApiMonitorConfig.config_id == config_id).first()
+    if not monitor:
+        monitor = ApiMonitorConfig(config_id=config_id, is_active=False, interval_seconds=30)
+        db.add(monitor)
+    if enabled is not None:
+        monitor.is_active = enabled
+    if interval is not None:
+        monitor.interval_seconds = interval
+
 @router.get("/configs")
 async def get_debug_configs(
     db: Session = Depends(get_db),
@@ -287,8 +264,10 @@ async def get_debug_configs(
 ):
     """获取所有接口调试配置"""
     configs = db.query(ApiDebugConfig).all()
+    monitors = {monitor.config_id: monitor for monitor in db.query(ApiMonitorConfig).all()}
     result = []
     for config in configs:
+        monitor = monitors.get(config.id)
         result.append({
             "id": config.id,
             "name": config.name,
@@ -302,6 +281,8 @@ async def get_debug_configs(
             "notification_condition": config.notification_condition,
             "cron_expression": config.cron_expression,
             "is_active": config.is_active,
+            "monitor_enabled": bool(monitor and monitor.is_active),
+            "monitor_interval": monitor.interval_seconds if monitor else 30,
             "created_at": config.created_at.isoformat(),
             "updated_at": config.updated_at.isoformat() if config.updated_at else None
         })
@@ -314,8 +295,14 @@ async def create_debug_config(
     _: User = Depends(get_current_user)
 ):
     """创建接口调试配置"""
-    config = ApiDebugConfig(**config_data.dict())
+    config_fields = config_data.dict()
+    monitor_enabled = config_fields.pop("monitor_enabled")
+    monitor_interval = config_fields.pop("monitor_interval")
+
+    config = ApiDebugConfig(**config_fields)
     db.add(config)
+    db.flush()
+    save_monitor_config(db, config.id, monitor_enabled, monitor_interval)
     db.commit()
     db.refresh(config)
 
@@ -323,6 +310,9 @@ async def create_debug_config(
     if config.is_active and config.cron_expression:
         task_scheduler.add_debug_config(config)
 
+    if monitor_enabled:
+        api_monitor.reload(config.id)
+
     return {"message": "配置创建成功", "id": config.id}
 
 @router.put("/configs/{config_id}")
@@ -337,18 +327,25 @@ async def update_debug_config(
     if not config:
         raise HTTPException(status_code=404, detail="配置不存在")
 
-    # 先从调度器移除旧配置
-    task_scheduler.remove_debug_config(config_id)
+    # 先校验并保存，校验失败时原有的定时任务保持不变
+    config_fields = config_data.dict(exclude_unset=True)
+    monitor_enabled = config_fields.pop("monitor_enabled", None)
+    monitor_interval = config_fields.pop("monitor_interval", None)
+    save_monitor_config(db, config_id, monitor_enabled, monitor_interval)
 
-    for field, value in config_data.dict(exclude_unset=True).items():
+    for field, value in config_fields.items():
         setattr(config, field, value)
 
     db.commit()
 
-    # 如果配置启用且有cron表达式，重新添加到调度器
+    # 保存成功后再从调度器移除旧配置，启用且有cron表达式时重新添加
+    task_scheduler.remove_debug_config(config_id)
     if config.is_active and config.cron_expression:
         task_scheduler.add_debug_config(config)
 
+    # 请求内容或监控设置可能已变化，重新启动监控
+    api_monitor.reload(config_id)
+
     return {"message": "配置更新成功"}
 
 @router.delete("/configs/{config_id}")
@@ -364,11 +361,88 @@ async def delete_debug_config(
 
     # 从调度器移除配置
     task_scheduler.remove_debug_config(config_id)
+    api_debug_templates.discard(config_id)
+    api_monitor.remove(config_id)
+
+    # 删除监控设置、汇总和响应样本
+    for model in (ApiMonitorConfig, ApiMonitorRollup, ApiMonitorSample):
+        db.query(model).filter(model.config_id == config_id).delete(synchronize_session=False)
 
     db.delete(config)
     db.commit()
     return {"message": "配置删除成功"}
 
+@router.get("/configs/{config_id}/monitor/series")
+async def get_monitor_series(
+    config_id: int,
+    hours: int = Query(24, ge=1, le=24 * 30),
+    db: Session = Depends(get_db),
+    _: User = Depends(get_current_user)
+):
+    """获取接口监控时间序列（已汇总的周期和当前周期）"""
+    config = db.query(ApiDebugConfig).filter(ApiDebugConfig.id == config_id).first()
+    if not config:
+        raise HTTPException(status_code=404, detail="配置不存在")
+
+    monitor = db.query(ApiMonitorConfig).filter(ApiMonitorConfig.config_id == config_id).first()
+    since = datetime.now() - timedelta(hours=hours)
+    rollups = db.query(ApiMonitorRollup).filter(
+        ApiMonitorRollup.config_id == config_id,
+        ApiMonitorRollup.bucket_start >= since
+    ).order_by(ApiMonitorRollup.bucket_start).all()
+
+    return {
+        "config_id": config_id,
+        "monitor_enabled": bool(monitor and monitor.is_active),
+        "monitor_interval": monitor.interval_seconds if monitor else None,
+        "running": api_monitor.is_running(config_id),
+        "points": [
+            {
+                "bucket_start": rollup.bucket_start.isoformat(),
+                "bucket_seconds": rollup.bucket_seconds,
+                "probe_count": rollup.probe_count,
+                "error_count": rollup.error_count,
+                "latency_min": rollup.latency_min,
+                "latency_avg": rollup.latency_avg,
+                "latency_p50": rollup.latency_p50,
+                "latency_p95": rollup.latency_p95,
+                "latency_p99": rollup.latency_p99,
+                "latency_max": rollup.latency_max,
+                "status_counts": rollup.status_counts or {}
+            }
+            for rollup in rollups
+        ],
+        "live": api_monitor.get_live_summary(config_id)
+    }
+
+@router.get("/configs/{config_id}/monitor/samples")
+async def get_monitor_samples(
+    config_id: int,
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db),
+    _: User = Depends(get_current_user)
+):
+    """获取接口监控保存的响应样本（失败或内容变化时的响应）"""
+    samples = db.query(ApiMonitorSample).filter(
+        ApiMonitorSample.config_id == config_id
+    ).order_by(ApiMonitorSample.last_seen.desc(), ApiMonitorSample.id.desc()).limit(limit).all()
+
+    return [
+        {
+            "id": sample.id,
+            "reason": sample.reason,
+            "body_hash": sample.body_hash,
+            "response_status": sample.response_status,
+            "response_headers": sample.response_headers,
+            "response_body": sample.response_body,
+            "error_message": sample.error_message,
+            "occurrences": sample.occurrences,
+            "first_seen": sample.first_seen.isoformat() if sample.first_seen else None,
+            "last_seen": sample.last_seen.isoformat() if sample.last_seen else None
+        }
+        for sample in samples
+    ]
+
 @router.post("/execute")
 async def execute_debug_request(
     request_data: ApiDebugExecuteRequest,
@@ -378,62 +452,16 @@ async def execute_debug_request(
     """执行接口调试请求"""
     start_time = datetime.now()
     
-    # 获取环境变量
-    env_vars = {}
-    env_records = db.query(EnvironmentVariable).all()
-    for env_record in env_records:
-        env_vars[env_record.key] = env_record.value
-    
-    # 替换变量
-    url = replace_variables(request_data.url, env_vars)
-
-    # 先替换payload中的变量，因为Content-Length需要基于替换后的payload计算
-    payload = replace_variables(request_data.payload, env_vars) if request_data.payload else None
-
-    # 处理headers，特别注意Content-Length的处理
-    headers = {}
-    auto_calculate_content_length = False
+    # 编译请求模板并使用环境变量快照替换变量
+    template = ApiDebugRequestTemplate(request_data.method, request_data.url, request_data.headers, request_data.payload)
+    url, headers, payload = template.render(env_snapshot.get(db))
 
-    for key, value in request_data.headers.items():
-        # 检查是否需要自动计算Content-Length
-        if key.lower() == 'content-length' and value == '自动计算':
-            auto_calculate_content_length = True
-            continue
-        headers[replace_variables(key, env_vars)] = replace_variables(value, env_vars)
+    # 等待响应期间归还数据库连接
+    db.close()
 
-    # 自动设置Host头
     try:
-        from urllib.parse import urlparse
-        parsed_url = urlparse(url)
-        if parsed_url.netloc:
-            headers['Host'] = parsed_url.netloc
-    except:
-        pass
-
-    # 自动设置Content-Length（基于替换变量后的payload）
-    if payload and request_data.method.upper() in ['POST', 'PUT', 'PATCH']:
-        if auto_calculate_content_length or 'Content-Length' not in headers:
-            headers['Content-Length'] = str(len(payload.encode('utf-8')))
-    
-    try:
-        # 发送请求，确保正确处理UTF-8编码
-        if payload:
-            # 将payload编码为UTF-8字节
-            payload_bytes = payload.encode('utf-8')
-            response = requests.request(
-                method=request_data.method.upper(),
-                url=url,
-                headers=headers,
-                data=payload_bytes,
-                timeout=30
-            )
-        else:
-            response = requests.request(
-                method=request_data.method.upper(),
-                url=url,
-                headers=headers,
-                timeout=30
-            )
+        # 通过共享连接池异步发送请求，payload按UTF-8编码
+        response = await api_debug_client.request(request_data.method, url, headers, payload)
         
         end_time = datetime.now()
         response_time = int((end_time - start_time).total_seconds() * 1000)
@@ -481,9 +509,7 @@ async def execute_debug_request(
                             response_content += "...(内容过长已截断)"
                         message += f"响应内容: {response_content}"
 
-                        # 延迟导入避免循环导入
-                        from app.routers.notifications import send_notification
-                        await send_notification(notification_config, "接口调试通知", message)
+                        await notification_service.send_notification(notification_config, "接口调试通知", message)
                 except Exception as e:
                     print(f"发送通知失败: {str(e)}")
         
@@ -520,9 +546,7 @@ async def execute_debug_request(
                     message += f"错误信息: {str(e)}\n"
                     message += f"响应时间: {response_time}ms"
 
-                    # 延迟导入避免循环导入
-                    from app.routers.notifications import send_notification
-                    await send_notification(notification_config, "接口调试错误通知", message)
+                    await notification_service.send_notification(notification_config, "接口调试错误通知", message)
             except Exception as e:
                 print(f"发送通知失败: {str(e)}")
         
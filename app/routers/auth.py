@@ -8,11 +8,11 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from app.database import get_db
-from app.auth import authenticate_user, create_access_token, get_current_user, get_password_hash, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.auth import authenticate_user, create_access_token, get_current_user, get_password_hash, auth_cache, ACCESS_TOKEN_EXPIRE_MINUTES
 from app.models import User, NotificationConfig
 from app.security import security_manager
 from app.captcha import CaptchaGenerator
-from app.notification_service import NotificationService
+from app.notification_service import notification_service
 
 router = APIRouter(prefix="/api/auth", tags=["认证"])
 
@@ -111,9 +111,8 @@ async def login(login_data: LoginRequest, response: Response, request: Request,
         security_manager.record_login_attempt(db, client_ip, login_data.username, True, user_agent)
 
         # 获取系统UUID用于增强JWT安全性
-        from app.routers.settings import get_or_create_system_uuid
         try:
-            system_uuid = get_or_create_system_uuid(db)
+            system_uuid = auth_cache.get_system_uuid(db)
         except Exception:
             system_uuid = None
 
@@ -186,6 +185,7 @@ async def change_password(
     # 更新密码
     current_user.password_hash = get_password_hash(password_data.new_password)
     db.commit()
+    auth_cache.invalidate_user()
     
     return {"message": "密码修改成功"}
 
@@ -248,7 +248,6 @@ async def send_mfa_code(request: Request, db: Session = Depends(get_db)):
     code = security_manager.create_mfa_code(db, client_ip)
 
     # 发送通知
-    notification_service = NotificationService()
     title = "Pinchy 登录验证码"
     content = f"您的登录验证码是：{code}，有效期5分钟。"
 
@@ -9,6 +9,7 @@ from pydantic import BaseModel
 from app.database import get_db
 from app.auth import get_current_user
 from app.models import User, EnvironmentVariable
+from app.api_debug_template import env_snapshot
 
 router = APIRouter(prefix="/api/env", tags=["环境变量管理"])
 
@@ -66,6 +67,7 @@ async def create_env_var(
     
     db.add(env_var)
     db.commit()
+    env_snapshot.invalidate()
     db.refresh(env_var)
     
     return EnvVarResponse(
@@ -135,6 +137,7 @@ async def update_env_var(
         setattr(env_var, field, value)
     
     db.commit()
+    env_snapshot.invalidate()
     db.refresh(env_var)
     
     return EnvVarResponse(
@@ -159,5 +162,6 @@ async def delete_env_var(
     
     db.delete(env_var)
     db.commit()
+    env_snapshot.invalidate()
     
     return {"message": f"环境变量 {env_var.key} 已删除"}
@@ -6,13 +6,12 @@ from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSock
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 from pydantic import BaseModel, field_validator
-import asyncio
 from datetime import datetime
 from app.database import get_db
 from app.auth import get_current_user
 from app.models import User, TaskLog
 from app.websocket_manager import websocket_manager
-from app.timezone_utils import format_datetime
+from app.timezone_utils import format_datetime, get_datetime_formatter
 
 router = APIRouter(prefix="/api/logs", tags=["日志管理"])
 
@@ -31,15 +30,17 @@ class TaskLogResponse(BaseModel):
         from_attributes = True
 
     @classmethod
-    def from_db_model(cls, log, db=None):
+    def from_db_model(cls, log, db=None, formatter=None):
         """从数据库模型创建响应对象"""
+        if formatter is None:
+            formatter = lambda dt: format_datetime(dt, db)
         return cls(
             id=log.id,
             task_id=log.task_id,
             task_name=log.task_name,
             status=log.status,
-            start_time=format_datetime(log.start_time, db) if log.start_time else "",
-            end_time=format_datetime(log.end_time, db) if log.end_time else None,
+            start_time=formatter(log.start_time) if log.start_time else "",
+            end_time=formatter(log.end_time) if log.end_time else None,
             output=log.output,
             error_output=log.error_output,
             exit_code=log.exit_code
@@ -84,7 +85,9 @@ async def get_logs(
     page = (offset // limit) + 1
     total_pages = (total + limit - 1) // limit
 
-    items = [TaskLogResponse.from_db_model(log, db) for log in logs]
+    # 列表接口只解析一次时区
+    formatter = get_datetime_formatter(db)
+    items = [TaskLogResponse.from_db_model(log, db, formatter) for log in logs]
 
     return PaginatedLogsResponse(
         items=items,
@@ -179,50 +182,43 @@ async def get_running_task_log(
     return response
 
 @router.websocket("/ws/{task_id}")
-async def websocket_task_log(websocket: WebSocket, task_id: int):
-    """WebSocket连接用于实时日志传输"""
+async def websocket_task_log(websocket: WebSocket, task_id: int, batch: bool = False):
+    """WebSocket连接用于实时日志传输
+
+    batch=1 时以 task_output_batch 合并帧推送输出，否则逐行推送 task_output 消息。
+    """
     room_id = f"task_{task_id}"
-    await websocket_manager.connect(websocket, room_id)
+    await websocket_manager.connect(websocket, room_id, batch_output=batch)
 
     try:
         # 发送历史日志（如果任务正在运行或刚完成）
         from app.scheduler import task_scheduler
+        from app.websocket_manager import TASK_OUTPUT_BATCH_MAX_LINES
 
         # 获取任务的日志缓存
         log_cache = task_scheduler.get_task_log_cache(task_id)
 
         if log_cache:
-            print(f"发送任务 {task_id} 的历史日志，输出行数: {len(log_cache.get('output_lines', []))}, 错误行数: {len(log_cache.get('error_lines', []))}")
-
-            # 发送历史的stdout输出
-            for line in log_cache.get("output_lines", []):
-                await websocket_manager.send_personal_message({
-                    "type": "task_output",
-                    "task_id": task_id,
-                    "log_id": log_cache.get("log_id"),
-                    "output_line": line,
-                    "output_type": "stdout"
-                }, websocket)
-                # 添加小延迟确保消息顺序
-                await asyncio.sleep(0.01)
-
-            # 发送历史的stderr输出
-            for line in log_cache.get("error_lines", []):
-                await websocket_manager.send_personal_message({
-                    "type": "task_output",
-                    "task_id": task_id,
-                    "log_id": log_cache.get("log_id"),
-                    "output_line": line,
-                    "output_type": "stderr"
-                }, websocket)
-                # 添加小延迟确保消息顺序
-                await asyncio.sleep(0.01)
+            # 历史行保留实时推送时分配的序号和stdout/stderr交错顺序（经过连接的发送队列，顺序有保证）
+            lines = list(log_cache.get("lines", []))
+            print(f"发送任务 {task_id} 的历史日志，行数: {len(lines)}")
+            log_id = log_cache.get("log_id")
+
+            if batch:
+                for i in range(0, len(lines), TASK_OUTPUT_BATCH_MAX_LINES):
+                    await websocket_manager.send_personal_message(
+                        websocket_manager.build_task_output_batch(task_id, log_id, lines[i:i + TASK_OUTPUT_BATCH_MAX_LINES], history=True),
+                        websocket
+                    )
+            else:
+                for message in websocket_manager.build_task_output_messages(task_id, log_id, lines):
+                    await websocket_manager.send_personal_message(message, websocket)
         else:
             print(f"任务 {task_id} 没有找到日志缓存")
 
         while True:
-            # 保持连接活跃
-            await asyncio.sleep(1)
+            # 保持连接活跃，客户端断开时receive_text会抛出WebSocketDisconnect
+            await websocket.receive_text()
     except WebSocketDisconnect:
         websocket_manager.disconnect(websocket, room_id)
 
@@ -309,6 +305,11 @@ async def get_log_stats(
         "success_rate": round(success_logs / total_logs * 100, 2) if total_logs > 0 else 0
     }
 
+@router.get("/stats/websocket")
+async def get_websocket_stats(current_user: User = Depends(get_current_user)):
+    """获取WebSocket发送队列统计信息（队列长度、丢帧数、发送延迟）"""
+    return websocket_manager.get_metrics()
+
 @router.post("/clear-all")
 async def clear_all_logs(
     current_user: User = Depends(get_current_user),
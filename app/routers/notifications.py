@@ -1,19 +1,17 @@
 """
 通知服务相关路由
 """
-import aiohttp
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from typing import Dict, Any, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Header
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from datetime import datetime
 
 from app.database import get_db
 from app.auth import get_current_user
-from app.models import User, NotificationConfig, TaskNotificationConfig, Task, SystemConfig
+from app.notification_service import notification_service, notification_route_cache, sendnotify_tokens
+from app.notification_channels import notification_channels, get_notification_channel
+from app.notification_outbox import notification_outbox
+from app.models import User, NotificationConfig, TaskNotificationConfig, Task, SystemConfig, NotificationOutbox
 
 router = APIRouter(prefix="/api/notifications", tags=["通知服务"])
 
@@ -34,6 +32,10 @@ class TestNotificationRequest(BaseModel):
 class SendNotifyConfigRequest(BaseModel):
     notification_type: Optional[str] = None
 
+class SendNotifyMessage(BaseModel):
+    title: str
+    content: str = ""
+
 @router.get("/configs")
 async def get_notification_configs(
     db: Session = Depends(get_db),
@@ -61,8 +63,7 @@ async def create_notification_config(
 ):
     """创建通知配置"""
     # 验证配置类型
-    supported_types = ["email", "pushplus", "wxpusher", "telegram", "wecom", "wecom_app", "serverchan", "dingtalk", "bark"]
-    if config_data.name not in supported_types:
+    if config_data.name not in notification_channels:
         raise HTTPException(status_code=400, detail="不支持的通知类型")
     
     # 检查是否已存在同类型配置
@@ -81,6 +82,7 @@ async def create_notification_config(
     
     db.add(config)
     db.commit()
+    notification_route_cache.invalidate()
     db.refresh(config)
     
     return {
@@ -108,8 +110,7 @@ async def update_notification_config(
         raise HTTPException(status_code=404, detail="配置不存在")
 
     # 验证配置类型
-    supported_types = ["email", "pushplus", "wxpusher", "telegram", "wecom", "wecom_app", "serverchan", "dingtalk", "bark"]
-    if config_data.name not in supported_types:
+    if config_data.name not in notification_channels:
         raise HTTPException(status_code=400, detail="不支持的通知类型")
 
     # 如果更改了通知类型，检查是否已存在同类型配置
@@ -127,6 +128,7 @@ async def update_notification_config(
     config.is_active = False  # 更新后需要重新测试激活
 
     db.commit()
+    notification_route_cache.invalidate()
     db.refresh(config)
 
     return {
@@ -159,6 +161,7 @@ async def delete_notification_config(
     # 删除通知配置
     db.delete(config)
     db.commit()
+    notification_route_cache.invalidate()
 
     return {"message": "配置删除成功"}
 
@@ -177,12 +180,13 @@ async def test_notification(
     
     try:
         # 发送测试通知
-        success = await _send_test_notification(config.name, config.config)
+        success = await notification_service.send_test_notification(config.name, config.config)
         
         if success:
             # 测试成功，激活配置
             config.is_active = True
             db.commit()
+            notification_route_cache.invalidate()
             return {"message": "测试通知发送成功，配置已激活"}
         else:
             return {"message": "测试通知发送失败，请检查配置"}
@@ -248,6 +252,7 @@ async def create_task_notification_config(
         existing_config.error_only = config_data.error_only
         existing_config.keywords = config_data.keywords
         db.commit()
+        notification_route_cache.invalidate()
         db.refresh(existing_config)
         
         return {
@@ -270,6 +275,7 @@ async def create_task_notification_config(
         
         db.add(config)
         db.commit()
+        notification_route_cache.invalidate()
         db.refresh(config)
         
         return {
@@ -305,333 +311,68 @@ async def get_active_notification_configs(
         for config in configs
     ]
 
-def _get_display_name(config_name: str) -> str:
-    """获取配置的显示名称"""
-    display_names = {
-        "email": "邮箱通知",
-        "pushplus": "PushPlus",
-        "wxpusher": "WxPusher",
-        "telegram": "Telegram机器人",
-        "wecom": "企微WebHook",
-        "wecom_app": "企微应用通知",
-        "serverchan": "Server酱",
-        "dingtalk": "钉钉机器人",
-        "bark": "Bark"
-    }
-    return display_names.get(config_name, config_name)
-
-async def _send_test_notification(config_type: str, config: Dict[str, Any]) -> bool:
-    """发送测试通知"""
-    try:
-        if config_type == "email":
-            return await _send_test_email(config)
-        elif config_type == "pushplus":
-            return await _send_test_pushplus(config)
-        elif config_type == "wxpusher":
-            return await _send_test_wxpusher(config)
-        elif config_type == "telegram":
-            return await _send_test_telegram(config)
-        elif config_type == "wecom":
-            return await _send_test_wecom(config)
-        elif config_type == "wecom_app":
-            return await _send_test_wecom_app(config)
-        elif config_type == "serverchan":
-            return await _send_test_serverchan(config)
-        elif config_type == "dingtalk":
-            return await _send_test_dingtalk(config)
-        elif config_type == "bark":
-            return await _send_test_bark(config)
-        else:
-            print(f"不支持的通知类型: {config_type}")
-            return False
-    except Exception as e:
-        print(f"发送测试通知失败: {e}")
-        return False
-
-
-async def _send_test_email(config: Dict[str, Any]) -> bool:
-    """发送测试邮件通知"""
-    try:
-        # 邮件配置验证
-        smtp_server = config.get("smtp_server")
-        smtp_port = config.get("smtp_port", 587)
-        username = config.get("username")
-        password = config.get("password")
-        to_email = config.get("to_email")
-
-        if not all([smtp_server, username, password, to_email]):
-            print("邮件配置不完整，缺少必要参数")
-            return False
-
-        # 创建测试邮件
-        msg = MIMEMultipart()
-        msg['From'] = username
-        msg['To'] = to_email
-        msg['Subject'] = "Pinchy系统 - 邮件通知测试"
-
-        # 邮件内容
-        test_content = f"""
-📧 Pinchy系统邮件通知测试
-
-✅ 如果您收到这封邮件，说明邮件通知配置成功！
-
-📋 配置信息：
-• SMTP服务器: {smtp_server}
-• SMTP端口: {smtp_port}
-• 发送邮箱: {username}
-• 接收邮箱: {to_email}
-
-⏰ 测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-🎉 您现在可以正常接收任务执行通知了！
-        """.strip()
-
-        msg.attach(MIMEText(test_content, 'plain', 'utf-8'))
-
-        # 发送邮件
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(username, password)
-            server.send_message(msg)
-
-        print(f"测试邮件发送成功: {username} -> {to_email}")
-        return True
-
-    except Exception as e:
-        print(f"发送测试邮件失败: {e}")
-        return False
-
-
-async def _send_test_pushplus(config: Dict[str, Any]) -> bool:
-    """发送测试PushPlus通知"""
-    try:
-        token = config.get("token")
-        if not token:
-            print("PushPlus token未配置")
-            return False
-
-        url = "http://www.pushplus.plus/send"
-
-        # 构建测试消息
-        title = "Pinchy系统 - PushPlus通知测试"
-        content = f"""
-📱 Pinchy系统PushPlus通知测试
-
-✅ 如果您收到这条消息，说明PushPlus通知配置成功！
-
-📋 配置信息：
-• Token: {token[:8]}...{token[-8:] if len(token) > 16 else token}
-
-⏰ 测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-🎉 您现在可以正常接收任务执行通知了！
-        """.strip()
-
-        # 获取用户配置的模板类型，默认为txt
-        template = config.get("template", "txt")
-
-        data = {
-            "token": token,
-            "title": title,
-            "content": content,
-            "template": template
-        }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, timeout=10) as response:
-                result = await response.json()
-                if result.get("code") == 200:
-                    print(f"测试PushPlus通知发送成功: {result}")
-                    return True
-                else:
-                    print(f"PushPlus发送失败: {result}")
-                    return False
-
-    except Exception as e:
-        print(f"发送测试PushPlus通知失败: {e}")
-        return False
-
-
-async def _send_test_wxpusher(config: Dict[str, Any]) -> bool:
-    """发送测试WxPusher通知"""
-    try:
-        app_token = config.get("app_token")
-        uids = config.get("uids", [])
-
-        if not app_token:
-            print("WxPusher app_token未配置")
-            return False
-
-        if not uids or not isinstance(uids, list) or len(uids) == 0:
-            print("WxPusher uids未配置或格式错误")
-            return False
-
-        url = "http://wxpusher.zjiecode.com/api/send/message"
-
-        # 构建测试消息
-        title = "Pinchy系统 - WxPusher通知测试"
-        content = f"""
-📱 Pinchy系统WxPusher通知测试
-
-✅ 如果您收到这条消息，说明WxPusher通知配置成功！
-
-📋 配置信息：
-• AppToken: {app_token[:8]}...{app_token[-8:] if len(app_token) > 16 else app_token}
-• 接收用户: {len(uids)}个
-
-⏰ 测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-🎉 您现在可以正常接收任务执行通知了！
-        """.strip()
-
-        # 获取用户配置的内容类型，默认为1（文本类型）
-        content_type = config.get("content_type", 1)
-
-        data = {
-            "appToken": app_token,
-            "content": content,
-            "summary": title,
-            "contentType": content_type,
-            "uids": uids
-        }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, timeout=10) as response:
-                result = await response.json()
-                if result.get("success"):
-                    print(f"测试WxPusher通知发送成功: {result}")
-                    return True
-                else:
-                    print(f"WxPusher发送失败: {result}")
-                    return False
-
-    except Exception as e:
-        print(f"发送测试WxPusher通知失败: {e}")
-        return False
-
-# 通用通知发送函数
-async def send_notification(notification_config: NotificationConfig, title: str, content: str) -> bool:
-    """发送通知"""
-    try:
-        if notification_config.name == "email":
-            return await _send_email_notification(notification_config.config, title, content)
-        elif notification_config.name == "pushplus":
-            return await _send_pushplus_notification(notification_config.config, title, content)
-        elif notification_config.name == "wxpusher":
-            return await _send_wxpusher_notification(notification_config.config, title, content)
-        elif notification_config.name == "wecom":
-            return await _send_wecom_notification(notification_config.config, title, content)
-        elif notification_config.name == "wecom_app":
-            return await _send_wecom_app_notification(notification_config.config, title, content)
-        else:
-            print(f"不支持的通知类型: {notification_config.name}")
-            return False
-    except Exception as e:
-        print(f"发送通知失败: {e}")
-        return False
-
-async def _send_email_notification(config: Dict[str, Any], title: str, content: str) -> bool:
-    """发送邮件通知"""
-    try:
-        smtp_server = config.get("smtp_server")
-        smtp_port = config.get("smtp_port", 587)
-        username = config.get("username")
-        password = config.get("password")
-        to_email = config.get("to_email")
-
-        if not all([smtp_server, username, password, to_email]):
-            print("邮件配置不完整")
-            return False
-
-        msg = MIMEMultipart()
-        msg['From'] = username
-        msg['To'] = to_email
-        msg['Subject'] = title
-
-        msg.attach(MIMEText(content, 'plain', 'utf-8'))
-
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(username, password)
-            server.send_message(msg)
-
-        print(f"邮件通知发送成功: {username} -> {to_email}")
-        return True
-
-    except Exception as e:
-        print(f"发送邮件通知失败: {e}")
-        return False
-
-async def _send_pushplus_notification(config: Dict[str, Any], title: str, content: str) -> bool:
-    """发送PushPlus通知"""
-    try:
-        token = config.get("token")
-        if not token:
-            print("PushPlus token未配置")
-            return False
-
-        url = "http://www.pushplus.plus/send"
-        template = config.get("template", "txt")
-
-        data = {
-            "token": token,
-            "title": title,
-            "content": content,
-            "template": template
-        }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, timeout=10) as response:
-                result = await response.json()
-                if result.get("code") == 200:
-                    print(f"PushPlus通知发送成功")
-                    return True
-                else:
-                    print(f"PushPlus发送失败: {result}")
-                    return False
-
-    except Exception as e:
-        print(f"发送PushPlus通知失败: {e}")
-        return False
-
-async def _send_wxpusher_notification(config: Dict[str, Any], title: str, content: str) -> bool:
-    """发送WxPusher通知"""
-    try:
-        app_token = config.get("app_token")
-        uids = config.get("uids", [])
-
-        if not app_token:
-            print("WxPusher app_token未配置")
-            return False
+@router.get("/outbox")
+async def get_notification_outbox(
+    status: Optional[str] = Query(None, description="状态过滤：pending, sending, sent, dead"),
+    limit: int = Query(50, description="返回记录数"),
+    db: Session = Depends(get_db),
+    _: User = Depends(get_current_user)
+):
+    """获取通知发件箱记录及各状态统计"""
+    query = db.query(NotificationOutbox)
+    if status:
+        query = query.filter(NotificationOutbox.status == status)
+    items = query.order_by(NotificationOutbox.id.desc()).limit(limit).all()
 
-        if not uids or not isinstance(uids, list) or len(uids) == 0:
-            print("WxPusher uids未配置")
-            return False
+    return {
+        "stats": notification_outbox.get_stats(),
+        "items": [
+            {
+                "id": item.id,
+                "notification_type": item.notification_type,
+                "title": item.title,
+                "source": item.source,
+                "status": item.status,
+                "attempts": item.attempts,
+                "next_attempt_at": item.next_attempt_at.isoformat() if item.next_attempt_at else None,
+                "last_error": item.last_error,
+                "sent_at": item.sent_at.isoformat() if item.sent_at else None,
+                "created_at": item.created_at.isoformat() if item.created_at else None
+            }
+            for item in items
+        ]
+    }
 
-        url = "http://wxpusher.zjiecode.com/api/send/message"
-        content_type = config.get("content_type", 1)
+@router.post("/outbox/{item_id}/retry")
+async def retry_notification_outbox_item(
+    item_id: int,
+    _: User = Depends(get_current_user)
+):
+    """重新投递死信通知"""
+    if not notification_outbox.retry(item_id):
+        raise HTTPException(status_code=404, detail="通知不存在或不可重试")
+    return {"message": "通知已重新加入发件箱"}
 
-        data = {
-            "appToken": app_token,
-            "content": content,
-            "summary": title,
-            "contentType": content_type,
-            "uids": uids
+@router.get("/channels")
+async def get_notification_channels(
+    _: User = Depends(get_current_user)
+):
+    """获取支持的通知渠道及其配置要求"""
+    return [
+        {
+            "name": channel.name,
+            "display_name": channel.display_name,
+            "required_fields": channel.required_fields,
+            "rate_limit": channel.rate_limit,
+            "supports_digest": channel.supports_digest
         }
+        for channel in notification_channels.values()
+    ]
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, timeout=10) as response:
-                result = await response.json()
-                if result.get("success"):
-                    print(f"WxPusher通知发送成功")
-                    return True
-                else:
-                    print(f"WxPusher发送失败: {result}")
-                    return False
-
-    except Exception as e:
-        print(f"发送WxPusher通知失败: {e}")
-        return False
+def _get_display_name(config_name: str) -> str:
+    """获取配置的显示名称"""
+    channel = get_notification_channel(config_name)
+    return channel.display_name if channel else config_name
 
 
 # SendNotify配置相关API
@@ -710,526 +451,48 @@ async def set_sendnotify_config(
         raise HTTPException(status_code=500, detail="设置SendNotify配置失败")
 
 
-async def _send_test_telegram(config: Dict[str, Any]) -> bool:
-    """发送测试Telegram通知"""
-    try:
-        bot_token = config.get("bot_token")
-        chat_id = config.get("chat_id")
-
-        if not bot_token or not chat_id:
-            print("Telegram配置不完整")
-            return False
-
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-
-        # 构建测试消息
-        title = "Pinchy系统 - Telegram通知测试"
-        content = f"""
-🤖 Pinchy系统Telegram通知测试
-
-✅ 如果您收到这条消息，说明Telegram通知配置成功！
-
-📋 配置信息：
-• Bot Token: {bot_token[:8]}...{bot_token[-8:] if len(bot_token) > 16 else bot_token}
-• Chat ID: {chat_id}
-
-⏰ 测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-🎉 您现在可以正常接收任务执行通知了！
-        """.strip()
-
-        # 获取用户配置的解析模式，默认为空（纯文本）
-        parse_mode = config.get("parse_mode", "")
-
-        data = {
-            "chat_id": chat_id,
-            "text": f"{title}\n\n{content}"
-        }
-
-        if parse_mode:
-            data["parse_mode"] = parse_mode
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, timeout=10) as response:
-                result = await response.json()
-                if result.get("ok"):
-                    print(f"测试Telegram通知发送成功: {result}")
-                    return True
-                else:
-                    print(f"Telegram发送失败: {result}")
-                    return False
 
-    except Exception as e:
-        print(f"发送测试Telegram通知失败: {e}")
-        return False
-
-
-async def _send_test_wecom(config: Dict[str, Any]) -> bool:
-    """发送测试企业微信WebHook通知"""
-    try:
-        webhook_url = config.get("webhook_url")
-
-        if not webhook_url:
-            print("企业微信webhook_url未配置")
-            return False
-
-        # 构建测试消息
-        title = "Pinchy系统 - 企业微信通知测试"
-        content = f"""
-📱 Pinchy系统企业微信通知测试
-
-✅ 如果您收到这条消息，说明企业微信通知配置成功！
-
-📋 配置信息：
-• Webhook URL: {webhook_url[:30]}...
-
-⏰ 测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-🎉 您现在可以正常接收任务执行通知了！
-        """.strip()
-
-        # 获取用户配置的消息类型，默认为text
-        msg_type = config.get("msg_type", "text")
-
-        if msg_type == "text":
-            data = {
-                "msgtype": "text",
-                "text": {
-                    "content": f"{title}\n\n{content}"
-                }
-            }
-        elif msg_type == "markdown":
-            data = {
-                "msgtype": "markdown",
-                "markdown": {
-                    "content": f"## {title}\n\n{content}"
-                }
-            }
-        else:
-            # 默认使用text类型
-            data = {
-                "msgtype": "text",
-                "text": {
-                    "content": f"{title}\n\n{content}"
-                }
-            }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(webhook_url, json=data, timeout=10) as response:
-                result = await response.json()
-                if result.get("errcode") == 0:
-                    print(f"测试企业微信通知发送成功: {result}")
-                    return True
-                else:
-                    print(f"企业微信发送失败: {result}")
-                    return False
-
-    except Exception as e:
-        print(f"发送测试企业微信通知失败: {e}")
-        return False
-
-
-async def _send_test_serverchan(config: Dict[str, Any]) -> bool:
-    """发送测试Server酱通知"""
-    try:
-        send_key = config.get("send_key")
-
-        if not send_key:
-            print("Server酱send_key未配置")
-            return False
-
-        url = f"https://sctapi.ftqq.com/{send_key}.send"
-
-        # 构建测试消息
-        title = "Pinchy系统 - Server酱通知测试"
-        content = f"""
-📱 Pinchy系统Server酱通知测试
 
-✅ 如果您收到这条消息，说明Server酱通知配置成功！
+# 仅允许本机脚本访问的推送入口
+_LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
 
-📋 配置信息：
-• Send Key: {send_key[:8]}...{send_key[-8:] if len(send_key) > 16 else send_key}
 
-⏰ 测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-🎉 您现在可以正常接收任务执行通知了！
-        """.strip()
-
-        data = {
-            "title": title,
-            "desp": content
-        }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, data=data, timeout=10) as response:
-                result = await response.json()
-                if result.get("code") == 0:
-                    print(f"测试Server酱通知发送成功: {result}")
-                    return True
-                else:
-                    print(f"Server酱发送失败: {result}")
-                    return False
-
-    except Exception as e:
-        print(f"发送测试Server酱通知失败: {e}")
-        return False
-
-
-async def _send_test_dingtalk(config: Dict[str, Any]) -> bool:
-    """发送测试钉钉通知"""
-    try:
-        webhook_url = config.get("webhook_url")
-        secret = config.get("secret")
-
-        if not webhook_url:
-            print("钉钉webhook_url未配置")
-            return False
-
-        # 如果配置了签名密钥，需要计算签名
-        if secret:
-            import time
-            import hmac
-            import hashlib
-            import base64
-            import urllib.parse
-
-            timestamp = str(round(time.time() * 1000))
-            secret_enc = secret.encode('utf-8')
-            string_to_sign = '{}\n{}'.format(timestamp, secret)
-            string_to_sign_enc = string_to_sign.encode('utf-8')
-            hmac_code = hmac.new(secret_enc, string_to_sign_enc, digestmod=hashlib.sha256).digest()
-            sign = urllib.parse.quote_plus(base64.b64encode(hmac_code))
-
-            webhook_url = f"{webhook_url}&timestamp={timestamp}&sign={sign}"
-
-        # 构建测试消息
-        title = "Pinchy系统 - 钉钉通知测试"
-        content = f"""
-📱 Pinchy系统钉钉通知测试
-
-✅ 如果您收到这条消息，说明钉钉通知配置成功！
-
-📋 配置信息：
-• Webhook URL: {webhook_url[:30]}...
-• 签名验证: {'已启用' if secret else '未启用'}
-
-⏰ 测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-🎉 您现在可以正常接收任务执行通知了！
-        """.strip()
-
-        # 获取用户配置的消息类型，默认为text
-        msg_type = config.get("msg_type", "text")
-
-        if msg_type == "text":
-            data = {
-                "msgtype": "text",
-                "text": {
-                    "content": f"{title}\n\n{content}"
-                }
-            }
-        elif msg_type == "markdown":
-            data = {
-                "msgtype": "markdown",
-                "markdown": {
-                    "title": title,
-                    "text": f"## {title}\n\n{content}"
-                }
-            }
-        else:
-            # 默认使用text类型
-            data = {
-                "msgtype": "text",
-                "text": {
-                    "content": f"{title}\n\n{content}"
-                }
-            }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(webhook_url, json=data, timeout=10) as response:
-                result = await response.json()
-                if result.get("errcode") == 0:
-                    print(f"测试钉钉通知发送成功: {result}")
-                    return True
-                else:
-                    print(f"钉钉发送失败: {result}")
-                    return False
-
-    except Exception as e:
-        print(f"发送测试钉钉通知失败: {e}")
-        return False
-
-
-async def _send_test_bark(config: Dict[str, Any]) -> bool:
-    """发送测试Bark通知"""
-    try:
-        device_key = config.get("device_key")
-        server_url = config.get("server_url", "https://api.day.app")
-
-        if not device_key:
-            print("Bark device_key未配置")
-            return False
-
-        # 构建URL
-        url = f"{server_url.rstrip('/')}/{device_key}"
-
-        # 构建测试消息
-        title = "Pinchy系统 - Bark通知测试"
-        content = f"""
-📱 Pinchy系统Bark通知测试
-
-✅ 如果您收到这条消息，说明Bark通知配置成功！
-
-📋 配置信息：
-• Device Key: {device_key[:8]}...{device_key[-8:] if len(device_key) > 16 else device_key}
-• Server URL: {server_url}
-
-⏰ 测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-🎉 您现在可以正常接收任务执行通知了！
-        """.strip()
-
-        # 获取用户配置的参数
-        sound = config.get("sound", "")
-        group = config.get("group", "")
-
-        data = {
-            "title": title,
-            "body": content
-        }
-
-        if sound:
-            data["sound"] = sound
-        if group:
-            data["group"] = group
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, timeout=10) as response:
-                result = await response.json()
-                if result.get("code") == 200:
-                    print(f"测试Bark通知发送成功: {result}")
-                    return True
-                else:
-                    print(f"Bark发送失败: {result}")
-                    return False
-
-    except Exception as e:
-        print(f"发送测试Bark通知失败: {e}")
-        return False
-
-
-async def _send_test_wecom_app(config: Dict[str, Any]) -> bool:
-    """发送测试企业微信应用通知"""
-    try:
-        corp_id = config.get("corp_id")
-        corp_secret = config.get("corp_secret")
-        agent_id = config.get("agent_id")
-        to_user = config.get("to_user", "@all")
-
-        if not corp_id or not corp_secret or not agent_id:
-            print("企业微信应用配置不完整")
-            return False
-
-        # 第一步：获取access_token
-        token_url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={corp_id}&corpsecret={corp_secret}"
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(token_url, timeout=10) as response:
-                token_result = await response.json()
-                if token_result.get("errcode") != 0:
-                    print(f"获取企业微信access_token失败: {token_result}")
-                    return False
-
-                access_token = token_result.get("access_token")
-                if not access_token:
-                    print("企业微信access_token为空")
-                    return False
-
-            # 第二步：发送消息
-            send_url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={access_token}"
-
-            # 构建测试消息
-            title = "Pinchy系统 - 企业微信应用通知测试"
-            content = f"""📱 Pinchy系统企业微信应用通知测试
-
-✅ 如果您收到这条消息，说明企业微信应用通知配置成功！
-
-📋 配置信息：
-• 企业ID: {corp_id}
-• 应用ID: {agent_id}
-• 接收用户: {to_user}
-
-⏰ 测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-🎉 您现在可以正常接收任务执行通知了！"""
-
-            # 获取用户配置的消息类型，默认为text
-            msg_type = config.get("msg_type", "text")
-
-            if msg_type == "text":
-                message_data = {
-                    "touser": to_user,
-                    "msgtype": "text",
-                    "agentid": agent_id,
-                    "text": {
-                        "content": f"{title}\n\n{content}"
-                    }
-                }
-            elif msg_type == "markdown":
-                message_data = {
-                    "touser": to_user,
-                    "msgtype": "markdown",
-                    "agentid": agent_id,
-                    "markdown": {
-                        "content": f"## {title}\n\n{content}"
-                    }
-                }
-            else:
-                # 默认使用text类型
-                message_data = {
-                    "touser": to_user,
-                    "msgtype": "text",
-                    "agentid": agent_id,
-                    "text": {
-                        "content": f"{title}\n\n{content}"
-                    }
-                }
-
-            async with session.post(send_url, json=message_data, timeout=10) as response:
-                result = await response.json()
-                if result.get("errcode") == 0:
-                    print(f"测试企业微信应用通知发送成功: {result}")
-                    return True
-                else:
-                    print(f"企业微信应用发送失败: {result}")
-                    return False
-
-    except Exception as e:
-        print(f"发送测试企业微信应用通知失败: {e}")
-        return False
-
-
-async def _send_wecom_notification(config: Dict[str, Any], title: str, content: str) -> bool:
-    """发送企业微信WebHook通知"""
-    try:
-        webhook_url = config.get("webhook_url")
-
-        if not webhook_url:
-            print("企业微信webhook_url未配置")
-            return False
-
-        # 获取用户配置的消息类型，默认为text
-        msg_type = config.get("msg_type", "text")
-
-        if msg_type == "text":
-            data = {
-                "msgtype": "text",
-                "text": {
-                    "content": f"{title}\n\n{content}"
-                }
-            }
-        elif msg_type == "markdown":
-            data = {
-                "msgtype": "markdown",
-                "markdown": {
-                    "content": f"## {title}\n\n{content}"
-                }
-            }
-        else:
-            # 默认使用text类型
-            data = {
-                "msgtype": "text",
-                "text": {
-                    "content": f"{title}\n\n{content}"
-                }
-            }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(webhook_url, json=data, timeout=10) as response:
-                result = await response.json()
-                if result.get("errcode") == 0:
-                    print(f"企业微信WebHook通知发送成功")
-                    return True
-                else:
-                    print(f"企业微信WebHook发送失败: {result}")
-                    return False
-
-    except Exception as e:
-        print(f"发送企业微信WebHook通知失败: {e}")
-        return False
-
-
-async def _send_wecom_app_notification(config: Dict[str, Any], title: str, content: str) -> bool:
-    """发送企业微信应用通知"""
-    try:
-        corp_id = config.get("corp_id")
-        corp_secret = config.get("corp_secret")
-        agent_id = config.get("agent_id")
-        to_user = config.get("to_user", "@all")
-
-        if not corp_id or not corp_secret or not agent_id:
-            print("企业微信应用配置不完整")
-            return False
-
-        # 第一步：获取access_token
-        token_url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={corp_id}&corpsecret={corp_secret}"
+@router.post("/sendnotify", status_code=202)
+async def sendnotify_push(
+    message: SendNotifyMessage,
+    request: Request,
+    db: Session = Depends(get_db),
+    x_pinchy_notify_token: Optional[str] = Header(None)
+):
+    """SendNotify本地推送入口
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(token_url, timeout=10) as response:
-                token_result = await response.json()
-                if token_result.get("errcode") != 0:
-                    print(f"获取企业微信access_token失败: {token_result}")
-                    return False
+    由脚本中的 SendNotify 客户端调用，凭运行时注入的令牌鉴权，
+    消息写入发件箱后立即返回，实际投递由后台发件箱完成。
+    """
+    client_host = request.client.host if request.client else None
+    if client_host not in _LOOPBACK_HOSTS:
+        raise HTTPException(status_code=403, detail="仅允许本机访问")
 
-                access_token = token_result.get("access_token")
-                if not access_token:
-                    print("企业微信access_token为空")
-                    return False
+    source = sendnotify_tokens.resolve(x_pinchy_notify_token)
+    if not source:
+        raise HTTPException(status_code=401, detail="SendNotify令牌无效或已过期")
 
-            # 第二步：发送消息
-            send_url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={access_token}"
+    config = db.query(SystemConfig).filter(
+        SystemConfig.config_key == "sendnotify_notification_type"
+    ).first()
+    notification_type = config.config_value if config else None
+    if not notification_type:
+        raise HTTPException(status_code=400, detail="SendNotify未配置通知方式，请在通知服务页面配置")
 
-            # 获取用户配置的消息类型，默认为text
-            msg_type = config.get("msg_type", "text")
+    if not notification_route_cache.get_channel_config(notification_type):
+        raise HTTPException(status_code=400, detail=f"通知配置 {notification_type} 不存在或未激活")
 
-            if msg_type == "text":
-                message_data = {
-                    "touser": to_user,
-                    "msgtype": "text",
-                    "agentid": agent_id,
-                    "text": {
-                        "content": f"{title}\n\n{content}"
-                    }
-                }
-            elif msg_type == "markdown":
-                message_data = {
-                    "touser": to_user,
-                    "msgtype": "markdown",
-                    "agentid": agent_id,
-                    "markdown": {
-                        "content": f"## {title}\n\n{content}"
-                    }
-                }
-            else:
-                # 默认使用text类型
-                message_data = {
-                    "touser": to_user,
-                    "msgtype": "text",
-                    "agentid": agent_id,
-                    "text": {
-                        "content": f"{title}\n\n{content}"
-                    }
-                }
+    content = message.content or message.title
+    if sendnotify_tokens.is_duplicate(source, message.title, content):
+        return {"message": "跳过重复通知", "duplicate": True}
 
-            async with session.post(send_url, json=message_data, timeout=10) as response:
-                result = await response.json()
-                if result.get("errcode") == 0:
-                    print(f"企业微信应用通知发送成功")
-                    return True
-                else:
-                    print(f"企业微信应用发送失败: {result}")
-                    return False
+    item_id = notification_outbox.enqueue(notification_type, message.title, content, source=source)
+    if item_id is None:
+        raise HTTPException(status_code=500, detail="写入通知发件箱失败")
 
-    except Exception as e:
-        print(f"发送企业微信应用通知失败: {e}")
-        return False
+    return {"message": "通知已加入发送队列", "outbox_id": item_id}
@@ -1,20 +1,37 @@
 """
 包管理相关路由
 """
+import os
+import uuid
+import itertools
+import platform
 import subprocess
 import json
 import asyncio
-from typing import List, Optional
+from typing import Dict, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from app.database import get_db
+from packaging.requirements import Requirement, InvalidRequirement
+from app.database import get_db, SessionLocal
 from app.auth import get_current_user
 from app.models import User, PackageInfo, SystemConfig
 from app.websocket_manager import websocket_manager
+from app.package_inventory import python_packages, node_packages, detect_docker_environment, iter_requirement_lines
 
 router = APIRouter(prefix="/api/packages", tags=["包管理"])
 
+# 包安装配置
+PACKAGE_CACHE_DIR = os.getenv("PACKAGE_CACHE_DIR", "data/package-cache")  # pip/npm/yarn 下载缓存目录，重建环境时复用
+PACKAGE_BATCH_CONCURRENCY = int(os.getenv("PACKAGE_BATCH_CONCURRENCY", "2"))  # 批量安装时同时运行的包管理器进程数上限
+
+# 批量安装的并发上限；同一类型的包管理器同时只运行一个，避免并发写同一个环境
+# 首次使用时在事件循环中创建
+package_batch_semaphore: Optional[asyncio.Semaphore] = None
+package_batch_locks: Dict[str, asyncio.Lock] = {}
+# 批量安装消息序号
+package_batch_sequence = itertools.count(1)
+
 class PackageInstall(BaseModel):
     package_type: str  # python 或 nodejs
     package_name: str
@@ -34,6 +51,11 @@ class InstalledPackage(BaseModel):
     name: str
     version: str
 
+class BatchPackageInstall(BaseModel):
+    python_packages: List[str] = []  # requirements格式，如 requests>=2.31
+    nodejs_packages: List[str] = []  # 如 axios 或 axios@^1.6.0
+    requirement_files: List[str] = []  # scripts目录下的 requirements.txt 或 package.json
+
 def get_package_manager_config(db: Session, package_type: str) -> str:
     """从数据库获取包管理器配置"""
     try:
@@ -49,12 +71,23 @@ def get_package_manager_config(db: Session, package_type: str) -> str:
         # 返回默认包管理器
         return "pip" if package_type == "python" else "npm"
 
+def get_package_cache_args(manager: str) -> List[str]:
+    """包管理器的持久下载缓存参数，单个安装和批量安装共用同一缓存"""
+    cache_dir = os.path.abspath(PACKAGE_CACHE_DIR)
+    if manager == "pip":
+        return ["--cache-dir", os.path.join(cache_dir, "pip")]
+    if manager == "npm":
+        return ["--cache", os.path.join(cache_dir, "npm")]
+    if manager == "yarn":
+        return ["--cache-folder", os.path.join(cache_dir, "yarn")]
+    return []
+
 def get_package_manager_commands(manager: str, package_type: str, action: str, package_name: str, version: Optional[str] = None) -> List[str]:
     """根据包管理器类型生成命令"""
     if package_type == "python":
         if manager == "pip":
             if action == "install":
-                cmd = ["pip", "install"]
+                cmd = ["pip", "install"] + get_package_cache_args(manager)
                 if version:
                     cmd.append(f"{package_name}=={version}")
                 else:
@@ -95,7 +128,7 @@ def get_package_manager_commands(manager: str, package_type: str, action: str, p
     elif package_type == "nodejs":
         if manager == "npm":
             if action == "install":
-                cmd = ["npm", "install", "-g"]
+                cmd = ["npm", "install", "-g"] + get_package_cache_args(manager)
                 if version:
                     cmd.append(f"{package_name}@{version}")
                 else:
@@ -108,7 +141,7 @@ def get_package_manager_commands(manager: str, package_type: str, action: str, p
                 raise ValueError(f"不支持的操作: {action}")
         elif manager == "yarn":
             if action == "install":
-                cmd = ["yarn", "global", "add"]
+                cmd = ["yarn", "global", "add"] + get_package_cache_args(manager)
                 if version:
                     cmd.append(f"{package_name}@{version}")
                 else:
@@ -139,6 +172,62 @@ def get_package_manager_commands(manager: str, package_type: str, action: str, p
 
     return cmd
 
+def get_batch_install_command(manager: str, package_type: str, packages: List[str], requirement_files: List[str]) -> List[str]:
+    """生成一次安装多个包的命令；只有pip直接读取requirements文件，其他管理器使用展开后的包列表"""
+    if package_type == "python":
+        if manager == "pip":
+            cmd = ["pip", "install"] + get_package_cache_args(manager) + packages
+            for requirement_file in requirement_files:
+                cmd.extend(["-r", requirement_file])
+            return cmd
+        if manager == "conda":
+            return ["conda", "install", "-y"] + packages
+        if manager == "poetry":
+            return ["poetry", "add"] + packages
+        raise ValueError(f"不支持的Python包管理器: {manager}")
+    if package_type == "nodejs":
+        if manager == "npm":
+            return ["npm", "install", "-g"] + get_package_cache_args(manager) + packages
+        if manager == "yarn":
+            return ["yarn", "global", "add"] + get_package_cache_args(manager) + packages
+        if manager == "pnpm":
+            return ["pnpm", "add", "-g"] + packages
+        raise ValueError(f"不支持的Node.js包管理器: {manager}")
+    raise ValueError(f"不支持的包类型: {package_type}")
+
+def resolve_requirement_file(path: str) -> str:
+    """把依赖文件路径解析为scripts目录内的绝对路径"""
+    scripts_dir = os.path.abspath("scripts")
+    full_path = os.path.abspath(path if os.path.isabs(path) else os.path.join(scripts_dir, path))
+    if os.path.commonpath([scripts_dir, full_path]) != scripts_dir:
+        raise HTTPException(status_code=400, detail=f"依赖文件必须位于scripts目录内: {path}")
+    if not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail=f"依赖文件不存在: {path}")
+    return full_path
+
+def read_package_json_dependencies(path: str) -> List[str]:
+    """读取package.json的dependencies，转换为 名称@版本范围 列表"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            dependencies = json.load(f).get("dependencies") or {}
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"读取package.json失败: {str(e)}")
+    return [f"{name}@{spec}" if spec else name for name, spec in dependencies.items()]
+
+def split_package_spec(package_type: str, spec: str) -> tuple[str, Optional[str]]:
+    """从包要求中拆出包名和固定版本，用于记录安装历史"""
+    if package_type == "nodejs":
+        # 作用域包以@开头，如 @types/node@20.0.0
+        index = spec.find('@', 1)
+        return (spec, None) if index == -1 else (spec[:index], spec[index + 1:] or None)
+    try:
+        requirement = Requirement(spec)
+    except InvalidRequirement:
+        return spec, None
+    specs = list(requirement.specifier)
+    version = specs[0].version if len(specs) == 1 and specs[0].operator == '==' else None
+    return requirement.name, version
+
 async def run_command(cmd: List[str]) -> tuple[int, str, str]:
     """执行命令并返回结果"""
     try:
@@ -157,12 +246,12 @@ async def install_package_with_websocket(package_data: PackageInstall, db: Sessi
     """异步安装包并通过WebSocket发送实时日志"""
     try:
         # 发送安装开始消息
-        await websocket_manager.broadcast({
+        await websocket_manager.publish({
             "type": "package_install_start",
             "package_type": package_data.package_type,
             "package_name": package_data.package_name,
             "version": package_data.version
-        }, "global")
+        }, ["packages"])
 
         # 获取配置的包管理器
         package_manager = get_package_manager_config(db, package_data.package_type)
@@ -202,10 +291,10 @@ async def install_package_with_websocket(package_data: PackageInstall, db: Sessi
 
         # 发送命令信息到WebSocket
         cmd_display = cmd_str if is_windows and package_data.package_type == "nodejs" else ' '.join(cmd)
-        await websocket_manager.broadcast({
+        await websocket_manager.publish({
             "type": "package_install_output",
             "output": f"执行命令: {cmd_display}"
-        }, "global")
+        }, ["packages"])
 
         # 实时读取输出
         while True:
@@ -218,10 +307,10 @@ async def install_package_with_websocket(package_data: PackageInstall, db: Sessi
             output = line.decode('utf-8', errors='ignore').strip()
             if output:
                 # 发送输出到WebSocket
-                await websocket_manager.broadcast({
+                await websocket_manager.publish({
                     "type": "package_install_output",
                     "output": output
-                }, "global")
+                }, ["packages"])
 
         # 等待进程完成
         await process.wait()
@@ -238,37 +327,44 @@ async def install_package_with_websocket(package_data: PackageInstall, db: Sessi
             db.add(package_info)
             db.commit()
 
+        # 更新包清单后再通知前端，前端收到完成消息后刷新列表即可读到新版本
+        if package_data.package_type == "python":
+            # 安装可能同时升级或新增了依赖包，重新扫描整个环境
+            await asyncio.to_thread(python_packages.refresh)
+        elif success:
+            await node_packages.update_package(package_data.package_name)
+
         # 发送完成消息
-        await websocket_manager.broadcast({
+        await websocket_manager.publish({
             "type": "package_install_complete",
             "success": success,
             "package_type": package_data.package_type,
             "package_name": package_data.package_name
-        }, "global")
+        }, ["packages"])
 
     except Exception as e:
         # 发送错误消息
-        await websocket_manager.broadcast({
+        await websocket_manager.publish({
             "type": "package_install_output",
             "output": f"安装过程中发生错误: {str(e)}"
-        }, "global")
+        }, ["packages"])
 
-        await websocket_manager.broadcast({
+        await websocket_manager.publish({
             "type": "package_install_complete",
             "success": False,
             "package_type": package_data.package_type,
             "package_name": package_data.package_name
-        }, "global")
+        }, ["packages"])
 
 async def uninstall_package_with_websocket(package_type: str, package_name: str, db: Session):
     """异步卸载包并通过WebSocket发送实时日志"""
     try:
         # 发送卸载开始消息
-        await websocket_manager.broadcast({
+        await websocket_manager.publish({
             "type": "package_uninstall_start",
             "package_type": package_type,
             "package_name": package_name
-        }, "global")
+        }, ["packages"])
 
         # 获取配置的包管理器
         package_manager = get_package_manager_config(db, package_type)
@@ -316,10 +412,10 @@ async def uninstall_package_with_websocket(package_type: str, package_name: str,
             output = line.decode('utf-8', errors='ignore').strip()
             if output:
                 # 发送输出到WebSocket
-                await websocket_manager.broadcast({
+                await websocket_manager.publish({
                     "type": "package_uninstall_output",
                     "output": output
-                }, "global")
+                }, ["packages"])
 
         # 等待进程完成
         await process.wait()
@@ -336,62 +432,163 @@ async def uninstall_package_with_websocket(package_type: str, package_name: str,
                 db.delete(package_info)
                 db.commit()
 
+        if package_type == "python":
+            await asyncio.to_thread(python_packages.refresh)
+        elif success:
+            node_packages.remove_package(package_name)
+
         # 发送完成消息
-        await websocket_manager.broadcast({
+        await websocket_manager.publish({
             "type": "package_uninstall_complete",
             "success": success,
             "package_type": package_type,
             "package_name": package_name
-        }, "global")
+        }, ["packages"])
 
     except Exception as e:
         # 发送错误消息
-        await websocket_manager.broadcast({
+        await websocket_manager.publish({
             "type": "package_uninstall_output",
             "output": f"卸载过程中发生错误: {str(e)}"
-        }, "global")
+        }, ["packages"])
 
-        await websocket_manager.broadcast({
+        await websocket_manager.publish({
             "type": "package_uninstall_complete",
             "success": False,
             "package_type": package_type,
             "package_name": package_name
-        }, "global")
+        }, ["packages"])
+
+async def publish_batch_message(batch_id: str, message: dict):
+    """推送批量安装消息，附带批次ID和递增序号，前端据此区分内容相同的输出行"""
+    message["batch_id"] = batch_id
+    message["seq"] = next(package_batch_sequence)
+    await websocket_manager.publish(message, ["packages"])
+
+async def run_batch_group(batch_id: str, package_type: str, manager: str,
+                          packages: List[str], requirement_files: List[str], history: List[str]) -> bool:
+    """执行一组（同一包类型）批量安装，输出带上批次和包类型推送到WebSocket"""
+    global package_batch_semaphore
+    if package_batch_semaphore is None:
+        package_batch_semaphore = asyncio.Semaphore(max(1, PACKAGE_BATCH_CONCURRENCY))
+    type_lock = package_batch_locks.setdefault(package_type, asyncio.Lock())
+
+    success = False
+    try:
+        async with package_batch_semaphore, type_lock:
+            cmd = get_batch_install_command(manager, package_type, packages, requirement_files)
+            is_windows = platform.system().lower() == 'windows'
+            await publish_batch_message(batch_id, {
+                "type": "package_batch_output",
+                "package_type": package_type,
+                "output": f"执行命令: {' '.join(cmd)}"
+            })
+
+            # 在Windows上，Node.js包管理器需要通过shell执行
+            if is_windows and package_type == "nodejs":
+                process = await asyncio.create_subprocess_shell(
+                    ' '.join(cmd),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
+                    cwd=os.getcwd()
+                )
+            else:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
+                    cwd=os.getcwd()
+                )
+
+            while process.stdout is not None:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                output = line.decode('utf-8', errors='ignore').strip()
+                if output:
+                    await publish_batch_message(batch_id, {
+                        "type": "package_batch_output",
+                        "package_type": package_type,
+                        "output": output
+                    })
+
+            await process.wait()
+            success = process.returncode == 0
+
+        if success:
+            record_package_history(package_type, history)
+
+        # 批量安装可能涉及大量依赖，直接重新收集对应的包清单
+        if package_type == "python":
+            await asyncio.to_thread(python_packages.refresh)
+        elif success:
+            await node_packages.refresh()
+
+    except Exception as e:
+        await publish_batch_message(batch_id, {
+            "type": "package_batch_output",
+            "package_type": package_type,
+            "output": f"安装过程中发生错误: {str(e)}"
+        })
+
+    await publish_batch_message(batch_id, {
+        "type": "package_batch_complete",
+        "package_type": package_type,
+        "success": success
+    })
+    return success
+
+def record_package_history(package_type: str, specs: List[str]):
+    """把批量安装中明确列出的包写入安装历史"""
+    db = SessionLocal()
+    try:
+        for spec in specs:
+            package_name, version = split_package_spec(package_type, spec)
+            db.add(PackageInfo(package_type=package_type, package_name=package_name, version=version))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"记录批量安装历史失败: {str(e)}")
+    finally:
+        db.close()
+
+async def install_packages_batch(batch_id: str, groups: List[dict]):
+    """按包类型并行执行批量安装，全部结束后推送汇总结果"""
+    await publish_batch_message(batch_id, {
+        "type": "package_batch_start",
+        "groups": [
+            {"package_type": group["package_type"], "manager": group["manager"], "count": len(group["history"])}
+            for group in groups
+        ]
+    })
+
+    results = await asyncio.gather(*(
+        run_batch_group(
+            batch_id,
+            group["package_type"],
+            group["manager"],
+            group["packages"],
+            group["requirement_files"],
+            group["history"]
+        )
+        for group in groups
+    ))
+
+    await publish_batch_message(batch_id, {
+        "type": "package_batch_finish",
+        "success": all(results),
+        "results": {group["package_type"]: result for group, result in zip(groups, results)}
+    })
 
 @router.get("/python/list", response_model=List[InstalledPackage])
 async def list_python_packages(current_user: User = Depends(get_current_user)):
     """列出已安装的Python包"""
     try:
-        result = subprocess.run(
-            ["pip", "list", "--format=json"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        packages_data = json.loads(result.stdout)
-        return [
-            InstalledPackage(name=pkg["name"], version=pkg["version"])
-            for pkg in packages_data
-        ]
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"获取Python包列表失败: {e.stderr}")
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="解析Python包列表失败")
+        packages = await asyncio.to_thread(python_packages.list_packages)
+        return [InstalledPackage(name=name, version=version) for name, version in packages]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取Python包列表失败: {str(e)}")
 
-def detect_docker_environment():
-    """检测是否在Docker环境中运行"""
-    import os
-    try:
-        return (
-            os.path.exists('/.dockerenv') or
-            os.environ.get('DOCKER_CONTAINER') == 'true' or
-            (os.path.exists('/proc/1/cgroup') and 'docker' in open('/proc/1/cgroup').read())
-        )
-    except Exception:
-        return False
-
 def get_npm_global_paths():
     """获取npm全局安装路径"""
     import subprocess
@@ -446,177 +643,31 @@ def get_npm_global_paths():
 
 @router.get("/nodejs/list", response_model=List[InstalledPackage])
 async def list_nodejs_packages(current_user: User = Depends(get_current_user)):
-    """列出已安装的Node.js包"""
-    import platform
-    import os
-    is_windows = platform.system().lower() == 'windows'
-    is_docker = detect_docker_environment()
-
-    packages = []
-
+    """列出已安装的Node.js包（读取内存中的包清单）"""
     try:
-        # 方法1: 使用 npm list -g --json --depth=0
-        result = subprocess.run(
-            ["npm", "list", "-g", "--json", "--depth=0"],
-            capture_output=True,
-            text=True,
-            timeout=30,
-            shell=is_windows
-        )
-
-        # npm list 命令即使成功也可能返回非0状态码（如果有警告）
-        if result.stdout and result.stdout.strip():
-            try:
-                packages_data = json.loads(result.stdout)
-                dependencies = packages_data.get("dependencies", {})
-                packages.extend([
-                    InstalledPackage(name=name, version=info.get("version", "unknown") if isinstance(info, dict) else str(info))
-                    for name, info in dependencies.items()
-                ])
-
-                # 如果成功获取到包，记录调试信息
-                if packages:
-                    print(f"✓ 通过npm list获取到 {len(packages)} 个包")
-
-            except json.JSONDecodeError as e:
-                print(f"JSON解析失败: {e}")
-                pass  # 如果JSON解析失败，继续尝试其他方法
-
-        # 方法2: 如果JSON方法失败或没有获取到包，尝试使用简单的 npm list -g
-        if not packages:
-            print("尝试使用文本格式获取包列表...")
-            try:
-                result = subprocess.run(
-                    ["npm", "list", "-g", "--depth=0"],
-                    capture_output=True,
-                    timeout=30,
-                    shell=is_windows,
-                    encoding='utf-8',
-                    errors='ignore'  # 忽略编码错误
-                )
-            except Exception as e:
-                print(f"文本格式命令执行失败: {e}")
-                result = None
-
-            if result and result.stdout:
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    # 处理格式如: +-- package-name@version 或 `-- package-name@version
-                    if line and '@' in line:
-                        # 移除前缀符号
-                        if line.startswith(('+--', '`--', '├──', '└──')):
-                            line = line[3:].strip()
-                        elif line.startswith('│'):
-                            continue  # 跳过树形结构的连接线
-
-                        # 跳过npm自身和一些系统包（但保留用户安装的包）
-                        if any(skip in line.lower() for skip in ['npm@', 'node@']):
-                            continue
-
-                        # 解析包名和版本
-                        if '@' in line:
-                            parts = line.split('@')
-                            if len(parts) >= 2:
-                                name = '@'.join(parts[:-1]) if parts[0] == '' else parts[0]
-                                version = parts[-1]
-                                # 清理包名中的特殊字符
-                                name = name.strip(' ├└│─`+')
-                                if name and version:
-                                    packages.append(InstalledPackage(name=name, version=version))
-
-                if packages:
-                    print(f"✓ 通过文本解析获取到 {len(packages)} 个包")
-
-        # 方法3: 在Docker环境下，直接扫描node_modules目录
-        if is_docker and not packages:
-            print("Docker环境下尝试直接扫描node_modules目录...")
-            npm_paths = get_npm_global_paths()
-
-            for npm_path in npm_paths:
-                if os.path.exists(npm_path):
-                    print(f"扫描路径: {npm_path}")
-                    try:
-                        for item in os.listdir(npm_path):
-                            item_path = os.path.join(npm_path, item)
-                            if os.path.isdir(item_path) and not item.startswith('.'):
-                                # 跳过npm自身和一些系统包
-                                if item in ['npm', 'node']:
-                                    continue
-
-                                # 尝试读取package.json获取版本信息
-                                package_json_path = os.path.join(item_path, 'package.json')
-                                version = "unknown"
-                                if os.path.exists(package_json_path):
-                                    try:
-                                        with open(package_json_path, 'r', encoding='utf-8') as f:
-                                            package_info = json.load(f)
-                                            version = package_info.get('version', 'unknown')
-                                    except Exception:
-                                        pass
-
-                                # 检查是否已经在列表中
-                                if not any(pkg.name == item for pkg in packages):
-                                    packages.append(InstalledPackage(name=item, version=version))
-                    except Exception as e:
-                        print(f"扫描目录 {npm_path} 失败: {e}")
-
-            if packages:
-                print(f"✓ 通过目录扫描获取到 {len(packages)} 个包")
-
-        # 方法4: 尝试获取本地安装的包（如果存在package.json）
-        try:
-            if os.path.exists("package.json"):
-                print("检测到package.json，尝试获取本地包...")
-                result = subprocess.run(
-                    ["npm", "list", "--json", "--depth=0"],
-                    capture_output=True,
-                    text=True,
-                    timeout=30,
-                    shell=is_windows
-                )
-
-                if result.stdout and result.stdout.strip():
-                    try:
-                        local_packages_data = json.loads(result.stdout)
-                        local_dependencies = local_packages_data.get("dependencies", {})
-                        local_count = 0
-                        # 添加本地包，但标记为本地安装
-                        for name, info in local_dependencies.items():
-                            version = info.get("version", "unknown") if isinstance(info, dict) else str(info)
-                            # 检查是否已经在全局包列表中
-                            if not any(pkg.name == name for pkg in packages):
-                                packages.append(InstalledPackage(name=f"{name} (本地)", version=version))
-                                local_count += 1
-
-                        if local_count > 0:
-                            print(f"✓ 获取到 {local_count} 个本地包")
-                    except json.JSONDecodeError:
-                        pass
-        except Exception:
-            pass  # 忽略本地包获取错误
-
-        # 输出最终结果
-        print(f"最终获取到 {len(packages)} 个Node.js包")
-        if packages:
-            print("包列表:")
-            for pkg in packages[:10]:  # 只显示前10个
-                print(f"  - {pkg.name}@{pkg.version}")
-            if len(packages) > 10:
-                print(f"  ... 还有 {len(packages) - 10} 个包")
-
-        return packages
-
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=500, detail="获取Node.js包列表超时")
-    except FileNotFoundError:
-        # 返回空列表而不是抛出异常，这样前端可以正常显示
-        return []
+        packages = await node_packages.get_packages()
+        return [InstalledPackage(name=name, version=version) for name, version in packages]
     except Exception as e:
         # 记录错误但返回空列表
         print(f"获取Node.js包列表时发生错误: {str(e)}")
         return []
 
+@router.post("/refresh")
+async def refresh_packages(
+    package_type: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """重新收集已安装包清单，不指定类型时同时刷新Python和Node.js"""
+    if package_type not in (None, "python", "nodejs"):
+        raise HTTPException(status_code=400, detail="包类型必须是 python 或 nodejs")
+
+    result = {}
+    if package_type in (None, "python"):
+        result["python_count"] = await asyncio.to_thread(python_packages.refresh)
+    if package_type in (None, "nodejs"):
+        result["nodejs_count"] = await node_packages.refresh()
+    return {"message": "包列表已刷新", **result}
+
 @router.post("/install")
 async def install_package(
     package_data: PackageInstall,
@@ -658,6 +709,64 @@ async def install_package(
 
     return {"message": "包安装已开始，请查看实时日志"}
 
+@router.post("/batch-install")
+async def batch_install_packages(
+    batch_data: BatchPackageInstall,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """批量安装包：每种包类型只启动一次包管理器，Python和Node.js并行安装"""
+    python_specs = [spec.strip() for spec in batch_data.python_packages if spec.strip()]
+    nodejs_specs = [spec.strip() for spec in batch_data.nodejs_packages if spec.strip()]
+    python_files: List[str] = []
+    python_file_specs: List[str] = []
+
+    for path in batch_data.requirement_files:
+        full_path = resolve_requirement_file(path)
+        if os.path.basename(full_path) == "package.json":
+            nodejs_specs.extend(read_package_json_dependencies(full_path))
+        else:
+            python_files.append(full_path)
+            with open(full_path, 'r', encoding='utf-8') as f:
+                python_file_specs.extend(iter_requirement_lines(f.read()))
+
+    groups = []
+    if python_specs or python_files:
+        manager = get_package_manager_config(db, "python")
+        # pip 直接读取requirements文件以保留其中的索引地址、-r 引用等选项，其他管理器使用展开后的包列表
+        packages = python_specs if manager == "pip" else python_specs + python_file_specs
+        requirement_files = python_files if manager == "pip" else []
+        if packages or requirement_files:
+            groups.append({
+                "package_type": "python",
+                "manager": manager,
+                "packages": packages,
+                "requirement_files": requirement_files,
+                "history": python_specs + python_file_specs
+            })
+    if nodejs_specs:
+        groups.append({
+            "package_type": "nodejs",
+            "manager": get_package_manager_config(db, "nodejs"),
+            "packages": nodejs_specs,
+            "requirement_files": [],
+            "history": nodejs_specs
+        })
+
+    if not groups:
+        raise HTTPException(status_code=400, detail="没有需要安装的包")
+
+    batch_id = uuid.uuid4().hex[:12]
+    background_tasks.add_task(install_packages_batch, batch_id, groups)
+
+    return {
+        "message": "批量安装已开始，请查看实时日志",
+        "batch_id": batch_id,
+        "python_count": len(python_specs) + len(python_file_specs),
+        "nodejs_count": len(nodejs_specs)
+    }
+
 @router.delete("/uninstall")
 async def uninstall_package(
     package_type: str,
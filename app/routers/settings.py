@@ -20,12 +20,15 @@ from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from pydantic import BaseModel
-from app.database import get_db
-from app.auth import get_current_user, get_password_hash, verify_password
+from app.database import get_db, create_tables
+from app.auth import get_current_user, get_password_hash, verify_password, auth_cache
 from app.models import User, SystemVersion, SystemUUID, SystemConfig, TaskLog, NotificationConfig, EnvironmentVariable
 from app.security import security_manager
 from app.version import get_current_version, get_version_description, get_version_info, is_newer_version
-from app.timezone_utils import get_available_timezones, get_timezone_offset, validate_timezone, get_system_timezone, set_system_timezone
+from app.timezone_utils import get_available_timezones, get_timezone_offset, validate_timezone, get_system_timezone, set_system_timezone, timezone_cache
+from app.notification_service import notification_route_cache
+from app.api_debug_template import env_snapshot
+from app.api_monitor import api_monitor
 
 router = APIRouter(prefix="/api/settings", tags=["系统设置"])
 
@@ -190,6 +193,7 @@ async def change_password(
     # 更新密码
     current_user.password_hash = get_password_hash(password_data.new_password)
     db.commit()
+    auth_cache.invalidate_user()
     
     return {"message": "密码修改成功"}
 
@@ -215,6 +219,7 @@ async def change_username(
     # 更新用户名
     current_user.username = username_data.new_username
     db.commit()
+    auth_cache.invalidate_user()
     
     return {"message": "用户名修改成功"}
 
@@ -299,6 +304,7 @@ async def update_color_scheme(
     # 更新配色方案
     current_user.color_scheme = color_data.color_scheme
     db.commit()
+    auth_cache.invalidate_user()
 
     return {"message": "配色方案更新成功", "color_scheme": color_data.color_scheme}
 
@@ -377,6 +383,7 @@ def create_or_update_system_env_var(db: Session, key: str, value: str, descripti
             print(f"已创建系统环境变量: {key}")
 
         db.commit()
+        env_snapshot.invalidate()
         db.refresh(env_var)
         return env_var
     except Exception as e:
@@ -1391,6 +1398,16 @@ async def import_backup(
                 tables_restored = await restore_database(db, db_backup_path)
                 print(f"✅ 已恢复数据库，共 {tables_restored} 个表")
 
+                # 旧版本备份可能缺少新增的表和字段
+                create_tables()
+
+                # 数据库已被替换，清理内存中的配置缓存
+                timezone_cache.invalidate()
+                auth_cache.invalidate_all()
+                notification_route_cache.invalidate()
+                env_snapshot.invalidate()
+                api_monitor.reload_all()
+
             return RestoreResponse(
                 message="备份恢复成功，系统将自动注销以刷新会话",
                 files_restored=files_restored,
@@ -3,28 +3,61 @@
 """
 import os
 import stat
+import mmap
 import hashlib
 import shutil
 import subprocess
 import asyncio
 import fnmatch
+import json
 import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
 from app.database import get_db
 from app.auth import get_current_user
-from app.models import User, ScriptSubscription, SubscriptionFile, SubscriptionLog, NotificationConfig
+from app.models import User, ScriptSubscription, SubscriptionFile, SubscriptionLog, SubscriptionSyncState, NotificationConfig
 from app.scheduler import task_scheduler
 from app.notification_service import notification_service
 from app.routers.settings import get_system_config, set_system_config
 from app.websocket_manager import websocket_manager
+from app.package_inventory import python_packages
 
 router = APIRouter(prefix="/api/subscriptions", tags=["subscriptions"])
 
+# 订阅文件哈希配置
+SUBSCRIPTION_HASH_WORKERS = int(os.getenv("SUBSCRIPTION_HASH_WORKERS", "4"))  # 并行计算哈希的线程数
+SUBSCRIPTION_HASH_BUFFER_SIZE = int(os.getenv("SUBSCRIPTION_HASH_BUFFER_SIZE", str(1024 * 1024)))  # 读取缓冲区大小（字节）
+SUBSCRIPTION_MMAP_THRESHOLD = int(os.getenv("SUBSCRIPTION_MMAP_THRESHOLD", str(16 * 1024 * 1024)))  # 超过该大小的文件使用mmap读取，0表示不使用
+
+# 订阅同步配置
+SUBSCRIPTION_SYNC_CONCURRENCY = int(os.getenv("SUBSCRIPTION_SYNC_CONCURRENCY", "3"))  # 同时同步的订阅数量
+SUBSCRIPTION_GIT_TIMEOUT = int(os.getenv("SUBSCRIPTION_GIT_TIMEOUT", "300"))  # Git克隆/拉取超时时间（秒）
+SUBSCRIPTION_PROGRESS_INTERVAL = 0.5  # Git输出进度推送的最小间隔（秒）
+SUBSCRIPTION_CLONE_DEPTH = int(os.getenv("SUBSCRIPTION_CLONE_DEPTH", "1"))  # 克隆/拉取的提交历史深度，0表示完整历史
+SUBSCRIPTION_PARTIAL_CLONE = os.getenv("SUBSCRIPTION_PARTIAL_CLONE", "true").lower() == "true"  # 是否使用blobless部分克隆，只下载检出需要的文件内容
+SUBSCRIPTION_SPARSE_CHECKOUT = os.getenv("SUBSCRIPTION_SPARSE_CHECKOUT", "true").lower() == "true"  # 是否按订阅的过滤条件只检出需要的文件
+SUBSCRIPTION_SPARSE_EXTRA_FILES = ["requirements.txt"]  # 按扩展名过滤时仍需检出的根目录文件（依赖检查使用）
+SUBSCRIPTION_MIRROR_CACHE = os.getenv("SUBSCRIPTION_MIRROR_CACHE", "true").lower() == "true"  # 是否通过共享的本地镜像仓库同步订阅
+SUBSCRIPTION_MIRROR_DIR = os.getenv("SUBSCRIPTION_MIRROR_DIR", "data/git-mirrors")  # 镜像仓库存放目录
+SUBSCRIPTION_MIRROR_FETCH_INTERVAL = int(os.getenv("SUBSCRIPTION_MIRROR_FETCH_INTERVAL", "30"))  # 同一镜像在该时间内（秒）只从远程获取一次
+SUBSCRIPTION_REMOTE_PRECHECK = os.getenv("SUBSCRIPTION_REMOTE_PRECHECK", "true").lower() == "true"  # 定时同步前是否先用 git ls-remote 检查远程是否有更新
+
+# 自动创建任务的定时配置
+DEFAULT_TASK_CRON = "0 3 * * *"  # 未设置模板时的定时表达式（每天凌晨3点）
+CRON_FIELD_RANGES = {
+    5: [(0, 59), (0, 23), (1, 28), (1, 12), (0, 6)],  # 分 时 日 月 周
+    6: [(0, 59), (0, 59), (0, 23), (1, 28), (1, 12), (0, 6)]  # 秒 分 时 日 月 周
+}
+
 # Pydantic模型
 class SubscriptionCreate(BaseModel):
     name: str
@@ -41,6 +74,7 @@ class SubscriptionCreate(BaseModel):
     notification_enabled: bool = False
     notification_type: Optional[str] = None
     auto_create_tasks: bool = False
+    task_cron_template: Optional[str] = None
 
 class SubscriptionUpdate(BaseModel):
     name: Optional[str] = None
@@ -57,6 +91,7 @@ class SubscriptionUpdate(BaseModel):
     notification_enabled: Optional[bool] = None
     notification_type: Optional[str] = None
     auto_create_tasks: Optional[bool] = None
+    task_cron_template: Optional[str] = None
     is_active: Optional[bool] = None
 
 class SubscriptionResponse(BaseModel):
@@ -75,8 +110,11 @@ class SubscriptionResponse(BaseModel):
     notification_enabled: bool
     notification_type: Optional[str]
     auto_create_tasks: bool
+    task_cron_template: Optional[str] = None
     is_active: bool
     last_sync_time: Optional[datetime]
+    last_check_time: Optional[datetime] = None
+    unchanged_count: Optional[int] = 0
     created_at: datetime
     updated_at: Optional[datetime]
     has_requirements: Optional[bool] = None
@@ -224,8 +262,11 @@ async def get_subscriptions(
             "notification_enabled": subscription.notification_enabled,
             "notification_type": subscription.notification_type,
             "auto_create_tasks": getattr(subscription, 'auto_create_tasks', False),
+            "task_cron_template": subscription.task_cron_template,
             "is_active": subscription.is_active,
             "last_sync_time": subscription.last_sync_time,
+            "last_check_time": subscription.last_check_time,
+            "unchanged_count": subscription.unchanged_count or 0,
             "created_at": subscription.created_at,
             "updated_at": subscription.updated_at
         }
@@ -252,6 +293,8 @@ async def create_subscription(
     
     if not save_path.startswith(scripts_dir):
         raise HTTPException(status_code=400, detail="保存目录必须在scripts目录下")
+
+    validate_task_cron_template(subscription.task_cron_template)
     
     # 如果没有指定保存目录，根据Git URL自动生成
     if not subscription.save_directory:
@@ -296,6 +339,7 @@ async def update_subscription(
     
     # 更新字段
     update_data = subscription_update.dict(exclude_unset=True)
+    validate_task_cron_template(update_data.get("task_cron_template"))
     for field, value in update_data.items():
         setattr(subscription, field, value)
     
@@ -327,6 +371,7 @@ async def delete_subscription(
     
     # 删除相关文件记录
     db.query(SubscriptionFile).filter(SubscriptionFile.subscription_id == subscription_id).delete()
+    db.query(SubscriptionSyncState).filter(SubscriptionSyncState.subscription_id == subscription_id).delete()
     
     # 删除订阅记录
     db.delete(subscription)
@@ -345,9 +390,10 @@ async def sync_subscription(
     if not subscription:
         raise HTTPException(status_code=404, detail="订阅不存在")
     
-    # 执行同步
-    await execute_subscription_sync(subscription_id, db)
-    
+    # 在后台执行同步，进度和结果通过WebSocket推送
+    if not subscription_sync_executor.submit(subscription_id):
+        return {"message": "订阅正在同步中"}
+
     return {"message": "同步已开始"}
 
 @router.get("/{subscription_id}/logs", response_model=List[SubscriptionLogResponse])
@@ -365,9 +411,118 @@ async def get_subscription_logs(
     
     return logs
 
+class SubscriptionSyncExecutor:
+    """订阅同步执行器
+
+    Git克隆/拉取、删除目录和文件扫描都是阻塞操作，放到独立的线程池中执行，
+    事件循环只负责记录日志和推送WebSocket消息，同步大仓库时不会阻塞其他请求和任务输出。
+    同时同步的订阅数量受 SUBSCRIPTION_SYNC_CONCURRENCY 限制，同一订阅不会重复同步。
+    """
+
+    def __init__(self, max_workers: int = SUBSCRIPTION_SYNC_CONCURRENCY):
+        self.max_workers = max(1, max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="subscription-sync")
+        self.running: Set[int] = set()
+        self._lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # 后台同步任务的强引用，事件循环只持有弱引用，避免任务执行中被回收
+        self._tasks: Set[asyncio.Task] = set()
+
+    def is_running(self, subscription_id: int) -> bool:
+        """订阅是否正在同步（包括排队等待中）"""
+        return subscription_id in self.running
+
+    def _reserve(self, subscription_id: int) -> bool:
+        with self._lock:
+            if subscription_id in self.running:
+                return False
+            self.running.add(subscription_id)
+            return True
+
+    def submit(self, subscription_id: int) -> bool:
+        """在后台开始同步，订阅已在同步中时返回False"""
+        if not self._reserve(subscription_id):
+            return False
+        task = asyncio.create_task(self._run_reserved(subscription_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def run(self, subscription_id: int, check_remote: bool = False):
+        """执行同步并等待完成，订阅已在同步中时直接跳过；check_remote 为真时远程无更新则跳过同步"""
+        if not self._reserve(subscription_id):
+            print(f"订阅 {subscription_id} 正在同步中，跳过本次同步")
+            return
+        await self._run_reserved(subscription_id, check_remote)
+
+    async def _run_reserved(self, subscription_id: int, check_remote: bool = False):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        try:
+            async with self._semaphore:
+                remote_commit = None
+                if check_remote and SUBSCRIPTION_REMOTE_PRECHECK:
+                    loop = asyncio.get_running_loop()
+                    unchanged, remote_commit = await loop.run_in_executor(
+                        self.executor, run_precheck_in_worker, subscription_id
+                    )
+                    if unchanged:
+                        return
+                await execute_subscription_sync(subscription_id, remote_commit=remote_commit)
+        except Exception as e:
+            print(f"订阅同步失败 {subscription_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self.running.discard(subscription_id)
+
+    def shutdown(self):
+        """关闭线程池，不等待正在执行的同步"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局订阅同步执行器实例
+subscription_sync_executor = SubscriptionSyncExecutor()
+
+
+def run_sync_in_worker(subscription_id: int, progress: Optional[Callable[[str, str], None]] = None,
+                       remote_commit: Optional[str] = None):
+    """在工作线程中执行Git同步，使用独立的数据库会话"""
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        subscription = db.query(ScriptSubscription).filter(ScriptSubscription.id == subscription_id).first()
+        if not subscription:
+            raise Exception("订阅不存在")
+        return sync_git_repository(subscription, db, progress, remote_commit)
+    finally:
+        db.close()
+
+def run_precheck_in_worker(subscription_id: int) -> Tuple[bool, Optional[str]]:
+    """在工作线程中检查远程是否有更新，返回 (是否无更新, 远程提交)；无更新时记录检查结果"""
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        subscription = db.query(ScriptSubscription).filter(ScriptSubscription.id == subscription_id).first()
+        if not subscription:
+            return False, None
+        remote_commit, synced_commit = get_remote_commit(subscription, db)
+        if not remote_commit or remote_commit != synced_commit:
+            return False, remote_commit
+
+        subscription.last_check_time = datetime.now()
+        subscription.unchanged_count = (subscription.unchanged_count or 0) + 1
+        db.commit()
+        print(f"订阅 {subscription.name} 远程无更新，跳过同步（已连续 {subscription.unchanged_count} 次）")
+        return True, remote_commit
+    except Exception as e:
+        print(f"检查订阅远程更新失败 {subscription_id}: {e}")
+        return False, None
+    finally:
+        db.close()
+
 # 同步执行函数
-async def execute_subscription_sync(subscription_id: int, db: Session = None):
-    """执行订阅同步"""
+async def execute_subscription_sync(subscription_id: int, db: Session = None, remote_commit: Optional[str] = None):
+    """执行订阅同步，Git操作和文件扫描在同步线程池中执行；remote_commit 为同步前检查到的远程提交"""
     if db is None:
         from app.database import SessionLocal
         db = SessionLocal()
@@ -390,17 +545,39 @@ async def execute_subscription_sync(subscription_id: int, db: Session = None):
         db.add(log)
         db.commit()
 
+        topics = ["subscriptions", f"subscription:{subscription.id}"]
+        subscription_name = subscription.name
+        log_id = log.id
+
         # 发送同步开始的WebSocket消息
-        await websocket_manager.broadcast({
+        await websocket_manager.publish({
             "type": "subscription_sync_start",
             "subscription_id": subscription.id,
-            "subscription_name": subscription.name,
-            "log_id": log.id
-        }, "global")
+            "subscription_name": subscription_name,
+            "log_id": log_id
+        }, topics)
+
+        loop = asyncio.get_running_loop()
+
+        def progress(stage: str, message: str):
+            """工作线程中调用，把进度消息交给事件循环推送"""
+            asyncio.run_coroutine_threadsafe(websocket_manager.publish({
+                "type": "subscription_sync_progress",
+                "subscription_id": subscription_id,
+                "subscription_name": subscription_name,
+                "log_id": log_id,
+                "stage": stage,
+                "message": message
+            }, topics), loop)
 
         try:
             # 执行Git同步
-            updated_files, new_files, deleted_files = sync_git_repository(subscription, db)
+            updated_files, new_files, deleted_files = await loop.run_in_executor(
+                subscription_sync_executor.executor, run_sync_in_worker, subscription_id, progress, remote_commit
+            )
+
+            # 工作线程已修改订阅相关数据，重新读取
+            db.expire_all()
 
             # 更新日志
             log.status = "success"
@@ -425,7 +602,7 @@ async def execute_subscription_sync(subscription_id: int, db: Session = None):
             db.commit()
 
             # 发送同步成功的WebSocket消息
-            await websocket_manager.broadcast({
+            await websocket_manager.publish({
                 "type": "subscription_sync_complete",
                 "subscription_id": subscription.id,
                 "subscription_name": subscription.name,
@@ -434,7 +611,7 @@ async def execute_subscription_sync(subscription_id: int, db: Session = None):
                 "files_updated": len(updated_files),
                 "files_added": len(new_files),
                 "message": log.message
-            }, "global")
+            }, ["subscriptions", f"subscription:{subscription.id}"])
 
             # 发送通知
             if subscription.notification_enabled and (updated_files or new_files or deleted_files):
@@ -450,7 +627,7 @@ async def execute_subscription_sync(subscription_id: int, db: Session = None):
             db.commit()
 
             # 发送同步失败的WebSocket消息
-            await websocket_manager.broadcast({
+            await websocket_manager.publish({
                 "type": "subscription_sync_complete",
                 "subscription_id": subscription.id,
                 "subscription_name": subscription.name,
@@ -459,7 +636,7 @@ async def execute_subscription_sync(subscription_id: int, db: Session = None):
                 "files_updated": 0,
                 "files_added": 0,
                 "message": log.message
-            }, "global")
+            }, ["subscriptions", f"subscription:{subscription.id}"])
 
             raise
             
@@ -467,23 +644,20 @@ async def execute_subscription_sync(subscription_id: int, db: Session = None):
         if should_close_db:
             db.close()
 
-def sync_git_repository(subscription: ScriptSubscription, db: Session):
-    """同步Git仓库"""
+def sync_git_repository(subscription: ScriptSubscription, db: Session,
+                        progress: Optional[Callable[[str, str], None]] = None,
+                        remote_commit: Optional[str] = None):
+    """同步Git仓库（阻塞操作，应在同步线程池中调用）
+
+    progress(阶段, 消息) 用于推送进度，remote_commit 为同步前检查到的远程提交（镜像缺少该提交时强制获取）。
+    """
+    report = progress or (lambda stage, message: None)
     scripts_dir = os.path.abspath("scripts")
     repo_dir = os.path.join(scripts_dir, subscription.save_directory)
 
-    # 重新加载代理配置
-    current_proxy_config = load_proxy_config_from_db(db)
-
     # 准备Git命令环境
-    env = os.environ.copy()
-    if subscription.use_proxy and current_proxy_config.enabled:
-        proxy_url = f"http://{current_proxy_config.host}:{current_proxy_config.port}"
-        env["http_proxy"] = proxy_url
-        env["https_proxy"] = proxy_url
-        print(f"使用代理: {proxy_url}")
+    env = build_git_env(subscription, db)
 
-    import subprocess
     import shutil
 
     # 检查目录是否存在且是Git仓库
@@ -496,6 +670,93 @@ def sync_git_repository(subscription: ScriptSubscription, db: Session):
     print(f"  目录存在: {os.path.exists(repo_dir)}")
     print(f"  是Git仓库: {is_git_repo}")
 
+    # 拉取前的HEAD，新克隆的仓库没有可比较的基准，需要全量扫描
+    pre_pull_head = get_git_head(repo_dir) if is_git_repo else None
+
+    # 根据过滤条件只检出需要的文件
+    sparse_patterns = get_sparse_patterns(subscription) if SUBSCRIPTION_SPARSE_CHECKOUT else None
+
+    if not is_git_repo:
+        # 克隆新仓库
+        print(f"克隆新仓库到: {repo_dir}")
+        if os.path.exists(repo_dir):
+            # 如果目录存在但不是Git仓库，先删除
+            print(f"删除现有目录: {repo_dir}")
+            report("prepare", "删除现有目录")
+            shutil.rmtree(repo_dir)
+
+        os.makedirs(repo_dir, exist_ok=True)
+
+    # 优先从共享的本地镜像检出，镜像不可用时直接与远程仓库同步
+    if not (SUBSCRIPTION_MIRROR_CACHE and sync_from_mirror(subscription, repo_dir, is_git_repo, sparse_patterns, env, report, remote_commit)):
+        sync_from_remote(subscription, repo_dir, is_git_repo, sparse_patterns, env, report)
+
+    post_pull_head = get_git_head(repo_dir)
+    print(f"Git提交: {pre_pull_head or '无'} -> {post_pull_head or '未知'}")
+
+    # 同步到的提交由文件扫描记录到同步状态表，作为下次定时同步前检查远程更新的基准
+    subscription.last_check_time = datetime.now()
+    subscription.unchanged_count = 0
+
+    # 在扫描文件变化之前，删除被排除的文件夹
+    cleanup_excluded_paths(subscription, repo_dir)
+
+    # 扫描文件变化
+    report("scan", "扫描文件变化")
+    return scan_file_changes(subscription, repo_dir, db, head_commit=post_pull_head, full_scan=not is_git_repo)
+
+def build_git_env(subscription: ScriptSubscription, db: Session) -> dict:
+    """准备Git命令的环境变量，订阅启用代理时设置代理"""
+    # 重新加载代理配置
+    current_proxy_config = load_proxy_config_from_db(db)
+
+    env = os.environ.copy()
+    if subscription.use_proxy and current_proxy_config.enabled:
+        proxy_url = f"http://{current_proxy_config.host}:{current_proxy_config.port}"
+        env["http_proxy"] = proxy_url
+        env["https_proxy"] = proxy_url
+        print(f"使用代理: {proxy_url}")
+    return env
+
+def get_remote_commit(subscription: ScriptSubscription, db: Session) -> Tuple[Optional[str], Optional[str]]:
+    """通过 git ls-remote 获取远程分支的最新提交，用于判断能否跳过同步
+
+    返回 (远程提交, 上次同步扫描的提交)，两者相同时远程无更新。
+    只有本地仓库停留在上次扫描的提交且过滤条件未变化时才检查，
+    不需要检查或检查失败时远程提交为None，按正常流程同步。
+    """
+    # 上次同步扫描的提交和过滤条件记录在同步状态表中，过滤条件变化后需要重新扫描
+    state = db.query(SubscriptionSyncState).filter(
+        SubscriptionSyncState.subscription_id == subscription.id
+    ).first()
+    if not state or not state.scanned_commit or state.filter_fingerprint != get_filter_fingerprint(subscription):
+        return None, None
+
+    repo_dir = os.path.join(os.path.abspath("scripts"), subscription.save_directory)
+    if not os.path.exists(os.path.join(repo_dir, ".git")) or get_git_head(repo_dir) != state.scanned_commit:
+        return None, state.scanned_commit
+
+    branch = get_current_branch(repo_dir)
+    if not branch:
+        return None, state.scanned_commit
+
+    result = subprocess.run(
+        ["git", "ls-remote", subscription.git_url, f"refs/heads/{branch}"],
+        cwd=repo_dir,
+        env=build_git_env(subscription, db),
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+    if result.returncode != 0:
+        print(f"git ls-remote执行失败: {result.stderr.strip()}")
+        return None, state.scanned_commit
+
+    return (result.stdout.split()[0] if result.stdout.strip() else None), state.scanned_commit
+
+def sync_from_remote(subscription: ScriptSubscription, repo_dir: str, is_git_repo: bool,
+                     sparse_patterns: Optional[List[str]], env: dict, report: Callable[[str, str], None]):
+    """直接从远程仓库克隆或拉取"""
     if is_git_repo:
         # 更新现有仓库
         print(f"更新现有仓库: {repo_dir}")
@@ -515,55 +776,433 @@ def sync_git_repository(subscription: ScriptSubscription, db: Session):
 
             print(f"当前分支: {current_branch}")
 
-            # 执行pull命令
-            cmd = ["git", "pull", "origin", current_branch]
-            cwd = repo_dir
+            # 过滤条件变化时先更新sparse-checkout规则，之后只更新需要的文件
+            apply_sparse_checkout(repo_dir, sparse_patterns, env)
+
+            if is_shallow_repository(repo_dir):
+                # 浅克隆的历史不连续，无法用pull合并，只获取最新提交后将工作区重置到该提交
+                commands = [
+                    ["git", "fetch", "--progress", "--depth", str(max(SUBSCRIPTION_CLONE_DEPTH, 1)), "origin", current_branch],
+                    ["git", "reset", "--hard", "FETCH_HEAD"]
+                ]
+            else:
+                # 执行pull命令
+                commands = [["git", "pull", "--progress", "origin", current_branch]]
 
         except Exception as e:
             print(f"获取分支信息失败，使用默认pull: {e}")
-            cmd = ["git", "pull"]
-            cwd = repo_dir
+            commands = [["git", "pull", "--progress"]]
     else:
-        # 克隆新仓库
-        print(f"克隆新仓库到: {repo_dir}")
-        if os.path.exists(repo_dir):
-            # 如果目录存在但不是Git仓库，先删除
-            print(f"删除现有目录: {repo_dir}")
-            shutil.rmtree(repo_dir)
-
-        os.makedirs(repo_dir, exist_ok=True)
-        cmd = ["git", "clone", subscription.git_url, "."]
-        cwd = repo_dir
+        # 限制历史深度并使用部分克隆，文件内容在检出时按需下载
+        cmd = ["git", "clone", "--progress"]
+        if SUBSCRIPTION_CLONE_DEPTH > 0:
+            cmd += ["--depth", str(SUBSCRIPTION_CLONE_DEPTH)]
+        if SUBSCRIPTION_PARTIAL_CLONE:
+            cmd.append("--filter=blob:none")
+        if sparse_patterns is not None:
+            # 先不检出，设置sparse-checkout规则后再检出需要的文件
+            cmd.append("--no-checkout")
+        cmd += [subscription.git_url, "."]
+        commands = [cmd]
 
     # 执行Git命令
     try:
+        report("git", "克隆仓库" if not is_git_repo else "拉取更新")
+        for cmd in commands:
+            print(f"执行命令: {' '.join(cmd)} (工作目录: {repo_dir})")
+            returncode, output = run_git_command(cmd, repo_dir, env, SUBSCRIPTION_GIT_TIMEOUT, report)
+
+            print(f"Git命令输出: {output}")
+
+            if returncode != 0:
+                raise Exception(f"Git命令执行失败 (返回码: {returncode}): {output}")
+
+        if not is_git_repo and sparse_patterns is not None:
+            # 设置失败时（如Git版本过低）检出全部文件
+            apply_sparse_checkout(repo_dir, sparse_patterns, env)
+            report("git", "检出文件")
+            returncode, output = run_git_command(["git", "checkout", "--progress"], repo_dir, env, SUBSCRIPTION_GIT_TIMEOUT, report)
+            if returncode != 0:
+                raise Exception(f"Git检出失败 (返回码: {returncode}): {output}")
+
+    except subprocess.TimeoutExpired:
+        raise Exception("Git命令执行超时")
+    except Exception as e:
+        raise Exception(f"Git命令执行失败: {str(e)}")
+
+def sync_from_mirror(subscription: ScriptSubscription, repo_dir: str, is_git_repo: bool,
+                     sparse_patterns: Optional[List[str]], env: dict, report: Callable[[str, str], None],
+                     remote_commit: Optional[str] = None) -> bool:
+    """从本地镜像检出订阅仓库，成功返回True；镜像不可用时返回False，由调用方直接从远程同步
+
+    订阅仓库通过 alternates 直接使用镜像中的对象，不再单独下载和保存；
+    origin 仍指向原始仓库地址，关闭镜像缓存后可以直接从远程拉取。
+    """
+    try:
+        mirror_dir, default_branch = git_mirror_cache.update(subscription.git_url, env, report, remote_commit)
+    except Exception as e:
+        print(f"镜像仓库不可用，直接从远程同步: {e}")
+        return False
+
+    try:
+        if is_git_repo:
+            branch = get_current_branch(repo_dir) or default_branch
+        else:
+            branch = default_branch
+            run_git(["init", "-q"], repo_dir)
+            run_git(["symbolic-ref", "HEAD", f"refs/heads/{branch}"], repo_dir)
+            run_git(["remote", "add", "origin", subscription.git_url], repo_dir)
+
+        commit = git_mirror_cache.get_commit(mirror_dir, branch)
+        if commit is None:
+            raise Exception(f"镜像中没有分支 {branch}")
+
+        print(f"从镜像检出: {mirror_dir} {branch} ({commit})")
+        report("git", "从镜像检出文件")
+        git_mirror_cache.link(repo_dir, mirror_dir)
+        apply_sparse_checkout(repo_dir, sparse_patterns, env)
+        returncode, output = run_git_command(["git", "reset", "--hard", commit], repo_dir, env, SUBSCRIPTION_GIT_TIMEOUT, report)
+        if returncode != 0:
+            raise Exception(f"Git检出失败 (返回码: {returncode}): {output}")
+        run_git(["update-ref", f"refs/remotes/origin/{branch}", commit], repo_dir)
+        return True
+
+    except Exception as e:
+        print(f"从镜像检出失败，直接从远程同步: {e}")
+        if not is_git_repo:
+            # 清理未完成的仓库，重新克隆
+            shutil.rmtree(repo_dir, ignore_errors=True)
+            os.makedirs(repo_dir, exist_ok=True)
+        return False
+
+def run_git(args: List[str], cwd: str, timeout: int = 30) -> str:
+    """执行本地Git命令并返回输出，失败时抛出异常"""
+    result = subprocess.run(["git"] + args, cwd=cwd, capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise Exception(f"git {' '.join(args)} 执行失败: {result.stderr.strip()}")
+    return result.stdout.strip()
+
+def get_current_branch(repo_dir: str) -> Optional[str]:
+    """获取仓库当前分支，失败时返回None"""
+    try:
+        return run_git(["branch", "--show-current"], repo_dir) or None
+    except Exception:
+        return None
+
+class GitMirrorCache:
+    """Git裸仓库镜像缓存
+
+    按规范化后的仓库地址共享一个本地裸仓库，多个订阅（同一仓库的不同过滤条件、
+    同一仓库的不同地址写法）只从远程获取一次，对象也只保存一份。
+    同一镜像在 SUBSCRIPTION_MIRROR_FETCH_INTERVAL 秒内只获取一次，并发同步时按镜像加锁。
+    """
+
+    def __init__(self, root: str = SUBSCRIPTION_MIRROR_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._mirror_locks: Dict[str, threading.Lock] = {}
+        self._fetched_at: Dict[str, float] = {}
+
+    @staticmethod
+    def normalize_url(git_url: str) -> str:
+        """规范化仓库地址：忽略协议、认证信息、主机名大小写、结尾的 / 和 .git"""
+        url = git_url.strip()
+        if "://" in url:
+            parts = urlsplit(url)
+            host = (parts.hostname or "").lower()
+            if parts.port:
+                host = f"{host}:{parts.port}"
+            path = parts.path
+        elif ":" in url and not os.path.exists(url):
+            # scp风格地址：git@host:owner/repo.git
+            host, path = url.split(":", 1)
+            host = host.rsplit("@", 1)[-1].lower()
+        else:
+            host, path = "", os.path.abspath(url)
+        path = path.strip("/")
+        if path.endswith(".git"):
+            path = path[:-4]
+        return f"{host}/{path}"
+
+    def get_mirror_dir(self, git_url: str) -> str:
+        """获取仓库地址对应的镜像目录"""
+        key = hashlib.sha1(self.normalize_url(git_url).encode("utf-8")).hexdigest()[:16]
+        return os.path.abspath(os.path.join(self.root, f"{key}.git"))
+
+    def _get_lock(self, mirror_dir: str) -> threading.Lock:
+        with self._lock:
+            return self._mirror_locks.setdefault(mirror_dir, threading.Lock())
+
+    def update(self, git_url: str, env: dict, report: Callable[[str, str], None],
+               expected_commit: Optional[str] = None) -> Tuple[str, str]:
+        """创建或更新镜像，返回 (镜像目录, 默认分支)；失败时抛出异常
+
+        expected_commit 为已知的远程最新提交，镜像最近获取过但不包含该提交时仍会重新获取。
+        """
+        mirror_dir = self.get_mirror_dir(git_url)
+        with self._get_lock(mirror_dir):
+            if not os.path.exists(os.path.join(mirror_dir, "HEAD")):
+                report("git", "克隆镜像仓库")
+                shutil.rmtree(mirror_dir, ignore_errors=True)
+                os.makedirs(os.path.dirname(mirror_dir), exist_ok=True)
+                cmd = ["git", "clone", "--progress", "--bare"]
+                if SUBSCRIPTION_CLONE_DEPTH > 0:
+                    cmd += ["--depth", str(SUBSCRIPTION_CLONE_DEPTH)]
+                cmd += [git_url, mirror_dir]
+                self._run(cmd, os.path.dirname(mirror_dir), env, report, cleanup=mirror_dir)
+                self._fetched_at[mirror_dir] = time.monotonic()
+
+            branch = run_git(["symbolic-ref", "--short", "HEAD"], mirror_dir)
+
+            fetched_at = self._fetched_at.get(mirror_dir)
+            is_fresh = fetched_at is not None and time.monotonic() - fetched_at < SUBSCRIPTION_MIRROR_FETCH_INTERVAL
+            if is_fresh and expected_commit and self.get_commit(mirror_dir, branch) != expected_commit:
+                is_fresh = False
+            if not is_fresh:
+                report("git", "更新镜像仓库")
+                # 使用订阅自己的地址获取（地址中可能包含不同的认证信息）
+                cmd = ["git", "fetch", "--progress", "--prune"]
+                if SUBSCRIPTION_CLONE_DEPTH > 0:
+                    cmd += ["--depth", str(SUBSCRIPTION_CLONE_DEPTH)]
+                cmd += [git_url, f"+refs/heads/{branch}:refs/heads/{branch}"]
+                self._run(cmd, mirror_dir, env, report)
+                self._fetched_at[mirror_dir] = time.monotonic()
+            else:
+                print(f"镜像仓库最近已更新，跳过获取: {mirror_dir}")
+
+            return mirror_dir, branch
+
+    @staticmethod
+    def _run(cmd: List[str], cwd: str, env: dict, report: Callable[[str, str], None], cleanup: Optional[str] = None):
         print(f"执行命令: {' '.join(cmd)} (工作目录: {cwd})")
+        try:
+            returncode, output = run_git_command(cmd, cwd, env, SUBSCRIPTION_GIT_TIMEOUT, report)
+        except subprocess.TimeoutExpired:
+            returncode, output = -1, "Git命令执行超时"
+        if returncode != 0:
+            if cleanup:
+                shutil.rmtree(cleanup, ignore_errors=True)
+            raise Exception(f"镜像命令执行失败 (返回码: {returncode}): {output}")
+
+    @staticmethod
+    def get_commit(mirror_dir: str, branch: str) -> Optional[str]:
+        """获取镜像中分支的最新提交"""
+        try:
+            return run_git(["rev-parse", "--verify", "--quiet", f"refs/heads/{branch}^{{commit}}"], mirror_dir) or None
+        except Exception:
+            return None
+
+    @staticmethod
+    def link(repo_dir: str, mirror_dir: str):
+        """让订阅仓库通过 alternates 使用镜像中的对象，并同步浅克隆边界"""
+        git_dir = os.path.join(repo_dir, ".git")
+        alternates_file = os.path.join(git_dir, "objects", "info", "alternates")
+        mirror_objects = os.path.join(mirror_dir, "objects")
+        alternates = []
+        if os.path.exists(alternates_file):
+            with open(alternates_file, "r", encoding="utf-8") as f:
+                alternates = [line.strip() for line in f if line.strip()]
+        if mirror_objects not in alternates:
+            os.makedirs(os.path.dirname(alternates_file), exist_ok=True)
+            with open(alternates_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(alternates + [mirror_objects]) + "\n")
+            print(f"订阅仓库已关联镜像对象: {mirror_objects}")
+
+        # 镜像为浅克隆时，订阅仓库也需要记录相同的边界，否则遍历历史时会查找不存在的父提交
+        mirror_shallow = os.path.join(mirror_dir, "shallow")
+        if os.path.exists(mirror_shallow):
+            shallow_file = os.path.join(git_dir, "shallow")
+            commits = set()
+            for path in (shallow_file, mirror_shallow):
+                if os.path.exists(path):
+                    with open(path, "r", encoding="utf-8") as f:
+                        commits.update(line.strip() for line in f if line.strip())
+            with open(shallow_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(sorted(commits)) + "\n")
+
+
+# 全局Git镜像缓存实例
+git_mirror_cache = GitMirrorCache()
+
+def get_sparse_patterns(subscription: ScriptSubscription) -> Optional[List[str]]:
+    """根据订阅的过滤条件生成sparse-checkout规则（gitignore语法），不需要过滤时返回None
+
+    规则只用于减少下载和检出的文件，扫描时仍按原有规则过滤和清理排除的路径。
+    """
+    file_extensions = getattr(subscription, 'file_extensions', None) or []
+    exclude_patterns = getattr(subscription, 'exclude_patterns', None) or []
+    include_subfolders = getattr(subscription, 'include_subfolders', True)
+    if not file_extensions and not exclude_patterns and include_subfolders:
+        return None
+
+    # 不包含子文件夹时只匹配根目录
+    prefix = "" if include_subfolders else "/"
+    if file_extensions:
+        patterns = []
+        for extension in file_extensions:
+            # 扫描时扩展名不区分大小写
+            extension = "".join(f"[{c.lower()}{c.upper()}]" if c.isalpha() else c for c in extension)
+            patterns.append(f"{prefix}*{extension}")
+        patterns += [f"/{name}" for name in SUBSCRIPTION_SPARSE_EXTRA_FILES]
+    else:
+        patterns = ["/*"]
+        if not include_subfolders:
+            patterns.append("!/*/")
+
+    for pattern in exclude_patterns:
+        pattern = pattern.strip().replace('\\', '/').strip('/')
+        if not pattern:
+            continue
+        if '/' in pattern:
+            # 包含路径分隔符的模式相对仓库根目录匹配
+            patterns += [f"!/{pattern}", f"!/{pattern}/**"]
+        else:
+            # 文件名或文件夹名在任意层级匹配
+            patterns += [f"!{pattern}", f"!**/{pattern}/**"]
+    return patterns
+
+def apply_sparse_checkout(repo_dir: str, patterns: Optional[List[str]], env: dict) -> bool:
+    """更新仓库的sparse-checkout规则，patterns为None时关闭；规则未变化时不执行命令，失败时返回False"""
+    try:
+        result = subprocess.run(
+            ["git", "config", "--bool", "core.sparseCheckout"],
+            cwd=repo_dir,
+            capture_output=True,
+            text=True,
+            timeout=30
+        )
+        enabled = result.stdout.strip() == "true"
+
+        if patterns is None:
+            if not enabled:
+                return True
+            cmd = ["git", "sparse-checkout", "disable"]
+            stdin = None
+        else:
+            sparse_file = os.path.join(repo_dir, ".git", "info", "sparse-checkout")
+            if enabled and os.path.exists(sparse_file):
+                with open(sparse_file, "r", encoding="utf-8") as f:
+                    if [line.strip() for line in f if line.strip()] == patterns:
+                        return True
+            cmd = ["git", "sparse-checkout", "set", "--no-cone", "--stdin"]
+            stdin = "\n".join(patterns) + "\n"
+
         result = subprocess.run(
             cmd,
-            cwd=cwd,
+            cwd=repo_dir,
             env=env,
+            input=stdin,
             capture_output=True,
             text=True,
-            timeout=300  # 5分钟超时
+            timeout=SUBSCRIPTION_GIT_TIMEOUT
         )
+    except Exception as e:
+        print(f"设置sparse-checkout失败: {e}")
+        return False
 
-        print(f"Git命令输出: {result.stdout}")
-        if result.stderr:
-            print(f"Git命令错误输出: {result.stderr}")
+    if result.returncode != 0:
+        print(f"设置sparse-checkout失败: {result.stderr.strip()}")
+        return False
 
-        if result.returncode != 0:
-            raise Exception(f"Git命令执行失败 (返回码: {result.returncode}): {result.stderr}")
+    print(f"sparse-checkout规则已更新: {patterns}" if patterns is not None else "已关闭sparse-checkout")
+    return True
 
-    except subprocess.TimeoutExpired:
-        raise Exception("Git命令执行超时")
+def is_shallow_repository(repo_dir: str) -> bool:
+    """仓库是否为浅克隆"""
+    return os.path.exists(os.path.join(repo_dir, ".git", "shallow"))
+
+def run_git_command(cmd: List[str], cwd: str, env: dict, timeout: int,
+                    progress: Callable[[str, str], None]) -> Tuple[int, str]:
+    """执行Git命令并返回 (返回码, 输出)，输出按行转发给进度回调；超时抛出 subprocess.TimeoutExpired"""
+    process = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    timed_out = threading.Event()
+
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+    chunks = []
+    pending = b""
+    last_report = 0.0
+    try:
+        while True:
+            chunk = process.stdout.read1(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            # git 的进度行以 \r 结尾，只推送最近一行，并限制推送频率
+            lines = re.split(rb"[\r\n]", pending + chunk)
+            pending = lines.pop()
+            latest = next((line for line in reversed(lines) if line.strip()), None)
+            now = time.monotonic()
+            if latest is not None and now - last_report >= SUBSCRIPTION_PROGRESS_INTERVAL:
+                progress("git", latest.decode("utf-8", errors="replace").strip())
+                last_report = now
+        returncode = process.wait()
+    finally:
+        timer.cancel()
+        process.stdout.close()
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+
+    # 输出中只保留每行进度的最终状态
+    output = b"".join(chunks).decode("utf-8", errors="replace")
+    lines = [line.split("\r")[-1] for line in output.split("\n")]
+    return returncode, "\n".join(line for line in lines if line.strip())
+
+def get_git_head(repo_dir: str) -> Optional[str]:
+    """获取仓库当前HEAD提交，失败时返回None"""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=repo_dir,
+            capture_output=True,
+            text=True,
+            timeout=30
+        )
     except Exception as e:
-        raise Exception(f"Git命令执行失败: {str(e)}")
+        print(f"获取Git HEAD失败: {e}")
+        return None
+    head = result.stdout.strip()
+    return head if result.returncode == 0 and head else None
 
-    # 在扫描文件变化之前，删除被排除的文件夹
-    cleanup_excluded_paths(subscription, repo_dir)
+def get_git_changed_paths(repo_dir: str, base_commit: str, head_commit: str) -> Optional[List[tuple]]:
+    """获取两个提交之间变化的文件 [(状态, 相对路径)]，状态为 A/M/D 等；失败时返回None"""
+    try:
+        result = subprocess.run(
+            ["git", "-c", "core.quotepath=off", "diff", "--name-status", "--no-renames", "-z", base_commit, head_commit],
+            cwd=repo_dir,
+            capture_output=True,
+            timeout=60
+        )
+    except Exception as e:
+        print(f"执行git diff失败: {e}")
+        return None
+    if result.returncode != 0:
+        print(f"git diff执行失败: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        return None
 
-    # 扫描文件变化
-    return scan_file_changes(subscription, repo_dir, db)
+    # -z 输出格式：状态\0路径\0状态\0路径\0...
+    fields = result.stdout.decode('utf-8', errors='surrogateescape').split('\0')
+    changes = []
+    for index in range(0, len(fields) - 1, 2):
+        status = fields[index][:1]
+        path = fields[index + 1]
+        if status and path:
+            changes.append((status, path.replace('/', os.sep)))
+    return changes
+
+def get_filter_fingerprint(subscription: ScriptSubscription) -> str:
+    """文件过滤条件指纹，过滤条件变化后之前的扫描结果不能作为增量基准"""
+    filters = {
+        "file_extensions": getattr(subscription, 'file_extensions', None) or [],
+        "exclude_patterns": getattr(subscription, 'exclude_patterns', None) or [],
+        "include_subfolders": getattr(subscription, 'include_subfolders', True)
+    }
+    return hashlib.sha1(json.dumps(filters, sort_keys=True).encode('utf-8')).hexdigest()
 
 def cleanup_excluded_paths(subscription: ScriptSubscription, repo_dir: str):
     """清理被排除的文件和文件夹"""
@@ -632,8 +1271,121 @@ def should_exclude_path(path: str, exclude_patterns: List[str]) -> bool:
 
     return False
 
-def scan_file_changes(subscription: ScriptSubscription, repo_dir: str, db: Session):
-    """扫描文件变化"""
+def is_subscribed_file(subscription: ScriptSubscription, relative_path: str, exclude_patterns: List[str]) -> bool:
+    """判断仓库中的文件是否在订阅范围内（与全量扫描时的目录和文件过滤规则一致）"""
+    relative_dir = os.path.dirname(relative_path)
+
+    # 过滤文件夹
+    if not getattr(subscription, 'include_subfolders', True) and relative_dir:
+        return False
+
+    # 检查所在目录及其上级目录是否被排除
+    while relative_dir:
+        if should_exclude_path(relative_dir, exclude_patterns):
+            return False
+        relative_dir = os.path.dirname(relative_dir)
+
+    # 检查文件是否应该被排除
+    if should_exclude_path(relative_path, exclude_patterns):
+        return False
+
+    # 检查文件扩展名
+    file_extensions = getattr(subscription, 'file_extensions', None) or []
+    if file_extensions:
+        file_ext = os.path.splitext(relative_path)[1].lower()
+        if file_ext not in file_extensions:
+            return False
+
+    return True
+
+def scan_file_changes(subscription: ScriptSubscription, repo_dir: str, db: Session,
+                      head_commit: Optional[str] = None, full_scan: bool = False):
+    """扫描文件变化
+
+    有上次扫描的提交记录且过滤条件未变时，通过 git diff 只检查变化的文件；
+    首次克隆、没有扫描记录、过滤条件变化或 git diff 失败时回退为全量扫描。
+    """
+    fingerprint = get_filter_fingerprint(subscription)
+    state = db.query(SubscriptionSyncState).filter(
+        SubscriptionSyncState.subscription_id == subscription.id
+    ).first()
+
+    changes = None
+    if (not full_scan and head_commit and state and state.scanned_commit
+            and state.filter_fingerprint == fingerprint):
+        if state.scanned_commit == head_commit:
+            changes = []
+        else:
+            changes = get_git_changed_paths(repo_dir, state.scanned_commit, head_commit)
+
+    if changes is not None:
+        print(f"增量检测文件变化: {len(changes)} 个文件有变更")
+        updated_files, new_files, deleted_files = apply_git_changes(subscription, repo_dir, db, changes)
+    else:
+        print("全量扫描文件变化")
+        updated_files, new_files, deleted_files = scan_all_files(subscription, repo_dir, db)
+
+    # 记录本次扫描对应的提交，作为下次增量检测的基准
+    if state is None:
+        state = SubscriptionSyncState(subscription_id=subscription.id)
+        db.add(state)
+    state.scanned_commit = head_commit
+    state.filter_fingerprint = fingerprint
+    db.commit()
+
+    # 如果启用了自动创建任务，处理新增的脚本文件
+    if getattr(subscription, 'auto_create_tasks', False):
+        auto_create_tasks_for_scripts(subscription, new_files, repo_dir, db)
+
+    return updated_files, new_files, deleted_files
+
+def apply_git_changes(subscription: ScriptSubscription, repo_dir: str, db: Session, changes: List[tuple]):
+    """根据 git diff 结果更新文件记录"""
+    updated_files = []
+    new_files = []
+    deleted_files = []
+    if not changes:
+        return updated_files, new_files, deleted_files
+
+    exclude_patterns = getattr(subscription, 'exclude_patterns', None) or []
+    changed_paths = {path for _, path in changes if is_subscribed_file(subscription, path, exclude_patterns)}
+    if not changed_paths:
+        return updated_files, new_files, deleted_files
+
+    # 变化较少时只查询相关记录，避免超出SQLite的参数数量限制
+    query = db.query(SubscriptionFile).filter(SubscriptionFile.subscription_id == subscription.id)
+    if len(changed_paths) <= 500:
+        query = query.filter(SubscriptionFile.file_path.in_(changed_paths))
+    existing_files = {f.file_path: f for f in query.all()}
+
+    changed_files = []
+    for status, relative_path in changes:
+        if relative_path not in changed_paths:
+            continue
+        file_path = os.path.join(repo_dir, relative_path)
+
+        if status == 'D' or not os.path.isfile(file_path):
+            # 文件在Git仓库中被删除
+            if getattr(subscription, 'sync_delete_removed_files', False) and relative_path in existing_files:
+                if os.path.exists(file_path):
+                    try:
+                        os.remove(file_path)
+                        deleted_files.append(relative_path)
+                        print(f"删除本地文件: {file_path}")
+                    except Exception as e:
+                        print(f"删除文件失败 {file_path}: {e}")
+
+                # 从数据库中删除文件记录
+                db.delete(existing_files[relative_path])
+            continue
+
+        changed_files.append((relative_path, file_path, os.stat(file_path), existing_files.get(relative_path)))
+
+    update_file_records(subscription, db, changed_files, updated_files, new_files)
+    return updated_files, new_files, deleted_files
+
+def scan_all_files(subscription: ScriptSubscription, repo_dir: str, db: Session):
+    """全量扫描仓库目录，只为大小、修改时间或inode变化的文件计算哈希"""
     updated_files = []
     new_files = []
     deleted_files = []
@@ -643,8 +1395,9 @@ def scan_file_changes(subscription: ScriptSubscription, repo_dir: str, db: Sessi
         SubscriptionFile.subscription_id == subscription.id
     ).all()}
 
-    # 记录当前扫描到的文件
+    # 记录当前扫描到的文件，以及需要重新计算哈希的文件
     current_files = set()
+    changed_files = []
 
     # 获取排除模式
     exclude_patterns = getattr(subscription, 'exclude_patterns', None) or []
@@ -679,33 +1432,17 @@ def scan_file_changes(subscription: ScriptSubscription, repo_dir: str, db: Sessi
                 if file_ext not in file_extensions:
                     continue
 
-            # 计算MD5
-            file_md5 = calculate_file_md5(file_path)
-            file_size = os.path.getsize(file_path)
-
             # 记录当前文件
             current_files.add(relative_path)
 
-            if relative_path in existing_files:
-                # 检查文件是否有更新
-                existing_file = existing_files[relative_path]
-                if existing_file.file_md5 != file_md5:
-                    existing_file.file_md5 = file_md5
-                    existing_file.file_size = file_size
-                    existing_file.is_new = False
-                    existing_file.updated_at = datetime.now()
-                    updated_files.append(relative_path)
-            else:
-                # 新文件
-                new_file = SubscriptionFile(
-                    subscription_id=subscription.id,
-                    file_path=relative_path,
-                    file_md5=file_md5,
-                    file_size=file_size,
-                    is_new=True
-                )
-                db.add(new_file)
-                new_files.append(relative_path)
+            # 大小、修改时间和inode都未变化时认为内容未变，跳过计算哈希
+            file_stat = os.stat(file_path)
+            existing_file = existing_files.get(relative_path)
+            if existing_file is not None and is_file_stat_unchanged(existing_file, file_stat):
+                continue
+            changed_files.append((relative_path, file_path, file_stat, existing_file))
+
+    update_file_records(subscription, db, changed_files, updated_files, new_files)
 
     # 检查是否有文件被删除
     if getattr(subscription, 'sync_delete_removed_files', False):
@@ -724,18 +1461,16 @@ def scan_file_changes(subscription: ScriptSubscription, repo_dir: str, db: Sessi
                 # 从数据库中删除文件记录
                 db.delete(file_record)
 
-    db.commit()
-
-    # 如果启用了自动创建任务，处理新增的脚本文件
-    if getattr(subscription, 'auto_create_tasks', False):
-        auto_create_tasks_for_scripts(subscription, new_files, repo_dir, db)
-
     return updated_files, new_files, deleted_files
 
 def auto_create_tasks_for_scripts(subscription: ScriptSubscription, new_files: List[str], repo_dir: str, db: Session):
-    """为新增的Python和JavaScript脚本自动创建任务"""
+    """为新增的Python和JavaScript脚本自动创建任务
+
+    一次查询已存在的任务名，批量插入新任务并批量添加到调度器。
+    """
     from app.models import Task
 
+    candidates = []
     for file_path in new_files:
         # 处理Python和JavaScript脚本
         script_type = None
@@ -758,47 +1493,178 @@ def auto_create_tasks_for_scripts(subscription: ScriptSubscription, new_files: L
         # 提取文件名作为任务名（去掉扩展名）
         script_name = os.path.splitext(os.path.basename(file_path))[0]
         task_name = f"{subscription.name}_{script_name}"
+        candidates.append((task_name, script_type, full_script_path))
 
-        # 检查任务名是否已存在
-        existing_task = db.query(Task).filter(Task.name == task_name).first()
-        if existing_task:
+    if not candidates:
+        return
+
+    # 检查任务名是否已存在（分批查询，避免超出SQLite的参数数量限制）
+    candidate_names = list({task_name for task_name, _, _ in candidates})
+    existing_names = set()
+    for index in range(0, len(candidate_names), 500):
+        chunk = candidate_names[index:index + 500]
+        existing_names.update(name for (name,) in db.query(Task.name).filter(Task.name.in_(chunk)))
+
+    cron_template = getattr(subscription, 'task_cron_template', None) or DEFAULT_TASK_CRON
+    group_name = f"订阅_{subscription.name}"
+    new_tasks = []
+    for task_name, script_type, full_script_path in candidates:
+        if task_name in existing_names:
             print(f"任务 {task_name} 已存在，跳过创建")
             continue
+        existing_names.add(task_name)
+        new_tasks.append({
+            "name": task_name,
+            "description": f"由订阅 {subscription.name} 自动创建的{script_type}任务",
+            "script_path": full_script_path,
+            "script_type": script_type,
+            "cron_expression": expand_cron_template(cron_template, task_name),
+            "environment_vars": {},
+            "group_name": group_name,
+            "is_active": True
+        })
+
+    if not new_tasks:
+        return
 
-        # 创建新任务
-        try:
-            new_task = Task(
-                name=task_name,
-                description=f"由订阅 {subscription.name} 自动创建的{script_type}任务",
-                script_path=full_script_path,
-                script_type=script_type,
-                cron_expression="0 3 * * *",  # 每天凌晨3点执行
-                environment_vars={},
-                group_name=f"订阅_{subscription.name}",
-                is_active=True
-            )
-
-            db.add(new_task)
-            db.commit()
-            db.refresh(new_task)
+    # 一条批量插入语句创建所有任务，再一次查询出新任务（任务名已确认不存在）
+    new_names = [task["name"] for task in new_tasks]
+    try:
+        db.execute(insert(Task), new_tasks)
+        db.commit()
+    except Exception as e:
+        print(f"批量创建任务失败: {str(e)}")
+        db.rollback()
+        return
 
-            # 添加到调度器
-            from app.scheduler import task_scheduler
-            task_scheduler.add_task(new_task)
+    # 提交后再查询，避免提交使对象过期、添加到调度器时逐个重新加载
+    created_tasks = []
+    for index in range(0, len(new_names), 500):
+        created_tasks.extend(db.query(Task).filter(
+            Task.group_name == group_name,
+            Task.name.in_(new_names[index:index + 500])
+        ).all())
 
-            print(f"自动创建{script_type}任务成功: {task_name}")
+    # 添加到调度器
+    from app.scheduler import task_scheduler
+    task_scheduler.add_tasks(created_tasks)
+
+    print(f"自动创建任务成功: {len(created_tasks)} 个（订阅 {subscription.name}）")
+
+def expand_cron_template(template: str, seed: str) -> str:
+    """展开定时表达式模板
+
+    H 表示该字段取值范围内的一个值，H(a-b) 表示 a 到 b 之间的一个值，
+    取值由 seed（任务名）的哈希决定，同一任务每次展开结果相同，不同任务的执行时间相互错开。
+    """
+    fields = template.split()
+    ranges = CRON_FIELD_RANGES[len(fields)] if len(fields) in CRON_FIELD_RANGES else None
+    if ranges is None or 'H' not in template:
+        return template
+
+    expanded = []
+    for index, (field, (min_val, max_val)) in enumerate(zip(fields, ranges)):
+        match = re.fullmatch(r'H(?:\((\d+)-(\d+)\))?', field)
+        if not match:
+            expanded.append(field)
+            continue
+        if match.group(1) is not None:
+            min_val, max_val = int(match.group(1)), int(match.group(2))
+        digest = hashlib.md5(f"{seed}:{index}".encode('utf-8')).hexdigest()
+        expanded.append(str(min_val + int(digest, 16) % (max_val - min_val + 1)))
+    return " ".join(expanded)
+
+def validate_task_cron_template(template: Optional[str]):
+    """校验自动创建任务的定时表达式模板"""
+    if not template:
+        return
+    from app.routers.tasks import validate_cron_expression
+    fields = template.split()
+    ranges = CRON_FIELD_RANGES.get(len(fields))
+    for index, field in enumerate(fields):
+        if 'H' not in field:
+            continue
+        # H 只能单独占一个字段，且只支持5字段和6字段表达式
+        match = re.fullmatch(r'H(?:\((\d+)-(\d+)\))?', field)
+        if ranges is None or not match:
+            raise HTTPException(status_code=400, detail=f"任务定时模板中的 {field} 无效，H 或 H(a-b) 只能单独用于5字段或6字段表达式")
+        if match.group(1) is not None:
+            min_val, max_val = ranges[index]
+            start, end = int(match.group(1)), int(match.group(2))
+            if start > end or start < min_val or end > max_val:
+                raise HTTPException(status_code=400, detail=f"任务定时模板中 {field} 的范围无效，该字段取值范围为 {min_val}-{max_val}")
+    if not validate_cron_expression(expand_cron_template(template, "validate")):
+        raise HTTPException(status_code=400, detail="无效的任务定时模板格式")
+
+def is_file_stat_unchanged(file_record: SubscriptionFile, file_stat: os.stat_result) -> bool:
+    """文件大小、修改时间和inode是否与记录一致"""
+    return (file_record.mtime_ns is not None
+            and file_record.mtime_ns == file_stat.st_mtime_ns
+            and file_record.inode == file_stat.st_ino
+            and file_record.file_size == file_stat.st_size)
+
+def calculate_file_hash(file_path: str, legacy_md5: bool = False) -> Tuple[str, Optional[str]]:
+    """计算文件内容哈希（128位blake2b），legacy_md5为真时同时计算MD5，用于与旧版本的记录比较"""
+    hasher = hashlib.blake2b(digest_size=16)
+    md5_hasher = hashlib.md5() if legacy_md5 else None
+    with open(file_path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if SUBSCRIPTION_MMAP_THRESHOLD and file_size >= SUBSCRIPTION_MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+                if md5_hasher:
+                    md5_hasher.update(mapped)
+        else:
+            for chunk in iter(lambda: f.read(SUBSCRIPTION_HASH_BUFFER_SIZE), b""):
+                hasher.update(chunk)
+                if md5_hasher:
+                    md5_hasher.update(chunk)
+    return hasher.hexdigest(), md5_hasher.hexdigest() if md5_hasher else None
+
+def update_file_records(subscription: ScriptSubscription, db: Session, changed_files: List[tuple],
+                        updated_files: List[str], new_files: List[str]):
+    """并行计算文件哈希并更新文件记录
+
+    changed_files 为 [(相对路径, 完整路径, stat结果, 现有记录或None)]
+    """
+    if not changed_files:
+        return
 
-        except Exception as e:
-            print(f"自动创建任务失败 {task_name}: {str(e)}")
-            db.rollback()
+    def hash_file(item):
+        _, file_path, _, existing_file = item
+        # 旧版本的记录（没有mtime_ns）保存的是MD5
+        return calculate_file_hash(file_path, legacy_md5=existing_file is not None and existing_file.mtime_ns is None)
 
-def calculate_file_md5(file_path: str) -> str:
-    """计算文件MD5值"""
-    hash_md5 = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+    if len(changed_files) == 1:
+        digests = [hash_file(changed_files[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=SUBSCRIPTION_HASH_WORKERS) as executor:
+            digests = list(executor.map(hash_file, changed_files))
+
+    for (relative_path, _, file_stat, existing_file), (file_hash, legacy_md5) in zip(changed_files, digests):
+        if existing_file is not None:
+            # 检查文件是否有更新
+            previous_hash = legacy_md5 if existing_file.mtime_ns is None else file_hash
+            if existing_file.file_md5 != previous_hash:
+                existing_file.is_new = False
+                existing_file.updated_at = datetime.now()
+                updated_files.append(relative_path)
+            existing_file.file_md5 = file_hash
+            existing_file.file_size = file_stat.st_size
+            existing_file.mtime_ns = file_stat.st_mtime_ns
+            existing_file.inode = file_stat.st_ino
+        else:
+            # 新文件
+            db.add(SubscriptionFile(
+                subscription_id=subscription.id,
+                file_path=relative_path,
+                file_md5=file_hash,
+                file_size=file_stat.st_size,
+                mtime_ns=file_stat.st_mtime_ns,
+                inode=file_stat.st_ino,
+                is_new=True
+            ))
+            new_files.append(relative_path)
 
 async def send_subscription_notification(subscription: ScriptSubscription, updated_files: List[str], new_files: List[str], deleted_files: List[str], db: Session, repo_dir: str = None):
     """发送订阅通知"""
@@ -867,62 +1733,6 @@ async def send_subscription_notification(subscription: ScriptSubscription, updat
     # 发送通知
     await notification_service.send_notification(notification_config, title, content)
 
-def compare_versions(installed_version: str, required_version: str, operator: str) -> str:
-    """比较版本号并返回状态文本"""
-    def parse_version(version_str):
-        """解析版本号为数字列表"""
-        # 移除非数字和点的字符，然后分割
-        clean_version = ''.join(c if c.isdigit() or c == '.' else '' for c in version_str)
-        parts = clean_version.split('.')
-        return [int(part) if part.isdigit() else 0 for part in parts if part]
-
-    try:
-        installed_parts = parse_version(installed_version)
-        required_parts = parse_version(required_version)
-
-        # 补齐版本号长度
-        max_len = max(len(installed_parts), len(required_parts))
-        installed_parts.extend([0] * (max_len - len(installed_parts)))
-        required_parts.extend([0] * (max_len - len(required_parts)))
-
-        # 比较版本号
-        def compare_version_lists(v1, v2):
-            for i in range(len(v1)):
-                if v1[i] > v2[i]:
-                    return 1
-                elif v1[i] < v2[i]:
-                    return -1
-            return 0
-
-        comparison = compare_version_lists(installed_parts, required_parts)
-
-        if operator == '==':
-            return '版本相同' if comparison == 0 else ('需要降级' if comparison > 0 else '需要升级')
-        elif operator == '>=':
-            return '已安装' if comparison >= 0 else '需要升级'
-        elif operator == '>':
-            return '已安装' if comparison > 0 else '需要升级'
-        elif operator == '<=':
-            return '已安装' if comparison <= 0 else '需要降级'
-        elif operator == '<':
-            return '已安装' if comparison < 0 else '需要降级'
-        elif operator == '!=':
-            return '已安装' if comparison != 0 else '版本冲突'
-        elif operator == '~=':
-            # 兼容版本比较（主版本相同，次版本大于等于）
-            if len(required_parts) >= 2:
-                if installed_parts[0] == required_parts[0] and comparison >= 0:
-                    return '已安装'
-                else:
-                    return '需要升级'
-            else:
-                return '已安装' if comparison >= 0 else '需要升级'
-        else:
-            return '已安装'
-
-    except Exception as e:
-        return f'版本比较失败: {str(e)}'
-
 @router.get("/{subscription_id}/requirements")
 async def check_requirements(
     subscription_id: int,
@@ -947,108 +1757,8 @@ async def check_requirements(
         with open(requirements_file, 'r', encoding='utf-8') as f:
             requirements_content = f.read()
 
-        # 解析requirements.txt
-        requirements = []
-        for line in requirements_content.strip().split('\n'):
-            line = line.strip()
-            if line and not line.startswith('#'):
-                # 解析包名和版本要求，支持更多操作符
-                package_name = line
-                version = None
-                operator = None
-
-                # 按优先级检查操作符（长的先检查）
-                operators = ['>=', '<=', '==', '!=', '~=', '>', '<']
-                for op in operators:
-                    if op in line:
-                        parts = line.split(op, 1)
-                        if len(parts) == 2:
-                            package_name = parts[0].strip()
-                            version = parts[1].strip()
-                            operator = op
-                            break
-
-                # 处理复杂的版本要求（如 package>=1.0,<2.0）
-                if ',' in line and operator:
-                    # 暂时只取第一个条件，复杂条件后续可以扩展
-                    pass
-
-                requirements.append({
-                    'name': package_name,
-                    'required_version': version,
-                    'operator': operator
-                })
-
-        # 检查每个包的安装状态
-        result = []
-        for req in requirements:
-            package_name = req['name']
-            required_version = req['required_version']
-
-            # 检查Python包是否已安装
-            try:
-                check_result = subprocess.run(
-                    ["pip", "show", package_name],
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-
-                if check_result.returncode == 0:
-                    # 解析pip show输出获取版本信息
-                    output_lines = check_result.stdout.split('\n')
-                    installed_version = None
-                    for line in output_lines:
-                        if line.startswith('Version:'):
-                            installed_version = line.split(':', 1)[1].strip()
-                            break
-
-                    # 判断版本状态
-                    status = 'installed'
-                    status_text = '已安装'
-
-                    if required_version and installed_version and req['operator']:
-                        status_text = compare_versions(installed_version, required_version, req['operator'])
-                    elif required_version and installed_version:
-                        # 没有操作符时，默认使用==比较
-                        status_text = compare_versions(installed_version, required_version, '==')
-
-                    result.append({
-                        'name': package_name,
-                        'required_version': required_version,
-                        'installed_version': installed_version,
-                        'status': status,
-                        'status_text': status_text,
-                        'operator': req['operator']
-                    })
-                else:
-                    result.append({
-                        'name': package_name,
-                        'required_version': required_version,
-                        'installed_version': None,
-                        'status': 'not_installed',
-                        'status_text': '未安装',
-                        'operator': req['operator']
-                    })
-
-            except subprocess.TimeoutExpired:
-                result.append({
-                    'name': package_name,
-                    'required_version': required_version,
-                    'installed_version': None,
-                    'status': 'error',
-                    'status_text': '检查超时',
-                    'operator': req['operator']
-                })
-            except Exception as e:
-                result.append({
-                    'name': package_name,
-                    'required_version': required_version,
-                    'installed_version': None,
-                    'status': 'error',
-                    'status_text': f'检查失败: {str(e)}',
-                    'operator': req['operator']
-                })
+        # 一次读取已安装包清单，在进程内批量比对全部依赖
+        result = await asyncio.to_thread(python_packages.check_requirements, requirements_content)
 
         return {
             'subscription_name': subscription.name,
@@ -10,7 +10,7 @@ from app.database import get_db
 from app.auth import get_current_user
 from app.models import User, Task
 from app.scheduler import task_scheduler
-from app.timezone_utils import format_datetime
+from app.timezone_utils import format_datetime, get_datetime_formatter
 
 router = APIRouter(prefix="/api/tasks", tags=["任务管理"])
 
@@ -223,6 +223,9 @@ async def get_tasks(
     # 计算总页数
     total_pages = (total + page_size - 1) // page_size
 
+    # 列表接口只解析一次时区
+    formatter = get_datetime_formatter(db)
+
     return PaginatedTasksResponse(
         tasks=[
             TaskResponse(
@@ -235,8 +238,8 @@ async def get_tasks(
                 environment_vars=task.environment_vars,
                 group_name=task.group_name,
                 is_active=task.is_active,
-                created_at=format_datetime(task.created_at, db),
-                updated_at=format_datetime(task.updated_at, db) if task.updated_at else None
+                created_at=formatter(task.created_at),
+                updated_at=formatter(task.updated_at) if task.updated_at else None
             )
             for task in tasks
         ],
@@ -3,14 +3,19 @@
 """
 import os
 import asyncio
+import threading
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List
+from apscheduler.schedulers.base import STATE_RUNNING
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from app.database import SessionLocal
 from app.models import Task, TaskLog, EnvironmentVariable, ApiDebugConfig, ApiDebugLog, NotificationConfig, ScriptSubscription, SystemConfig
-from app.websocket_manager import websocket_manager
-from app.notification_service import notification_service
+from app.websocket_manager import websocket_manager, TASK_OUTPUT_BATCH_INTERVAL, TASK_OUTPUT_BATCH_MAX_LINES
+from app.notification_outbox import notification_outbox
+from app.api_debug_client import api_debug_client
+from app.api_debug_template import api_debug_templates, env_snapshot
+from app.notification_service import notification_route_cache, sendnotify_tokens
 from app.timezone_utils import get_current_time
 
 class TaskScheduler:
@@ -25,6 +30,8 @@ class TaskScheduler:
         self.debug_cache: Dict[str, Dict] = {}
         # 调试ID计数器
         self.debug_id_counter = 0
+        # 批量添加任务时暂停/恢复调度器的锁
+        self._batch_lock = threading.Lock()
 
     def get_command_config(self, db, command_type: str) -> str:
         """从数据库获取命令配置"""
@@ -84,6 +91,7 @@ class TaskScheduler:
         import threading
         from app.websocket_manager import websocket_manager
 
+        notify_token = None
         try:
             # 确定脚本的完整路径
             scripts_dir = os.path.join(os.getcwd(), "scripts")
@@ -164,6 +172,10 @@ class TaskScheduler:
             for env_var in db_env_vars:
                 env_vars[str(env_var.key)] = str(env_var.value)
 
+            # 注入SendNotify运行令牌
+            notify_token = sendnotify_tokens.issue(f"sendnotify:debug:{debug_id}")
+            env_vars.update(sendnotify_tokens.get_env(notify_token))
+
             # 构建执行命令
             cmd = [command, script_full_path]
 
@@ -261,6 +273,8 @@ class TaskScheduler:
                 "content": error_msg,
                 "timestamp": datetime.now().isoformat()
             })
+        finally:
+            sendnotify_tokens.revoke(notify_token)
 
     def stop_debug_script(self, debug_id: str):
         """停止调试脚本"""
@@ -326,12 +340,33 @@ class TaskScheduler:
             
     def add_task(self, task: Task):
         """添加任务到调度器"""
+        if self._add_task_job(task):
+            print(f"已添加任务: {task.name}")
+
+    def add_tasks(self, tasks: List[Task]):
+        """批量添加任务到调度器
+
+        添加期间暂停调度器，避免每添加一个任务都唤醒一次调度循环，全部添加后统一唤醒。
+        """
+        with self._batch_lock:
+            paused = self.scheduler.state == STATE_RUNNING
+            if paused:
+                self.scheduler.pause()
+            try:
+                added = sum(1 for task in tasks if self._add_task_job(task))
+            finally:
+                if paused:
+                    self.scheduler.resume()
+        print(f"已批量添加 {added}/{len(tasks)} 个任务")
+
+    def _add_task_job(self, task: Task) -> bool:
+        """创建任务的cron触发器并添加调度作业，成功返回True"""
         try:
             # 解析cron表达式，支持5字段和6字段格式
             cron_parts = task.cron_expression.split()
             if len(cron_parts) not in [5, 6]:
                 print(f"任务 {task.name} 的cron表达式格式错误: {task.cron_expression}")
-                return
+                return False
 
             # 处理6字段格式（包含秒）
             if len(cron_parts) == 6:
@@ -367,10 +402,11 @@ class TaskScheduler:
                 name=task.name,
                 replace_existing=True
             )
-            print(f"已添加任务: {task.name}")
+            return True
             
         except Exception as e:
             print(f"添加任务失败 {task.name}: {str(e)}")
+            return False
 
     def add_debug_config(self, config: ApiDebugConfig):
         """添加接口调试配置到调度器"""
@@ -531,18 +567,18 @@ class TaskScheduler:
             # 初始化任务日志缓存
             self.task_log_cache[task_id] = {
                 "log_id": task_log.id,
-                "output_lines": [],
-                "error_lines": [],
+                # 按实时推送的顺序记录(seq, 输出类型, 行)，历史回放沿用同一序号
+                "lines": [],
                 "start_time": get_current_time(db)
             }
 
-            # 发送WebSocket消息到全局房间
-            await websocket_manager.broadcast({
+            # 发送WebSocket消息给订阅了任务摘要或该任务的连接
+            await websocket_manager.publish({
                 "type": "task_start",
                 "task_id": task.id,
                 "task_name": task.name,
                 "log_id": task_log.id
-            }, "global")
+            }, ["summary", f"task:{task.id}"])
             
             # 准备环境变量
             env_vars = os.environ.copy()
@@ -594,6 +630,10 @@ class TaskScheduler:
             if task.environment_vars is not None:
                 for key, value in task.environment_vars.items():
                     env_vars[str(key)] = str(value)
+
+            # 注入SendNotify运行令牌，脚本通过本地推送入口发送通知
+            notify_token = sendnotify_tokens.issue(f"sendnotify:task:{task.id}")
+            env_vars.update(sendnotify_tokens.get_env(notify_token))
             
             # 执行脚本
             try:
@@ -640,7 +680,11 @@ class TaskScheduler:
                     cwd=scripts_dir
                 )
                 
-                self.running_tasks[task_id] = {"process": process, "log_id": task_log.id}
+                # 关键词在输出流上逐行匹配，任务完成时无需再扫描完整输出
+                route = notification_route_cache.get_route(task_id)
+                keyword_matcher = route.new_matcher() if route else None
+
+                self.running_tasks[task_id] = {"process": process, "log_id": task_log.id, "keyword_matcher": keyword_matcher}
                 
                 # 使用 pty 模块来获取真正的流式输出（仅Unix/Linux）
                 import subprocess
@@ -661,13 +705,8 @@ class TaskScheduler:
                                 output_list.append(line_text)
                                 line_stripped = line_text.rstrip()
                                 output_queue.put((output_type, line_stripped))
-
-                                # 缓存日志行
-                                if task_id in self.task_log_cache:
-                                    if output_type == 'stdout':
-                                        self.task_log_cache[task_id]["output_lines"].append(line_stripped)
-                                    else:
-                                        self.task_log_cache[task_id]["error_lines"].append(line_stripped)
+                                if keyword_matcher is not None:
+                                    keyword_matcher.feed(line_text)
                     except Exception as e:
                         print(f"读取输出时出错: {e}")
                     finally:
@@ -701,24 +740,29 @@ class TaskScheduler:
                 stdout_thread.start()
                 stderr_thread.start()
 
-                # 实时处理输出
+                # 实时处理输出：每个窗口内积累的行合并为一批发送
                 async def process_output():
+                    seq = 0
                     while process.poll() is None or not output_queue.empty():
                         try:
-                            # 非阻塞获取输出
-                            output_type, line = output_queue.get_nowait()
-
-                            # 通过WebSocket实时发送到任务特定房间
-                            await websocket_manager.broadcast({
-                                "type": "task_output",
-                                "task_id": task.id,
-                                "log_id": task_log.id,
-                                "output_line": line,
-                                "output_type": output_type
-                            }, f"task_{task.id}")
-
-                        except queue.Empty:
-                            await asyncio.sleep(0.1)
+                            # 非阻塞取出当前已有的输出（最多一帧的行数）
+                            lines = []
+                            while len(lines) < TASK_OUTPUT_BATCH_MAX_LINES:
+                                try:
+                                    output_type, line = output_queue.get_nowait()
+                                except queue.Empty:
+                                    break
+                                seq += 1
+                                lines.append((seq, output_type, line))
+
+                            # 缓存带序号的日志行后，再通过WebSocket实时发送到任务特定房间
+                            if lines:
+                                if task_id in self.task_log_cache:
+                                    self.task_log_cache[task_id]["lines"].extend(lines)
+                                await websocket_manager.send_task_output(task.id, task_log.id, lines)
+
+                            if len(lines) < TASK_OUTPUT_BATCH_MAX_LINES:
+                                await asyncio.sleep(TASK_OUTPUT_BATCH_INTERVAL)
                         except Exception as e:
                             print(f"处理输出时出错: {e}")
                             break
@@ -746,21 +790,20 @@ class TaskScheduler:
                 # 重新获取更新后的任务日志
                 db.refresh(task_log)
 
-                # 发送WebSocket消息到全局房间
-                await websocket_manager.broadcast({
+                # 发送WebSocket消息给订阅了任务摘要或该任务的连接
+                # 完成事件只携带ID和状态，完整日志由客户端按log_id获取
+                await websocket_manager.publish({
                     "type": "task_complete",
                     "task_id": task.id,
                     "task_name": task.name,
                     "log_id": task_log.id,
                     "status": task_log.status,
-                    "exit_code": process.returncode,
-                    "output": task_log.output,
-                    "error_output": task_log.error_output
-                }, "global")
+                    "exit_code": process.returncode
+                }, ["summary", f"task:{task.id}"])
 
-                # 发送任务完成通知
+                # 任务完成通知写入发件箱，由后台异步投递
                 try:
-                    await notification_service.send_task_notification(task.id, task_log)
+                    notification_outbox.enqueue_task_notification(task.id, task_log, keyword_matcher)
                 except Exception as e:
                     print(f"发送任务通知失败: {e}")
                 
@@ -776,22 +819,24 @@ class TaskScheduler:
                 # 重新获取更新后的任务日志
                 db.refresh(task_log)
 
-                # 发送WebSocket消息到全局房间
-                await websocket_manager.broadcast({
+                # 发送WebSocket消息给订阅了任务摘要或该任务的连接
+                await websocket_manager.publish({
                     "type": "task_error",
                     "task_id": task.id,
                     "task_name": task.name,
                     "log_id": task_log.id,
                     "error": str(e)
-                }, "global")
+                }, ["summary", f"task:{task.id}"])
 
-                # 发送任务失败通知
+                # 任务失败通知写入发件箱，由后台异步投递
                 try:
-                    await notification_service.send_task_notification(task.id, task_log)
+                    notification_outbox.enqueue_task_notification(task.id, task_log)
                 except Exception as e:
                     print(f"发送任务通知失败: {e}")
                 
             finally:
+                sendnotify_tokens.revoke(notify_token)
+
                 # 清理运行中的任务记录
                 if task_id in self.running_tasks:
                     del self.running_tasks[task_id]
@@ -876,20 +921,18 @@ class TaskScheduler:
                         db.commit()
 
                         # 发送WebSocket消息
-                        await websocket_manager.broadcast({
+                        await websocket_manager.publish({
                             "type": "task_complete",
                             "task_id": task_id,
                             "task_name": task_log.task_name,
                             "log_id": task_log.id,
                             "status": "stopped",
-                            "exit_code": -1,
-                            "output": task_log.output,
-                            "error_output": task_log.error_output
-                        }, "global")
+                            "exit_code": -1
+                        }, ["summary", f"task:{task_id}"])
 
-                        # 发送任务停止通知
+                        # 任务停止通知写入发件箱，由后台异步投递
                         try:
-                            await notification_service.send_task_notification(task_id, task_log)
+                            notification_outbox.enqueue_task_notification(task_id, task_log, task_info.get("keyword_matcher"))
                         except Exception as e:
                             print(f"发送任务通知失败: {e}")
 
@@ -918,10 +961,6 @@ class TaskScheduler:
 
     async def execute_debug_config(self, config_id: int):
         """执行接口调试配置"""
-        import requests
-        import time
-        import re
-
         db = SessionLocal()
         try:
             # 获取配置信息
@@ -932,108 +971,16 @@ class TaskScheduler:
 
             start_time = get_current_time(db)
 
-            # 获取环境变量
-            env_vars = {}
-            env_records = db.query(EnvironmentVariable).all()
-            for env_record in env_records:
-                env_vars[env_record.key] = env_record.value
-
-            # 变量替换函数
-            def replace_variables(text: str) -> str:
-                if not text:
-                    return text
-
-                # 生成统一的时间戳
-                timestamp_10 = str(int(time.time()))
-                timestamp_13 = str(int(time.time() * 1000))
-
-                # 替换时间戳变量
-                text = re.sub(r'\[timestmp\.10\]', timestamp_10, text)
-                text = re.sub(r'\[timestmp\.13\]', timestamp_13, text)
-                text = re.sub(r'\[timestmp\]', timestamp_13, text)  # 默认13位
-
-                # 替换随机数变量
-                def replace_random_var(match):
-                    range_str = match.group(1)
-                    try:
-                        # 解析范围，支持格式：100-500
-                        if '-' in range_str:
-                            min_val, max_val = range_str.split('-', 1)
-                            min_val = int(min_val.strip())
-                            max_val = int(max_val.strip())
-                            if min_val <= max_val:
-                                import random
-                                return str(random.randint(min_val, max_val))
-                        # 如果格式不正确，保持原样
-                        return f'[random.{range_str}]'
-                    except (ValueError, TypeError):
-                        # 如果解析失败，保持原样
-                        return f'[random.{range_str}]'
-
-                text = re.sub(r'\[random\.([^]]+)\]', replace_random_var, text)
-
-                # 替换环境变量
-                def replace_env_var(match):
-                    var_name = match.group(1)
-                    return env_vars.get(var_name, f'[getenv.{var_name}]')
-
-                text = re.sub(r'\[getenv\.([^]]+)\]', replace_env_var, text)
-                return text
-
-            # 替换变量
-            url = replace_variables(config.url)
-
-            # 先替换payload中的变量，因为Content-Length需要基于替换后的payload计算
-            payload = replace_variables(config.payload) if config.payload else None
-
-            # 处理headers，特别注意Content-Length的处理
-            headers = {}
-            auto_calculate_content_length = False
-
-            for key, value in (config.headers or {}).items():
-                # 检查是否需要自动计算Content-Length
-                if key.lower() == 'content-length' and value == '自动计算':
-                    auto_calculate_content_length = True
-                    continue
-                headers[replace_variables(key)] = replace_variables(value)
-
-            # 自动设置Host头
-            try:
-                from urllib.parse import urlparse
-                parsed_url = urlparse(url)
-                if parsed_url.netloc:
-                    headers['Host'] = parsed_url.netloc
-            except:
-                pass
-
-            # 自动设置Content-Length（基于替换变量后的payload）
-            if payload and config.method.upper() in ['POST', 'PUT', 'PATCH']:
-                if auto_calculate_content_length or 'Content-Length' not in headers:
-                    headers['Content-Length'] = str(len(payload.encode('utf-8')))
-
-            # 自动设置Content-Length（只有在有payload时才设置）
-            if payload and config.method.upper() in ['POST', 'PUT', 'PATCH']:
-                headers['Content-Length'] = str(len(payload.encode('utf-8')))
+            # 使用预编译模板和环境变量快照替换变量
+            template = api_debug_templates.get(config)
+            url, headers, payload = template.render(env_snapshot.get(db))
+
+            # 等待响应期间归还数据库连接，避免大量并发探测占满连接池（config已加载的字段仍可访问）
+            db.close()
 
             try:
-                # 发送请求，确保正确处理UTF-8编码
-                if payload:
-                    # 将payload编码为UTF-8字节
-                    payload_bytes = payload.encode('utf-8')
-                    response = requests.request(
-                        method=config.method.upper(),
-                        url=url,
-                        headers=headers,
-                        data=payload_bytes,
-                        timeout=30
-                    )
-                else:
-                    response = requests.request(
-                        method=config.method.upper(),
-                        url=url,
-                        headers=headers,
-                        timeout=30
-                    )
+                # 通过共享连接池异步发送请求，payload按UTF-8编码
+                response = await api_debug_client.request(config.method, url, headers, payload)
 
                 end_time = get_current_time(db)
                 response_time = int((end_time - start_time).total_seconds() * 1000)
@@ -1051,8 +998,7 @@ class TaskScheduler:
                     response_body=response.text,
                     response_time=response_time,
                     status="success",
-                    start_time=start_time,
-                    end_time=end_time
+                    start_time=start_time
                 )
                 db.add(debug_log)
                 db.commit()
@@ -1098,9 +1044,9 @@ class TaskScheduler:
                                     response_content += "...(内容过长已截断)"
                                 message += f"响应内容: {response_content}"
 
-                                # 使用通知服务发送通知
-                                result = await notification_service.send_notification(notification_config, "接口调试定时执行通知", message)
-                                print(f"通知发送结果: {result}")
+                                # 写入通知发件箱，由后台异步投递
+                                outbox_id = notification_outbox.enqueue(config.notification_type, "接口调试定时执行通知", message, source=f"api_debug:{config.id}")
+                                print(f"通知已加入发件箱: {outbox_id}")
                             else:
                                 print(f"未找到激活的通知配置: '{config.notification_type}'")
                                 # 列出所有可用的通知配置
@@ -1124,8 +1070,7 @@ class TaskScheduler:
                     response_time=response_time,
                     error_message=str(e),
                     status="error",
-                    start_time=start_time,
-                    end_time=end_time
+                    start_time=start_time
                 )
                 db.add(debug_log)
                 db.commit()
@@ -1148,8 +1093,8 @@ class TaskScheduler:
                             message += f"错误信息: {str(e)}\n"
                             message += f"响应时间: {response_time}ms"
 
-                            # 使用通知服务发送通知
-                            await notification_service.send_notification(notification_config, "接口调试定时执行错误通知", message)
+                            # 写入通知发件箱，由后台异步投递
+                            notification_outbox.enqueue(config.notification_type, "接口调试定时执行错误通知", message, source=f"api_debug:{config.id}")
                     except Exception as e:
                         print(f"发送通知失败: {str(e)}")
 
@@ -1161,12 +1106,10 @@ class TaskScheduler:
     async def execute_subscription(self, subscription_id: int):
         """执行脚本订阅同步"""
         # 导入放在这里避免循环导入
-        from app.routers.subscriptions import execute_subscription_sync
+        from app.routers.subscriptions import subscription_sync_executor
 
-        try:
-            await execute_subscription_sync(subscription_id)
-        except Exception as e:
-            print(f"执行脚本订阅失败 {subscription_id}: {str(e)}")
+        # 在同步线程池中执行，不阻塞事件循环；同一订阅正在同步或远程无更新时跳过
+        await subscription_sync_executor.run(subscription_id, check_remote=True)
 
     def stop(self):
         """停止调度器"""
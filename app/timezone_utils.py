@@ -1,36 +1,96 @@
 """
 时区管理工具模块
 """
+import threading
 import pytz
 from datetime import datetime, timezone
-from typing import Optional
+from functools import lru_cache
+from typing import Callable, Optional
 from sqlalchemy.orm import Session
 
+DEFAULT_TIMEZONE = "Asia/Shanghai"
+
+@lru_cache(maxsize=64)
+def _resolve_timezone(timezone_name: str):
+    """解析时区名称为tzinfo对象（结果缓存，pytz.timezone本身开销较大）"""
+    return pytz.timezone(timezone_name)
+
+class TimezoneCache:
+    """系统时区缓存
+
+    系统时区保存在SystemConfig表中，但几乎不会变化。这里在内存中保存解析后的
+    tzinfo对象，只有在首次使用、set_system_timezone或数据库恢复后才重新读取。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._name: Optional[str] = None
+        self._tz = None
+
+    def get_name(self, db: Session) -> str:
+        """获取系统时区名称"""
+        if self._name is None:
+            self._load(db)
+        return self._name
+
+    def get_tz(self, db: Session):
+        """获取系统时区tzinfo对象"""
+        if self._tz is None:
+            self._load(db)
+        return self._tz
+
+    def set(self, timezone_name: str):
+        """更新缓存的时区"""
+        tz = _resolve_timezone(timezone_name)
+        with self._lock:
+            self._name = timezone_name
+            self._tz = tz
+
+    def invalidate(self):
+        """使缓存失效，下次使用时重新从数据库读取"""
+        with self._lock:
+            self._name = None
+            self._tz = None
+
+    def _load(self, db: Session):
+        """从数据库加载时区配置"""
+        from app.routers.settings import get_system_config
+        timezone_name = get_system_config(db, "system_timezone", DEFAULT_TIMEZONE)
+        try:
+            self.set(timezone_name)
+        except pytz.exceptions.UnknownTimeZoneError:
+            print(f"无效的系统时区配置: {timezone_name}，使用默认时区")
+            self.set(DEFAULT_TIMEZONE)
+
+# 全局时区缓存实例
+timezone_cache = TimezoneCache()
+
+def _get_tz(db: Session = None):
+    """获取时区对象，没有数据库连接时使用默认时区"""
+    if db is None:
+        return _resolve_timezone(DEFAULT_TIMEZONE)
+    return timezone_cache.get_tz(db)
+
 def get_system_timezone(db: Session) -> str:
     """获取系统配置的时区，默认为中国时区"""
-    from app.routers.settings import get_system_config
-    return get_system_config(db, "system_timezone", "Asia/Shanghai")
+    return timezone_cache.get_name(db)
 
 def set_system_timezone(db: Session, timezone_name: str):
     """设置系统时区"""
     from app.routers.settings import set_system_config
     # 验证时区是否有效
     try:
-        pytz.timezone(timezone_name)
+        _resolve_timezone(timezone_name)
         set_system_config(db, "system_timezone", timezone_name, "系统时区设置")
+        timezone_cache.set(timezone_name)
         return True
     except pytz.exceptions.UnknownTimeZoneError:
         return False
 
 def get_current_time(db: Session = None) -> datetime:
     """获取当前时区的当前时间"""
-    if db is None:
-        # 如果没有数据库连接，使用默认时区
-        tz = pytz.timezone("Asia/Shanghai")
-    else:
-        timezone_name = get_system_timezone(db)
-        tz = pytz.timezone(timezone_name)
-    
+    tz = _get_tz(db)
+
     # 获取UTC时间并转换为指定时区
     utc_now = datetime.now(timezone.utc)
     return utc_now.astimezone(tz)
@@ -40,12 +100,7 @@ def utc_to_local(utc_dt: datetime, db: Session = None) -> datetime:
     if utc_dt is None:
         return None
     
-    if db is None:
-        # 如果没有数据库连接，使用默认时区
-        tz = pytz.timezone("Asia/Shanghai")
-    else:
-        timezone_name = get_system_timezone(db)
-        tz = pytz.timezone(timezone_name)
+    tz = _get_tz(db)
     
     # 如果datetime对象没有时区信息，假设它是UTC时间
     if utc_dt.tzinfo is None:
@@ -59,12 +114,7 @@ def local_to_utc(local_dt: datetime, db: Session = None) -> datetime:
     if local_dt is None:
         return None
     
-    if db is None:
-        # 如果没有数据库连接，使用默认时区
-        tz = pytz.timezone("Asia/Shanghai")
-    else:
-        timezone_name = get_system_timezone(db)
-        tz = pytz.timezone(timezone_name)
+    tz = _get_tz(db)
     
     # 如果datetime对象没有时区信息，假设它是本地时区时间
     if local_dt.tzinfo is None:
@@ -73,18 +123,8 @@ def local_to_utc(local_dt: datetime, db: Session = None) -> datetime:
     # 转换为UTC时间
     return local_dt.astimezone(timezone.utc)
 
-def format_datetime(dt: datetime, db: Session = None, format_str: str = "%Y-%m-%d %H:%M:%S") -> str:
-    """格式化日期时间为本地时区字符串"""
-    if dt is None:
-        return ""
-
-    if db is None:
-        # 如果没有数据库连接，使用默认时区
-        tz = pytz.timezone("Asia/Shanghai")
-    else:
-        timezone_name = get_system_timezone(db)
-        tz = pytz.timezone(timezone_name)
-
+def _format_with_tz(dt: datetime, tz, tz_str: str, format_str: str) -> str:
+    """使用已解析的时区格式化日期时间"""
     # 判断输入时间的类型并进行相应处理
     if dt.tzinfo is None:
         # 无时区信息的情况：
@@ -97,7 +137,7 @@ def format_datetime(dt: datetime, db: Session = None, format_str: str = "%Y-%m-%
         local_dt = dt.astimezone(tz)
     else:
         # 已经有时区信息，检查是否已经是目标时区
-        if str(dt.tzinfo) == str(tz):
+        if str(dt.tzinfo) == tz_str:
             # 已经是目标时区，直接使用
             local_dt = dt
         else:
@@ -106,6 +146,26 @@ def format_datetime(dt: datetime, db: Session = None, format_str: str = "%Y-%m-%
 
     return local_dt.strftime(format_str)
 
+def format_datetime(dt: datetime, db: Session = None, format_str: str = "%Y-%m-%d %H:%M:%S") -> str:
+    """格式化日期时间为本地时区字符串"""
+    if dt is None:
+        return ""
+
+    tz = _get_tz(db)
+    return _format_with_tz(dt, tz, str(tz), format_str)
+
+def get_datetime_formatter(db: Session = None, format_str: str = "%Y-%m-%d %H:%M:%S") -> Callable[[Optional[datetime]], str]:
+    """获取绑定当前系统时区的格式化函数，用于列表接口批量格式化"""
+    tz = _get_tz(db)
+    tz_str = str(tz)
+
+    def formatter(dt: Optional[datetime]) -> str:
+        if dt is None:
+            return ""
+        return _format_with_tz(dt, tz, tz_str, format_str)
+
+    return formatter
+
 def get_available_timezones():
     """获取可用的时区列表"""
     # 常用时区列表
@@ -145,7 +205,7 @@ def get_available_timezones():
 def get_timezone_offset(timezone_name: str) -> str:
     """获取时区偏移量字符串"""
     try:
-        tz = pytz.timezone(timezone_name)
+        tz = _resolve_timezone(timezone_name)
         now = datetime.now(tz)
         offset = now.strftime('%z')
         # 格式化为 +08:00 形式
@@ -158,7 +218,7 @@ def get_timezone_offset(timezone_name: str) -> str:
 def validate_timezone(timezone_name: str) -> bool:
     """验证时区名称是否有效"""
     try:
-        pytz.timezone(timezone_name)
+        _resolve_timezone(timezone_name)
         return True
     except pytz.exceptions.UnknownTimeZoneError:
         return False
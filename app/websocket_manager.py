@@ -1,78 +1,319 @@
 """
 WebSocket连接管理器
 """
-from typing import Dict, List
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
 from fastapi import WebSocket
 import json
 import asyncio
 
+# 每个连接发送队列的最大帧数，超出后丢弃最旧的帧
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "1000"))
+# 单次发送超时时间（秒），超时视为连接已失效
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+# 任务实时输出的合并窗口（秒）和单帧最大行数
+TASK_OUTPUT_BATCH_INTERVAL = float(os.getenv("TASK_OUTPUT_BATCH_INTERVAL", "0.1"))
+TASK_OUTPUT_BATCH_MAX_LINES = int(os.getenv("TASK_OUTPUT_BATCH_MAX_LINES", "500"))
+
+
+class ConnectionWriter:
+    """单个WebSocket连接的发送队列和写入任务
+
+    广播只把编码好的帧放入队列，由每个连接独立的写入任务负责发送，
+    慢连接不会拖慢其他连接和消息生产者。队列已满时丢弃最旧的帧，
+    并在队列排空后向客户端发送一次 frames_dropped 提示。
+    """
+
+    def __init__(self, websocket: WebSocket, manager: "WebSocketManager", max_size: int = SEND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.manager = manager
+        self.max_size = max_size
+        # 队列元素: (入队时间, 帧文本)
+        self.queue: Deque[Tuple[float, str]] = deque()
+        self.event = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+        # 统计信息
+        self.sent_frames = 0
+        self.dropped_frames = 0
+        self.pending_dropped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0
+
+    def start(self):
+        """启动写入任务"""
+        self.task = asyncio.create_task(self._run())
+
+    def put(self, text: str):
+        """放入一帧，不会阻塞调用方"""
+        if self.closed:
+            return
+        if len(self.queue) >= self.max_size:
+            self.queue.popleft()
+            self.dropped_frames += 1
+            self.pending_dropped += 1
+        self.queue.append((time.monotonic(), text))
+        self.event.set()
+
+    async def put_wait(self, text: str):
+        """放入一帧，队列已满时等待（用于单个连接的历史回放等场景）"""
+        while not self.closed and len(self.queue) >= self.max_size:
+            await asyncio.sleep(0.01)
+        self.put(text)
+
+    async def _run(self):
+        """写入任务主循环"""
+        try:
+            while not self.closed:
+                if not self.queue:
+                    if self.pending_dropped:
+                        # 通知客户端有帧被丢弃
+                        notice = json.dumps({"type": "frames_dropped", "count": self.pending_dropped}, ensure_ascii=False)
+                        self.pending_dropped = 0
+                        await asyncio.wait_for(self.websocket.send_text(notice), SEND_TIMEOUT)
+                        continue
+                    self.event.clear()
+                    await self.event.wait()
+                    continue
+
+                enqueued_at, text = self.queue.popleft()
+                await asyncio.wait_for(self.websocket.send_text(text), SEND_TIMEOUT)
+
+                lag = time.monotonic() - enqueued_at
+                self.sent_frames += 1
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self.avg_lag = lag if self.sent_frames == 1 else self.avg_lag * 0.9 + lag * 0.1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"WebSocket发送失败，关闭连接写入任务: {e}")
+            self.manager._remove_connection(self.websocket)
+        finally:
+            self.closed = True
+            self.queue.clear()
+
+    def stop(self):
+        """停止写入任务"""
+        self.closed = True
+        self.event.set()
+        if self.task and not self.task.done() and self.task is not asyncio.current_task():
+            self.task.cancel()
+
+    def get_metrics(self) -> Dict:
+        """获取连接的发送统计"""
+        oldest_lag = time.monotonic() - self.queue[0][0] if self.queue else 0.0
+        return {
+            "queue_size": len(self.queue),
+            "queue_capacity": self.max_size,
+            "sent_frames": self.sent_frames,
+            "dropped_frames": self.dropped_frames,
+            "oldest_pending_ms": round(oldest_lag * 1000, 2),
+            "last_lag_ms": round(self.last_lag * 1000, 2),
+            "avg_lag_ms": round(self.avg_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2)
+        }
+
 
 class WebSocketManager:
     """WebSocket连接管理器"""
-    
+
     def __init__(self):
         # 存储活跃连接 {room_id: [websocket1, websocket2, ...]}
         self.active_connections: Dict[str, List[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, room_id: str):
-        """接受WebSocket连接"""
+        # 每个连接的写入器 {websocket: ConnectionWriter}
+        self.writers: Dict[WebSocket, ConnectionWriter] = {}
+        # 使用合并帧格式接收任务输出的连接
+        self.batch_output_connections = set()
+        # 连接订阅的主题 {websocket: {topic, ...}}，未订阅过的连接接收全部消息（兼容旧客户端）
+        self.connection_topics: Dict[WebSocket, Set[str]] = {}
+
+    async def connect(self, websocket: WebSocket, room_id: str, batch_output: bool = False):
+        """接受WebSocket连接
+
+        batch_output 为 True 时，该连接以 task_output_batch 合并帧接收任务输出，
+        否则保持原有的逐行 task_output 消息格式。
+        """
         await websocket.accept()
+        if batch_output:
+            self.batch_output_connections.add(websocket)
         if room_id not in self.active_connections:
             self.active_connections[room_id] = []
         self.active_connections[room_id].append(websocket)
+        if websocket not in self.writers:
+            writer = ConnectionWriter(websocket, self)
+            writer.start()
+            self.writers[websocket] = writer
         print(f"WebSocket连接已建立: {room_id}, 当前连接数: {len(self.active_connections[room_id])}")
-    
+
     def disconnect(self, websocket: WebSocket, room_id: str):
         """断开WebSocket连接"""
         if room_id in self.active_connections:
             if websocket in self.active_connections[room_id]:
                 self.active_connections[room_id].remove(websocket)
                 print(f"WebSocket连接已断开: {room_id}, 当前连接数: {len(self.active_connections[room_id])}")
-            
+
             # 如果房间没有连接了，删除房间
             if not self.active_connections[room_id]:
                 del self.active_connections[room_id]
-    
+
+        # 连接不在任何房间中时停止写入任务
+        if not any(websocket in connections for connections in self.active_connections.values()):
+            self.batch_output_connections.discard(websocket)
+            self.connection_topics.pop(websocket, None)
+            writer = self.writers.pop(websocket, None)
+            if writer:
+                writer.stop()
+
+    def _remove_connection(self, websocket: WebSocket):
+        """从所有房间移除连接（写入失败时调用）"""
+        for room_id in list(self.active_connections.keys()):
+            self.disconnect(websocket, room_id)
+        self.batch_output_connections.discard(websocket)
+        self.connection_topics.pop(websocket, None)
+        writer = self.writers.pop(websocket, None)
+        if writer:
+            writer.stop()
+
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """发送个人消息"""
         try:
-            await websocket.send_text(json.dumps(message, ensure_ascii=False))
+            message_text = json.dumps(message, ensure_ascii=False)
+            writer = self.writers.get(websocket)
+            if writer:
+                # 经过写入队列发送，保证与广播消息的顺序一致
+                await writer.put_wait(message_text)
+            else:
+                await websocket.send_text(message_text)
         except Exception as e:
             print(f"发送个人消息失败: {e}")
-    
+
     async def broadcast(self, message: dict, room_id: str = None):
-        """广播消息到指定房间或所有连接"""
+        """广播消息到指定房间或所有连接
+
+        消息只编码一次，然后放入各连接的发送队列，不等待实际发送完成。
+        """
         message_text = json.dumps(message, ensure_ascii=False)
-        
+
         if room_id:
             # 发送到指定房间
-            if room_id in self.active_connections:
-                disconnected = []
-                for connection in self.active_connections[room_id]:
-                    try:
-                        await connection.send_text(message_text)
-                    except Exception as e:
-                        print(f"发送消息到 {room_id} 失败: {e}")
-                        disconnected.append(connection)
-                
-                # 清理断开的连接
-                for connection in disconnected:
-                    self.disconnect(connection, room_id)
+            connections = self.active_connections.get(room_id, [])
         else:
-            # 广播到所有房间
-            for room_id, connections in self.active_connections.items():
-                disconnected = []
-                for connection in connections:
-                    try:
-                        await connection.send_text(message_text)
-                    except Exception as e:
-                        print(f"广播消息到 {room_id} 失败: {e}")
-                        disconnected.append(connection)
-                
-                # 清理断开的连接
-                for connection in disconnected:
-                    self.disconnect(connection, room_id)
-    
+            # 广播到所有房间（同一连接只发送一次）
+            connections = list(dict.fromkeys(
+                connection
+                for room_connections in self.active_connections.values()
+                for connection in room_connections
+            ))
+
+        for connection in connections:
+            writer = self.writers.get(connection)
+            if writer:
+                writer.put(message_text)
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        """订阅主题
+
+        主题格式：summary（任务开始/完成等摘要事件）、task:<任务ID>、debug:<调试ID>、
+        subscriptions、subscription:<订阅ID>、packages，也可以使用 task:* 这类通配。
+        """
+        subscribed = self.connection_topics.setdefault(websocket, set())
+        subscribed.update(str(topic) for topic in topics if topic)
+        return sorted(subscribed)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        """取消订阅主题"""
+        subscribed = self.connection_topics.setdefault(websocket, set())
+        subscribed.difference_update(str(topic) for topic in topics)
+        return sorted(subscribed)
+
+    def is_subscribed(self, websocket: WebSocket, topics: Iterable[str]) -> bool:
+        """判断连接是否订阅了任一主题"""
+        subscribed = self.connection_topics.get(websocket)
+        if subscribed is None:
+            # 未发送过订阅请求的连接接收全部消息
+            return True
+        for topic in topics:
+            if topic in subscribed:
+                return True
+            prefix = topic.split(":", 1)[0]
+            if prefix != topic and f"{prefix}:*" in subscribed:
+                return True
+        return False
+
+    async def publish(self, message: dict, topics: List[str], room_id: str = "global"):
+        """按主题发布消息，只发送给订阅了相关主题的连接"""
+        message_text = None
+        for connection in self.active_connections.get(room_id, []):
+            if not self.is_subscribed(connection, topics):
+                continue
+            writer = self.writers.get(connection)
+            if writer:
+                if message_text is None:
+                    message_text = json.dumps(message, ensure_ascii=False)
+                writer.put(message_text)
+
+    @staticmethod
+    def build_task_output_messages(task_id: int, log_id: int, lines: List[Tuple[int, str, str]]) -> List[dict]:
+        """构建逐行格式的任务输出消息（兼容旧客户端）"""
+        return [
+            {
+                "type": "task_output",
+                "task_id": task_id,
+                "log_id": log_id,
+                "output_line": line,
+                "output_type": output_type
+            }
+            for _, output_type, line in lines
+        ]
+
+    @staticmethod
+    def build_task_output_batch(task_id: int, log_id: int, lines: List[Tuple[int, str, str]], history: bool = False) -> dict:
+        """构建合并格式的任务输出消息，lines 为 (序号, 输出类型, 内容) 列表"""
+        return {
+            "type": "task_output_batch",
+            "task_id": task_id,
+            "log_id": log_id,
+            "history": history,
+            "first_seq": lines[0][0] if lines else None,
+            "last_seq": lines[-1][0] if lines else None,
+            "lines": [
+                {"seq": seq, "output_type": output_type, "output_line": line}
+                for seq, output_type, line in lines
+            ]
+        }
+
+    async def send_task_output(self, task_id: int, log_id: int, lines: List[Tuple[int, str, str]]):
+        """发送一批任务实时输出
+
+        合并帧连接收到一条 task_output_batch 消息，其他连接仍逐行收到 task_output 消息。
+        两种格式都只在有对应连接时编码一次。
+        """
+        if not lines:
+            return
+
+        batch_text = None
+        line_texts = None
+        for connection in self.active_connections.get(f"task_{task_id}", []):
+            writer = self.writers.get(connection)
+            if not writer:
+                continue
+            if connection in self.batch_output_connections:
+                if batch_text is None:
+                    batch_text = json.dumps(self.build_task_output_batch(task_id, log_id, lines), ensure_ascii=False)
+                writer.put(batch_text)
+            else:
+                if line_texts is None:
+                    line_texts = [
+                        json.dumps(message, ensure_ascii=False)
+                        for message in self.build_task_output_messages(task_id, log_id, lines)
+                    ]
+                for text in line_texts:
+                    writer.put(text)
+
     def get_connection_count(self, room_id: str = None) -> int:
         """获取连接数"""
         if room_id:
@@ -80,6 +321,27 @@ class WebSocketManager:
         else:
             return sum(len(connections) for connections in self.active_connections.values())
 
+    def get_metrics(self) -> Dict:
+        """获取发送队列统计信息"""
+        rooms = {}
+        for room_id, connections in self.active_connections.items():
+            rooms[room_id] = [
+                self.writers[connection].get_metrics()
+                for connection in connections
+                if connection in self.writers
+            ]
+
+        all_metrics = [writer.get_metrics() for writer in self.writers.values()]
+        return {
+            "connections": len(self.writers),
+            "total_queued": sum(m["queue_size"] for m in all_metrics),
+            "total_sent": sum(m["sent_frames"] for m in all_metrics),
+            "total_dropped": sum(m["dropped_frames"] for m in all_metrics),
+            "max_pending_ms": max((m["oldest_pending_ms"] for m in all_metrics), default=0),
+            "max_lag_ms": max((m["max_lag_ms"] for m in all_metrics), default=0),
+            "rooms": rooms
+        }
+
     async def send_debug_output(self, debug_id: str, message: dict):
         """发送脚本调试输出"""
         debug_message = {
@@ -87,8 +349,8 @@ class WebSocketManager:
             "debug_id": debug_id,
             "data": message
         }
-        # 发送到全局房间，前端可以根据debug_id过滤
-        await self.broadcast(debug_message, "global")
+        # 只发送给订阅了该调试会话的连接
+        await self.publish(debug_message, [f"debug:{debug_id}"])
 
 
 # 全局WebSocket管理器实例
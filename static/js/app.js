@@ -40,6 +40,7 @@ function app() {
         showEnvModal: false,
         showPackageModal: false,
         showPackageInstallModal: false,
+        showBatchPackageModal: false,
         showChangeUsernameModal: false,
         showAgreementModal: false,
         showTermsModal: false,
@@ -56,6 +57,7 @@ function app() {
         showSubscriptionModal: false,
         editingSubscription: null,
         syncingSubscriptions: new Set(), // 正在同步的订阅ID集合
+        subscriptionSyncProgress: {}, // 订阅同步进度消息，按订阅ID索引
         subscriptionForm: {
             name: '',
             description: '',
@@ -70,7 +72,8 @@ function app() {
             cron_expression: '0 0 * * *',
             notification_enabled: false,
             notification_type: '',
-            auto_create_tasks: false
+            auto_create_tasks: false,
+            task_cron_template: ''
         },
         subscriptionLogs: [],
         subscriptionLogsLoading: false,
@@ -99,7 +102,9 @@ function app() {
             notification_enabled: false,
             notification_condition: 'always',
             cron_expression: '',
-            is_active: false
+            is_active: false,
+            monitor_enabled: false,
+            monitor_interval: 30
         },
         quickDebugForm: {
             method: 'GET',
@@ -171,6 +176,10 @@ function app() {
             package_name: '',
             version: ''
         },
+        batchPackageForm: {
+            python_packages: '',
+            nodejs_packages: ''
+        },
         usernameForm: {
             new_username: '',
             password: ''
@@ -320,6 +329,7 @@ function app() {
         logsLoading: false,
         envVarsLoading: false,
         packagesLoading: false,
+        packagesRefreshing: false,
         systemInfoLoading: false,
         dashboardLoading: false,
 
@@ -676,6 +686,12 @@ function app() {
                 setTimeout(() => {
                     if (this.ws && this.ws.readyState === WebSocket.OPEN) {
                         this.ws.send('ping');
+                        // 只订阅需要的主题：任务摘要、订阅同步、包管理，以及当前调试会话
+                        const topics = ['summary', 'subscriptions', 'packages'];
+                        if (this.debugMode.debugId) {
+                            topics.push(`debug:${this.debugMode.debugId}`);
+                        }
+                        this.wsSubscribe(topics);
                     }
                 }, 100);
             };
@@ -715,6 +731,20 @@ function app() {
             };
         },
         
+        // 订阅WebSocket主题
+        wsSubscribe(topics) {
+            if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+                this.ws.send(JSON.stringify({ action: 'subscribe', topics }));
+            }
+        },
+
+        // 取消订阅WebSocket主题
+        wsUnsubscribe(topics) {
+            if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+                this.ws.send(JSON.stringify({ action: 'unsubscribe', topics }));
+            }
+        },
+
         // 断开WebSocket
         disconnectWebSocket() {
             if (this.ws) {
@@ -728,7 +758,10 @@ function app() {
         handleWebSocketMessage(data) {
             // 生成消息唯一ID，防止重复处理
             let messageId;
-            if (data.type.startsWith('package_')) {
+            if (data.type.startsWith('package_batch_')) {
+                // 批量安装消息带有批次ID和服务端递增序号，内容相同的输出行也不会被误判为重复
+                messageId = `${data.type}_${data.batch_id}_${data.seq}`;
+            } else if (data.type.startsWith('package_')) {
                 // 包管理消息使用包名、类型和时间戳生成ID
                 const timestamp = Date.now();
                 const packageInfo = `${data.package_type || 'unknown'}_${data.package_name || 'unknown'}`;
@@ -741,8 +774,11 @@ function app() {
                     messageId = `${data.type}_${packageInfo}_${timestamp}`;
                 }
             } else if (data.type.startsWith('subscription_sync_')) {
-                // 订阅同步消息使用订阅ID和类型生成ID
+                // 订阅同步消息使用订阅ID和类型生成ID，进度消息附加内容哈希
                 messageId = `${data.type}_${data.subscription_id}_${data.log_id || Date.now()}`;
+                if (data.type === 'subscription_sync_progress') {
+                    messageId += `_${this.simpleHash(`${data.stage}|${data.message || ''}`)}`;
+                }
             } else if (data.type === 'debug_output') {
                 // 调试输出消息使用debug_id、内容和时间戳生成更精确的ID
                 const debugData = data.data || {};
@@ -908,6 +944,35 @@ function app() {
                         this.showToast(`包 ${data.package_name} 卸载失败`, 'error');
                     }
                     break;
+                case 'package_batch_start':
+                    // 批量安装开始
+                    this.packageInstallStatus = 'installing';
+                    this.packageOperationType = 'install';
+                    this.packageInstallLogs = [];
+                    this.packageInstallInfo = {
+                        type: data.groups.map(group => `${group.package_type} (${group.manager})`).join(' + '),
+                        name: `批量安装 ${data.groups.reduce((total, group) => total + group.count, 0)} 个包`,
+                        version: ''
+                    };
+                    this.showPackageInstallModal = true;
+                    data.groups.forEach(group => {
+                        this.addPackageInstallLog(`[${group.package_type}] 开始批量安装 ${group.count} 个包`);
+                    });
+                    break;
+                case 'package_batch_output':
+                    // 批量安装输出，按包类型加前缀区分并行的安装进程
+                    this.addPackageInstallLog(`[${data.package_type}] ${data.output}`);
+                    break;
+                case 'package_batch_complete':
+                    // 单个包类型安装完成
+                    this.addPackageInstallLog(`[${data.package_type}] ${data.success ? '✓ 安装成功' : '✗ 安装失败'}`);
+                    break;
+                case 'package_batch_finish':
+                    // 批量安装全部结束
+                    this.packageInstallStatus = data.success ? 'success' : 'failed';
+                    this.showToast(data.success ? '批量安装成功' : '批量安装存在失败，请查看日志', data.success ? 'success' : 'error');
+                    this.loadPackages();
+                    break;
                 case 'subscription_sync_start':
                     // 订阅同步开始
                     if (data.subscription_id) {
@@ -915,10 +980,22 @@ function app() {
                         console.log(`订阅 ${data.subscription_name} 开始同步`);
                     }
                     break;
+                case 'subscription_sync_progress':
+                    // 订阅同步进度
+                    if (data.subscription_id) {
+                        this.syncingSubscriptions.add(data.subscription_id);
+                        this.subscriptionSyncProgress = {
+                            ...this.subscriptionSyncProgress,
+                            [data.subscription_id]: data.message
+                        };
+                    }
+                    break;
                 case 'subscription_sync_complete':
                     // 订阅同步完成
                     if (data.subscription_id) {
                         this.syncingSubscriptions.delete(data.subscription_id);
+                        const { [data.subscription_id]: _, ...remainingProgress } = this.subscriptionSyncProgress;
+                        this.subscriptionSyncProgress = remainingProgress;
 
                         if (data.status === 'success') {
                             this.showToast(`订阅 "${data.subscription_name}" 同步完成`, 'success');
@@ -2091,7 +2168,8 @@ function app() {
 
             // 创建WebSocket连接
             const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-            const wsUrl = `${protocol}//${window.location.host}/api/logs/ws/${taskId}`;
+            // batch=1：服务端将短时间内的多行输出合并为一帧推送
+            const wsUrl = `${protocol}//${window.location.host}/api/logs/ws/${taskId}?batch=1`;
             this.taskLogWs = new WebSocket(wsUrl);
 
             this.taskLogWs.onopen = () => {
@@ -2122,26 +2200,14 @@ function app() {
 
                         case 'task_output':
                             if (data.task_id === taskId && this.taskLogData) {
-                                if (data.output_type === 'stdout') {
-                                    // 如果是第一行输出且当前有等待提示文本，清空后添加
-                                    if (!this.hasReceivedFirstOutput && this.taskLogData.output === '任务正在运行中，等待输出...') {
-                                        this.taskLogData.output = data.output_line + '\n';
-                                        this.hasReceivedFirstOutput = true;
-                                    } else {
-                                        // 直接添加输出行和换行符
-                                        this.taskLogData.output += data.output_line + '\n';
-                                    }
-                                } else if (data.output_type === 'stderr') {
-                                    this.taskLogData.error_output += data.output_line + '\n';
-                                }
-
-                                // 自动滚动到底部
-                                this.$nextTick(() => {
-                                    const outputElement = document.querySelector('.task-log-output');
-                                    if (outputElement) {
-                                        outputElement.scrollTop = outputElement.scrollHeight;
-                                    }
-                                });
+                                this.appendTaskLogLines([data]);
+                            }
+                            break;
+
+                        case 'task_output_batch':
+                            // 合并帧：一次追加多行输出
+                            if (data.task_id === taskId && this.taskLogData) {
+                                this.appendTaskLogLines(data.lines || []);
                             }
                             break;
 
@@ -2192,6 +2258,41 @@ function app() {
             };
         },
 
+        // 追加任务实时输出行（lines中每项包含output_line和output_type）
+        appendTaskLogLines(lines) {
+            let stdoutText = '';
+            let stderrText = '';
+            for (const item of lines) {
+                if (item.output_type === 'stdout') {
+                    stdoutText += item.output_line + '\n';
+                } else if (item.output_type === 'stderr') {
+                    stderrText += item.output_line + '\n';
+                }
+            }
+
+            if (stdoutText) {
+                // 如果是第一行输出且当前有等待提示文本，清空后添加
+                if (!this.hasReceivedFirstOutput && this.taskLogData.output === '任务正在运行中，等待输出...') {
+                    this.taskLogData.output = stdoutText;
+                    this.hasReceivedFirstOutput = true;
+                } else {
+                    // 直接添加输出行和换行符
+                    this.taskLogData.output += stdoutText;
+                }
+            }
+            if (stderrText) {
+                this.taskLogData.error_output += stderrText;
+            }
+
+            // 自动滚动到底部
+            this.$nextTick(() => {
+                const outputElement = document.querySelector('.task-log-output');
+                if (outputElement) {
+                    outputElement.scrollTop = outputElement.scrollHeight;
+                }
+            });
+        },
+
         // 停止任务日志WebSocket连接
         stopTaskLogWebSocket() {
             if (this.taskLogWs) {
@@ -2690,7 +2791,12 @@ function app() {
                 }
 
                 const data = await response.json();
+                if (this.debugMode.debugId) {
+                    this.wsUnsubscribe([`debug:${this.debugMode.debugId}`]);
+                }
                 this.debugMode.debugId = data.debug_id;
+                // 订阅本次调试会话的输出（服务端会补发订阅前已产生的输出）
+                this.wsSubscribe([`debug:${data.debug_id}`]);
                 this.showToast('脚本开始执行', 'success');
             } catch (error) {
                 console.error('运行脚本失败:', error);
@@ -2708,6 +2814,11 @@ function app() {
                 }
             }
 
+            // 取消订阅调试输出
+            if (this.debugMode.debugId) {
+                this.wsUnsubscribe([`debug:${this.debugMode.debugId}`]);
+            }
+
             // 销毁CodeMirror实例
             this.destroyCodeEditor();
 
@@ -3432,6 +3543,72 @@ function app() {
             }
         },
 
+        async installPackagesBatch() {
+            const splitLines = (text) => text.split('\n').map(line => line.trim()).filter(line => line && !line.startsWith('#'));
+            const pythonPackages = splitLines(this.batchPackageForm.python_packages);
+            const nodejsPackages = splitLines(this.batchPackageForm.nodejs_packages);
+            if (pythonPackages.length === 0 && nodejsPackages.length === 0) {
+                this.showToast('请至少填写一个包', 'error');
+                return;
+            }
+
+            try {
+                this.showBatchPackageModal = false;
+                await this.startBatchInstall({
+                    python_packages: pythonPackages,
+                    nodejs_packages: nodejsPackages
+                });
+                this.batchPackageForm = {
+                    python_packages: '',
+                    nodejs_packages: ''
+                };
+            } catch (error) {
+                console.error('批量安装失败:', error);
+            }
+        },
+
+        // 安装订阅requirements.txt中的全部依赖
+        async installRequirementsFile(requirementsFile) {
+            try {
+                this.showRequirementsModal = false;
+                await this.startBatchInstall({ requirement_files: [requirementsFile] });
+            } catch (error) {
+                console.error('安装依赖失败:', error);
+            }
+        },
+
+        async startBatchInstall(payload) {
+            this.packageInstallStatus = 'installing';
+            this.packageOperationType = 'install';
+            this.packageInstallLogs = [];
+            this.packageInstallInfo = { type: '批量', name: '批量安装', version: '' };
+            this.showPackageInstallModal = true;
+            try {
+                await this.apiRequest('/api/packages/batch-install', {
+                    method: 'POST',
+                    body: JSON.stringify(payload)
+                });
+            } catch (error) {
+                this.packageInstallStatus = 'failed';
+                this.addPackageInstallLog('✗ 批量安装请求失败: ' + error.message);
+                throw error;
+            }
+        },
+
+        // 重新收集服务器上的已安装包清单
+        async refreshPackages() {
+            this.packagesRefreshing = true;
+            try {
+                await this.apiRequest('/api/packages/refresh', { method: 'POST' });
+                await this.loadPackages();
+            } catch (error) {
+                console.error('刷新包列表失败:', error);
+                this.showToast('刷新包列表失败: ' + error.message, 'error');
+            } finally {
+                this.packagesRefreshing = false;
+            }
+        },
+
         // 过滤包列表
         filterPackages() {
             const query = this.packageSearchQuery.toLowerCase().trim();
@@ -4534,7 +4711,9 @@ function app() {
                 notification_enabled: false,
                 notification_condition: 'always',
                 cron_expression: '',
-                is_active: false
+                is_active: false,
+                monitor_enabled: false,
+                monitor_interval: 30
             };
         },
 
@@ -4726,7 +4905,9 @@ function app() {
                 notification_enabled: config.notification_enabled || false,
                 notification_condition: config.notification_condition || 'always',
                 cron_expression: config.cron_expression || '',
-                is_active: config.is_active || false
+                is_active: config.is_active || false,
+                monitor_enabled: config.monitor_enabled || false,
+                monitor_interval: config.monitor_interval || 30
             };
             this.showDebugConfigModal = true;
         },
@@ -4900,7 +5081,9 @@ function app() {
                 notification_enabled: this.quickDebugForm.notification_enabled || false,
                 notification_condition: this.quickDebugForm.notification_condition || 'always',
                 cron_expression: '',
-                is_active: false
+                is_active: false,
+                monitor_enabled: false,
+                monitor_interval: 30
             };
 
             // 清空编辑状态并打开模态框
@@ -4978,7 +5161,8 @@ function app() {
                     cron_expression: subscription.cron_expression,
                     notification_enabled: subscription.notification_enabled,
                     notification_type: subscription.notification_type || '',
-                    auto_create_tasks: subscription.auto_create_tasks || false
+                    auto_create_tasks: subscription.auto_create_tasks || false,
+                    task_cron_template: subscription.task_cron_template || ''
                 };
             } else {
                 this.subscriptionForm = {
@@ -4995,7 +5179,8 @@ function app() {
                     cron_expression: '0 0 * * *',
                     notification_enabled: false,
                     notification_type: '',
-                    auto_create_tasks: false
+                    auto_create_tasks: false,
+                    task_cron_template: ''
                 };
             }
             this.showSubscriptionModal = true;
@@ -5045,7 +5230,8 @@ function app() {
                 const formData = {
                     ...this.subscriptionForm,
                     file_extensions: fileExtensions,
-                    exclude_patterns: excludePatterns
+                    exclude_patterns: excludePatterns,
+                    task_cron_template: (this.subscriptionForm.task_cron_template || '').trim() || null
                 };
 
                 const url = this.editingSubscription
@@ -5114,7 +5300,8 @@ function app() {
                 });
 
                 if (response.ok) {
-                    this.showToast(`订阅 "${subscription.name}" 同步已开始`, 'success');
+                    const result = await response.json();
+                    this.showToast(`订阅 "${subscription.name}" ${result.message}`, 'success');
                     // WebSocket会处理同步完成的消息
                 } else {
                     this.syncingSubscriptions.delete(subscription.id);